@@ -0,0 +1,228 @@
+"""
+Benchmark the intent engines and the feature extractors offline.
+
+Every component is fitted on a synthetic dataset, with synthetic word
+vectors, and measured:
+
+- fit_seconds and fit_peak_bytes, the time and the peak traced memory of fit.
+- single_p50_ms and single_p99_ms, the latency of predicting one text.
+- batch_ms and batch_texts_per_second, predicting a batch of texts.
+- accuracy, of the intent engines on new texts.
+
+The results are written as json, and compared with a previous run:
+
+usage, from the root of the repository:
+    PYTHONPATH=. python benchmarks/suite.py --output results.json
+    PYTHONPATH=. python benchmarks/suite.py --compare results.json
+"""
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+from functools import partial
+
+import numpy as np
+from nltk.corpus import stopwords
+
+from synthetic import SyntheticData
+
+from peque_nlu.feature_extractors import GloveFeatureExtractor, NaiveFeatureExtractor
+from peque_nlu.intent_engines import (
+    LogisticIntentEngine,
+    SGDIntentEngine,
+    WorldVectorIntentEngine,
+)
+
+LANGUAGE = "english"
+THRESHOLD = 0.2
+
+
+def get_components(keyed_vectors) -> dict:
+    """
+    Get the functions that build every component to benchmark.
+
+    :param keyed_vectors: The synthetic word vectors.
+    :type keyed_vectors: KeyedVectors.
+    :return: The component builders, by name.
+    :rtype: dict.
+    """
+    return {
+        "logistic_engine": lambda: LogisticIntentEngine(LANGUAGE),
+        "sgd_engine": lambda: SGDIntentEngine(LANGUAGE),
+        "world_vector_engine": lambda: WorldVectorIntentEngine(LANGUAGE, keyed_vectors),
+        "naive_extractor": NaiveFeatureExtractor,
+        "glove_extractor": lambda: GloveFeatureExtractor(keyed_vectors),
+    }
+
+
+def measure(function, repeat=1) -> tuple:
+    """
+    Measure the best time of a function, and the result of the last call.
+
+    :return: The seconds and the result.
+    :rtype: tuple.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def get_functions(component, data, dataset_path) -> tuple:
+    """
+    Get the fit and predict functions of a component, the feature
+    extractors predict every text of the batch.
+
+    :return: The fit and predict functions.
+    :rtype: tuple.
+    """
+    if not hasattr(component, "get_features"):
+        examples, intents = data.get_examples()
+        return lambda: component.fit(examples, intents), component.predict
+
+    def predict(batch):
+        return [component.get_features(text, THRESHOLD) for text in batch]
+
+    return lambda: component.fit(dataset_path, stopwords.words(LANGUAGE)), predict
+
+
+def run_component(component, data, dataset_path, texts, intents, args) -> dict:
+    """
+    Fit a component and measure it.
+
+    :return: The results.
+    :rtype: dict.
+    """
+    fit, predict = get_functions(component, data, dataset_path)
+    fit_seconds, _ = measure(fit, args.repeat)
+
+    tracemalloc.start()
+    fit()
+    _, fit_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Warm up the lazy indexes and caches out of the measures
+    predict(texts[:1])
+
+    single = [measure(partial(predict, [text]))[0] for text in texts[: args.single]]
+
+    batch = texts[: args.batch_size]
+    batch_seconds, predicted = measure(lambda: predict(batch), args.repeat)
+
+    result = {
+        "fit_seconds": fit_seconds,
+        "fit_peak_bytes": fit_peak,
+        "single_p50_ms": 1000 * float(np.percentile(single, 50)),
+        "single_p99_ms": 1000 * float(np.percentile(single, 99)),
+        "batch_ms": 1000 * batch_seconds,
+        "batch_texts_per_second": len(batch) / batch_seconds,
+    }
+    if not hasattr(component, "get_features"):
+        hits = np.array(predicted[0]) == np.array(intents[: len(batch)])
+        result["accuracy"] = float(np.mean(hits))
+
+    if hasattr(component, "close"):
+        component.close()
+    return result
+
+
+def compare(results, baseline):
+    """
+    Print the ratio of every metric to a previous run.
+
+    :param results: The results of this run.
+    :type results: dict.
+    :param baseline: The results of the previous run.
+    :type baseline: dict.
+    """
+    print(f"{'component':>20} {'metric':>24} {'baseline':>12} {'now':>12} {'ratio':>7}")
+    for name, metrics in results["results"].items():
+        previous = baseline["results"].get(name, {})
+        for metric, value in metrics.items():
+            if metric not in previous:
+                continue
+            ratio = value / previous[metric] if previous[metric] else float("nan")
+            print(
+                f"{name:>20} {metric:>24} {previous[metric]:>12.4g} "
+                f"{value:>12.4g} {ratio:>7.2f}"
+            )
+
+
+def main():
+    """
+    Run the benchmarks, write the results and compare them.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--intents", type=int, default=10)
+    parser.add_argument("--examples-per-intent", type=int, default=50)
+    parser.add_argument("--vocabulary", type=int, default=2000)
+    parser.add_argument("--entities", type=int, default=5)
+    parser.add_argument("--vector-size", type=int, default=25)
+    parser.add_argument("--single", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--only", nargs="+", help="The components to run.")
+    parser.add_argument("--output", help="The json file to write the results.")
+    parser.add_argument("--compare", help="A json file of a previous run.")
+    args = parser.parse_args()
+
+    data = SyntheticData(
+        n_intents=args.intents,
+        examples_per_intent=args.examples_per_intent,
+        vocabulary_size=args.vocabulary,
+        n_entities=args.entities,
+        seed=args.seed,
+    )
+    keyed_vectors = data.get_keyed_vectors(args.vector_size)
+    texts, intents = data.get_texts(max(args.single, args.batch_size))
+
+    components = get_components(keyed_vectors)
+    names = args.only or list(components)
+
+    results = {
+        "config": {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ("only", "output", "compare")
+        },
+        "platform": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "results": {},
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        dataset_path = os.path.join(directory, "dataset.json")
+        data.write(dataset_path)
+
+        for name in names:
+            result = run_component(
+                components[name](), data, dataset_path, texts, intents, args
+            )
+            results["results"][name] = result
+            print(
+                f"{name:>20}: fit {result['fit_seconds']:.3f}s, "
+                f"single p50 {result['single_p50_ms']:.3f}ms, "
+                f"batch {result['batch_texts_per_second']:.0f} texts/s",
+                flush=True,
+            )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            compare(results, json.load(file))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Synthetic datasets and word vectors, so the benchmarks run offline.
+
+The words of every intent and entity are grouped around their own random
+center in the vector space, so the word vector engines and extractors find
+the same structure as in the texts.
+"""
+import json
+import random
+import string
+
+import numpy as np
+from gensim.models.keyedvectors import KeyedVectors
+
+
+def get_words(n_words, generator) -> list:
+    """
+    Get unique random words of lowercase letters.
+
+    :param n_words: The number of words.
+    :type n_words: int.
+    :param generator: The random generator.
+    :type generator: random.Random.
+    :return: The words.
+    :rtype: list.
+    """
+    words = set()
+    while len(words) < n_words:
+        length = generator.randint(4, 9)
+        words.add(
+            "".join(generator.choice(string.ascii_lowercase) for _ in range(length))
+        )
+    return sorted(words)
+
+
+class SyntheticData:
+    """
+    A synthetic dataset, with the words of every intent and entity.
+    """
+
+    def __init__(
+        self,
+        n_intents=10,
+        examples_per_intent=50,
+        vocabulary_size=2000,
+        n_entities=5,
+        words_per_example=8,
+        seed=42,
+    ):
+        """
+        Generate the dataset.
+
+        :param n_intents: The number of intents.
+        :type n_intents: int.
+        :param examples_per_intent: The number of examples of every intent.
+        :type examples_per_intent: int.
+        :param vocabulary_size: The number of words, a fifth of them are
+            shared by all the intents.
+        :type vocabulary_size: int.
+        :param n_entities: The number of entities.
+        :type n_entities: int.
+        :param words_per_example: The number of words of every example.
+        :type words_per_example: int.
+        :param seed: The random seed.
+        :type seed: int.
+        """
+        self.generator = random.Random(seed)
+        self.seed = seed
+        self.words_per_example = words_per_example
+
+        words = get_words(vocabulary_size, self.generator)
+        self.generator.shuffle(words)
+        n_shared = vocabulary_size // 5
+        self.shared_words = words[:n_shared]
+
+        groups = n_intents + n_entities
+        group_size = (vocabulary_size - n_shared) // groups
+        self.groups = [
+            words[n_shared + i * group_size : n_shared + (i + 1) * group_size]
+            for i in range(groups)
+        ]
+        self.intent_words = {f"intent_{i}": self.groups[i] for i in range(n_intents)}
+        self.entities = {
+            f"entity_{i}": self.groups[n_intents + i][: max(1, group_size // 4)]
+            for i in range(n_entities)
+        }
+
+        self.intents = {
+            intent: [self.get_text(intent) for _ in range(examples_per_intent)]
+            for intent in self.intent_words
+        }
+
+    def get_text(self, intent) -> str:
+        """
+        Get a random text of an intent, with its words, shared words
+        and sometimes an entity word.
+
+        :param intent: The intent.
+        :type intent: str.
+        :return: The text.
+        :rtype: str.
+        """
+        n_intent_words = max(1, self.words_per_example // 2)
+        words = self.generator.sample(self.intent_words[intent], n_intent_words)
+        words += self.generator.sample(
+            self.shared_words, self.words_per_example - n_intent_words
+        )
+        if self.entities and self.generator.random() < 0.5:
+            entity_words = self.generator.choice(list(self.entities.values()))
+            words[-1] = self.generator.choice(entity_words)
+        self.generator.shuffle(words)
+        return " ".join(words)
+
+    def get_texts(self, n_texts) -> tuple:
+        """
+        Get random texts to predict and their intents.
+
+        :param n_texts: The number of texts.
+        :type n_texts: int.
+        :return: The texts and the intents.
+        :rtype: tuple.
+        """
+        intents = [self.generator.choice(list(self.intents)) for _ in range(n_texts)]
+        return [self.get_text(intent) for intent in intents], intents
+
+    def get_examples(self) -> tuple:
+        """
+        Get the examples to fit and their intents.
+
+        :return: The texts and the intents.
+        :rtype: tuple.
+        """
+        texts = [text for examples in self.intents.values() for text in examples]
+        intents = [
+            intent for intent, examples in self.intents.items() for _ in examples
+        ]
+        return texts, intents
+
+    def write(self, path):
+        """
+        Write the dataset in the json format of the classifiers.
+
+        :param path: The path of the json file.
+        :type path: str.
+        """
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({"intents": self.intents, "entities": self.entities}, file)
+
+    def get_keyed_vectors(self, vector_size=25, spread=0.5) -> KeyedVectors:
+        """
+        Get in memory word vectors of all the words, every intent and entity
+        has its words around a random center.
+
+        :param vector_size: The size of the vectors.
+        :type vector_size: int.
+        :param spread: The distance of the words to their center.
+        :type spread: float.
+        :return: The word vectors.
+        :rtype: KeyedVectors.
+        """
+        generator = np.random.default_rng(self.seed)
+        words = list(self.shared_words)
+        vectors = [generator.normal(size=(len(words), vector_size))]
+
+        for group in self.groups:
+            center = generator.normal(size=vector_size)
+            noise = generator.normal(scale=spread, size=(len(group), vector_size))
+            words.extend(group)
+            vectors.append(center + noise)
+
+        keyed_vectors = KeyedVectors(vector_size)
+        keyed_vectors.add_vectors(words, np.concatenate(vectors).astype(np.float32))
+        return keyed_vectors
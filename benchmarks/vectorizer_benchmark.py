@@ -0,0 +1,154 @@
+"""
+Compare the memory and accuracy of the count and hashing vectorizers.
+
+The corpus is synthetic and noisy like user generated text, every example
+has the words of its intent, shared words and typos, so the vocabulary
+keeps growing with the corpus.
+
+usage, from the root of the repository:
+    PYTHONPATH=. python benchmarks/vectorizer_benchmark.py --examples 5000 20000
+        --n-features 16384
+"""
+import argparse
+import pickle
+import random
+import string
+import time
+import tracemalloc
+
+import numpy as np
+
+from peque_nlu.intent_engines import LogisticIntentEngine, SGDIntentEngine
+
+ENGINES = {"sgd": SGDIntentEngine, "logistic": LogisticIntentEngine}
+
+
+def get_word(generator) -> str:
+    """
+    Get a random word.
+    """
+    return "".join(generator.choice(string.ascii_lowercase) for _ in range(7))
+
+
+def get_typo(generator, word) -> str:
+    """
+    Change a random letter of the word.
+    """
+    position = generator.randrange(len(word))
+    letter = generator.choice(string.ascii_lowercase)
+    return word[:position] + letter + word[position + 1 :]
+
+
+def get_corpus(n_examples, n_intents=20, typo_rate=0.2, seed=42) -> tuple:
+    """
+    Get a synthetic corpus, with the words of every intent, shared words
+    and typos.
+
+    :return: The texts and the intents.
+    :rtype: tuple.
+    """
+    generator = random.Random(seed)
+    intent_words = [[get_word(generator) for _ in range(50)] for _ in range(n_intents)]
+    shared_words = [get_word(generator) for _ in range(500)]
+
+    texts = []
+    intents = []
+    for _ in range(n_examples):
+        intent = generator.randrange(n_intents)
+        words = generator.sample(intent_words[intent], 3)
+        words += generator.sample(shared_words, 5)
+        words = [
+            get_typo(generator, word) if generator.random() < typo_rate else word
+            for word in words
+        ]
+        generator.shuffle(words)
+        texts.append(" ".join(words))
+        intents.append(f"intent_{intent}")
+    return texts, intents
+
+
+def run(engine_name, vectorizer, n_examples, n_features, alternate_sign) -> dict:
+    """
+    Fit an engine and measure its memory and accuracy.
+
+    :return: The results.
+    :rtype: dict.
+    """
+    texts, intents = get_corpus(n_examples + 2000)
+    train_texts, train_intents = texts[2000:], intents[2000:]
+
+    intent_engine = ENGINES[engine_name](
+        "english",
+        tokenizer="fast",
+        vectorizer=vectorizer,
+        n_features=n_features,
+        alternate_sign=alternate_sign,
+    )
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    intent_engine.fit(train_texts, train_intents)
+    fit_seconds = time.perf_counter() - start
+    _, fit_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # The replay buffer is not part of the vectorizer comparison
+    intent_engine.replay = None
+    predicted, _ = intent_engine.predict(texts[:2000])
+
+    return {
+        "engine": engine_name,
+        "vectorizer": vectorizer,
+        "examples": n_examples,
+        "vocabulary": len(getattr(intent_engine.vectorizer, "vocabulary_", ())),
+        "pickle_bytes": len(pickle.dumps(intent_engine)),
+        "fit_peak_bytes": fit_peak,
+        "fit_seconds": fit_seconds,
+        "accuracy": float(np.mean(np.array(predicted) == np.array(intents[:2000]))),
+    }
+
+
+def main():
+    """
+    Run the benchmark and print a table of the results.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--examples", type=int, nargs="+", default=[5000, 20000])
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES))
+    parser.add_argument(
+        "--n-features", type=int, nargs="+", default=[2**12, 2**14, 2**16]
+    )
+    parser.add_argument("--alternate-sign", action="store_true")
+    args = parser.parse_args()
+
+    header = (
+        f"{'engine':>9} {'vectorizer':>10} {'examples':>8} {'vocabulary':>10} "
+        f"{'pickle MB':>9} {'fit peak MB':>11} {'fit s':>6} {'accuracy':>8}"
+    )
+    print(header)
+    for engine_name in args.engines:
+        for n_examples in args.examples:
+            options = [("count", None)]
+            options += [("hashing", n_features) for n_features in args.n_features]
+            for vectorizer, n_features in options:
+                result = run(
+                    engine_name,
+                    vectorizer,
+                    n_examples,
+                    n_features or 2**14,
+                    args.alternate_sign,
+                )
+                if n_features:
+                    result["vectorizer"] = f"hash 2^{n_features.bit_length() - 1}"
+                print(
+                    f"{result['engine']:>9} {result['vectorizer']:>10} "
+                    f"{result['examples']:>8} {result['vocabulary']:>10} "
+                    f"{result['pickle_bytes'] / 2**20:>9.2f} "
+                    f"{result['fit_peak_bytes'] / 2**20:>11.2f} "
+                    f"{result['fit_seconds']:>6.2f} {result['accuracy']:>8.3f}",
+                    flush=True,
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,8 @@
 This module contains the abstract class for feature extractors.
 """
 import re
-import unicodedata
 from abc import ABC, abstractmethod
-from peque_nlu.utils import IntentUtils
+from peque_nlu.utils import IntentUtils, strip_accents
 
 
 class FeatureExtractor(ABC, IntentUtils):
@@ -26,15 +25,7 @@ class FeatureExtractor(ABC, IntentUtils):
 
         example: _strip_accents("àéêöhello") -> "aeeohello"
         """
-        try:
-            text = unicode(text, "utf-8")
-        except NameError:  # unicode is a default on python 3
-            pass
-
-        text = (
-            unicodedata.normalize("NFD", text).encode("ascii", "ignore").decode("utf-8")
-        )
-        return str(text)
+        return strip_accents(text)
 
     def preprocess_input(self, text_to_decode) -> list:
         """
@@ -46,10 +37,19 @@ class FeatureExtractor(ABC, IntentUtils):
         :rtype: list.
 
         example: preprocess_input("àéêöhello") -> ["hello"]
+
+        If the text is a NormalizedText its words are reused.
         """
 
-        text_to_decode = self._strip_accents(text_to_decode)
-        text_to_decode = text_to_decode.lower()
+        words = getattr(text_to_decode, "words", None)
+        if words is not None:
+            return list(words)
+
+        folded = getattr(text_to_decode, "folded", None)
+        if folded is not None:
+            text_to_decode = folded
+        else:
+            text_to_decode = self._strip_accents(text_to_decode).lower()
         text_to_decode = re.sub(r"[^a-zA-Z\s]+", "", text_to_decode)
         text_to_decode = [
             word for word in text_to_decode.split() if word not in self.stopwords
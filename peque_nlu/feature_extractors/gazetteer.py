@@ -0,0 +1,94 @@
+"""
+The Gazetteer class module.
+"""
+from collections import deque
+
+
+class Gazetteer:
+    """
+    The Gazetteer class.
+
+    This class is an Aho-Corasick automaton, it finds every occurrence
+    of a set of patterns in a text in a single pass over the text.
+    """
+
+    def __init__(self):
+        """
+        Initialize the Gazetteer.
+        """
+
+        self.patterns = []
+        self.transitions = [{}]
+        self.fail = [0]
+        self.outputs = [[]]
+
+    def add(self, pattern) -> int:
+        """
+        Add a pattern to the automaton.
+
+        :param pattern: The pattern to add.
+        :type pattern: str.
+        :return: The pattern id.
+        :rtype: int.
+        """
+
+        state = 0
+        for char in pattern:
+            next_state = self.transitions[state].get(char)
+            if next_state is None:
+                next_state = len(self.transitions)
+                self.transitions[state][char] = next_state
+                self.transitions.append({})
+                self.fail.append(0)
+                self.outputs.append([])
+            state = next_state
+
+        for pattern_id in self.outputs[state]:
+            if self.patterns[pattern_id] == pattern:
+                return pattern_id
+
+        pattern_id = len(self.patterns)
+        self.patterns.append(pattern)
+        self.outputs[state].append(pattern_id)
+        return pattern_id
+
+    def build(self):
+        """
+        Build the failure links, must be called after adding the patterns.
+        """
+
+        queue = deque(self.transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.transitions[state].items():
+                queue.append(next_state)
+
+                fail = self.fail[state]
+                while fail and char not in self.transitions[fail]:
+                    fail = self.fail[fail]
+                fail = self.transitions[fail].get(char, 0)
+
+                self.fail[next_state] = fail
+                self.outputs[next_state] = self.outputs[next_state] + self.outputs[fail]
+
+    def search(self, text):
+        """
+        Search the patterns in the text.
+
+        :param text: The text to search.
+        :type text: str.
+        :return: A generator of (end, pattern_id) tuples,
+            end is the position of the last char of the match.
+        :rtype: generator.
+
+        example: search("python") with the pattern "pyth" -> [(3, 0)]
+        """
+
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in self.transitions[state]:
+                state = self.fail[state]
+            state = self.transitions[state].get(char, 0)
+
+            for pattern_id in self.outputs[state]:
+                yield position, pattern_id
@@ -1,9 +1,19 @@
 """
 The GloveFeatureExtractor class module.
 """
-from peque_nlu.utils import glove_load
+from copy import copy as shallow_copy
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from peque_nlu.utils import LazyModule, WordVectors
 from peque_nlu.feature_extractors import FeatureExtractor
 
+if TYPE_CHECKING:
+    from gensim.models.keyedvectors import KeyedVectors
+
+matutils = LazyModule("gensim.matutils")
+
 
 class GloveFeatureExtractor(FeatureExtractor):
     """
@@ -12,8 +22,24 @@ class GloveFeatureExtractor(FeatureExtractor):
     This class is used to create a glove feature extractor.
     This works by checking using the glove vectors, to check if there are
     similarities between the input text and the examples.
+
+    The entity examples are indexed once in `fit` as a single matrix, so every
+    query word is scored against all the entities with one matrix multiply.
+
+    The glove vectors are shared with the other components that use the same
+    model, through the `word_vectors` handle.
+
+    With `quantize` the glove vectors are stored as float16 or int8, and only
+    the vectors of the input words are converted back.
     """
 
+    entity_names = None
+    entity_columns = None
+    entity_examples = None
+    entity_matrix = None
+    entity_offsets = None
+    entity_thresholds = None
+
     def __init__(self, gensim_model=None):
         """
         Initialize the GloveFeatureExtractor.
@@ -26,7 +52,34 @@ class GloveFeatureExtractor(FeatureExtractor):
         self.entities = {}
         self.stopwords = None
 
-        self.glove_vectors = glove_load(gensim_model)
+        self.word_vectors = WordVectors(gensim_model)
+
+    @property
+    def glove_vectors(self) -> "KeyedVectors":
+        """
+        The shared glove vectors of the word vectors handle.
+
+        :return: The glove vectors.
+        :rtype: KeyedVectors.
+        """
+
+        return self.word_vectors.vectors
+
+    def __setstate__(self, state):
+        """
+        Set the pickled state, the glove vectors of a pickle saved before the
+        `word_vectors` handle are moved to a handle and indexed again.
+
+        :param state: The state.
+        :type state: dict.
+        """
+
+        state = dict(state)
+        glove_vectors = state.pop("glove_vectors", None)
+        self.__dict__.update(state)
+        if glove_vectors is not None:
+            self.word_vectors = WordVectors(glove_vectors)
+            self._build_index()
 
     def _check_examples(self, examples) -> list:
         """
@@ -38,10 +91,7 @@ class GloveFeatureExtractor(FeatureExtractor):
         :rtype: list.
         """
 
-        for word in examples:
-            if not self._word_is_in_glove(word):
-                examples.remove(word)
-        return examples
+        return [word for word in examples if self._word_is_in_glove(word)]
 
     def _word_is_in_glove(self, word) -> bool:
         """
@@ -54,6 +104,113 @@ class GloveFeatureExtractor(FeatureExtractor):
         """
         return word in self.glove_vectors.key_to_index
 
+    def _build_index(self):
+        """
+        Build the entity examples index.
+
+        Each entity gets a contiguous block of rows in `entity_matrix`,
+        starting at its offset in `entity_offsets`. The block is scaled as
+        `KeyedVectors.similarity` does with a list of examples, so the scores
+        are the same as comparing the examples one entity at a time.
+        """
+
+        self.entity_names = []
+        self.entity_columns = {}
+        self.entity_examples = {}
+        self.entity_offsets = []
+
+        blocks = []
+        offset = 0
+        for entity, examples in self.entities.items():
+            self.entity_examples[entity] = set(examples)
+
+            examples = self._check_examples(examples)
+            if not examples:
+                continue
+
+            self.entity_columns[entity] = len(self.entity_names)
+            self.entity_names.append(entity)
+            self.entity_offsets.append(offset)
+            blocks.append(matutils.unitvec(self.glove_vectors[examples]))
+            offset += len(examples)
+
+        if blocks:
+            self.entity_matrix = np.vstack(blocks)
+        else:
+            self.entity_matrix = np.zeros(
+                (0, self.glove_vectors.vector_size), dtype=np.float32
+            )
+        self.entity_offsets = np.array(self.entity_offsets, dtype=np.intp)
+        self.entity_thresholds = np.full(len(self.entity_names), 0.5)
+
+    def _get_thresholds(self, threshold) -> np.ndarray:
+        """
+        Get the threshold of every indexed entity.
+
+        :param threshold: The threshold to apply.
+        :type threshold: float or dict.
+        :return: The threshold of every entity in `entity_names`.
+        :rtype: np.ndarray.
+        """
+
+        if isinstance(threshold, dict):
+            thresholds = self.entity_thresholds.copy()
+            for entity, value in threshold.items():
+                column = self.entity_columns.get(entity)
+                if column is not None:
+                    thresholds[column] = value
+            return thresholds
+
+        if isinstance(threshold, float):
+            return np.full(len(self.entity_names), threshold)
+
+        raise ValueError(
+            f"The threshold must be a float or a dict, not {type(threshold)}"
+        )
+
+    def _score_words(self, words) -> np.ndarray:
+        """
+        Get the best similarity of every word against every entity.
+
+        :param words: The words to score, they must be in the glove vectors.
+        :type words: list.
+        :return: A (words, entities) matrix with the maximum similarities.
+        :rtype: np.ndarray.
+        """
+
+        query = np.vstack([matutils.unitvec(self.glove_vectors[w]) for w in words])
+        scores = query @ self.entity_matrix.T
+        return np.maximum.reduceat(scores, self.entity_offsets, axis=1)
+
+    def fit(self, dataset_path, stopwords=None):
+        """
+        Fit the feature extractor and build the entity examples index.
+
+        :param dataset_path: The path of the dataset.
+        :type dataset_path: str.
+        :param stopwords: The stopwords to remove from the input.
+        :type stopwords: list.
+        """
+
+        super().fit(dataset_path, stopwords)
+        self._build_index()
+
+    def quantize(self, dtype="int8") -> "GloveFeatureExtractor":
+        """
+        Get a copy of the feature extractor with quantized glove vectors,
+        its index is built again from them.
+
+        :param dtype: The reduced precision, "float16" or "int8".
+        :type dtype: str.
+        :return: The quantized feature extractor.
+        :rtype: GloveFeatureExtractor.
+        """
+
+        quantized = shallow_copy(self)
+        quantized.word_vectors = self.word_vectors.quantize(dtype)
+        quantized._build_index()  # pylint: disable=protected-access
+        return quantized
+
     def get_features(self, text_to_decode, threshold):
         """
         Fit the feature extractor.
@@ -73,35 +230,35 @@ class GloveFeatureExtractor(FeatureExtractor):
 
         """
 
+        if self.entity_matrix is None:
+            self._build_index()
+
         text_to_decode = self.preprocess_input(text_to_decode)
 
+        glove_words = [w for w in text_to_decode if self._word_is_in_glove(w)]
+        similarities = {}
+        if glove_words and self.entity_names:
+            scores = self._score_words(glove_words)
+            similarities = dict(zip(glove_words, scores))
+
+        thresholds = None
         matches = []
         for word in text_to_decode:
-            for entity, examples in self.entities.items():
+            scores = similarities.get(word)
+            for entity, examples in self.entity_examples.items():
                 if word in examples:
                     matches.append({"word": word, "entity": entity, "similarities": 1})
                     continue
 
-                if not self._word_is_in_glove(word):
+                column = self.entity_columns.get(entity)
+                if scores is None or column is None:
                     continue
 
-                examples = self._check_examples(examples)
-                similarities = self.glove_vectors.similarity(examples, word)
-
-                similarity = max(similarities)
-
-                temp_threshold = None
-                if isinstance(threshold, dict):
-                    temp_threshold = threshold.get(entity, 0.5)
-                elif isinstance(threshold, float):
-                    temp_threshold = threshold
-                else:
-                    raise ValueError(
-                        "The threshold must be a float or a dict, "
-                        f"not {type(threshold)}"
-                    )
+                if thresholds is None:
+                    thresholds = self._get_thresholds(threshold)
 
-                if similarity > temp_threshold:
+                similarity = scores[column]
+                if similarity > thresholds[column]:
                     matches.append(
                         {"word": word, "entity": entity, "similarities": similarity}
                     )
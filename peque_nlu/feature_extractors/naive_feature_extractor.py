@@ -1,7 +1,10 @@
 """
 The naive feature extractor module.
 """
+from collections import Counter
+
 from peque_nlu.feature_extractors import FeatureExtractor
+from peque_nlu.feature_extractors.gazetteer import Gazetteer
 
 
 class NaiveFeatureExtractor(FeatureExtractor):
@@ -10,8 +13,103 @@ class NaiveFeatureExtractor(FeatureExtractor):
 
     This class is used to create a naive feature extractor.
     This works by checking if the examples are in the input text.
+
+    The examples are compiled in `fit` into a Gazetteer, so every input
+    text is matched against all the examples in a single pass.
+    Single word examples match any word that contains them, multi word
+    examples match the same sequence of whole words.
     """
 
+    gazetteer = None
+    entity_names = None
+    pattern_entities = None
+
+    def _normalize_example(self, example) -> str:
+        """
+        Normalize an example like `preprocess_input` does with the input text.
+
+        :param example: The example to normalize.
+        :type example: str.
+        :return: The normalized example.
+        :rtype: str.
+
+        example: _normalize_example("Visual  Studio") -> "visual studio"
+        """
+
+        words = self._strip_accents(example).lower().split()
+        if len(words) > 1 and self.stopwords:
+            words = [word for word in words if word not in self.stopwords]
+        return " ".join(words)
+
+    def _build_gazetteer(self):
+        """
+        Build the gazetteer with the examples of every entity.
+        """
+
+        self.gazetteer = Gazetteer()
+        self.entity_names = list(self.entities)
+
+        pattern_counts = []
+        for position, examples in enumerate(self.entities.values()):
+            for example in examples:
+                example = self._normalize_example(example)
+                if not example:
+                    continue
+
+                pattern_id = self.gazetteer.add(example)
+                if pattern_id == len(pattern_counts):
+                    pattern_counts.append(Counter())
+                pattern_counts[pattern_id][position] += 1
+
+        self.gazetteer.build()
+        self.pattern_entities = [sorted(counts.items()) for counts in pattern_counts]
+
+    def _get_matches(self, words) -> tuple:
+        """
+        Get the patterns found in every word and every word span.
+
+        :param words: The preprocessed words.
+        :type words: list.
+        :return: The pattern ids found inside every word and
+            the (pattern id, last word) spans starting at every word.
+        :rtype: tuple.
+        """
+
+        text = " ".join(words)
+        word_of = []
+        for index, word in enumerate(words):
+            word_of.extend([index] * (len(word) + 1))
+
+        word_matches = [set() for _ in words]
+        span_matches = [[] for _ in words]
+        for end, pattern_id in self.gazetteer.search(text):
+            pattern = self.gazetteer.patterns[pattern_id]
+            if " " not in pattern:
+                word_matches[word_of[end]].add(pattern_id)
+                continue
+
+            start = end - len(pattern) + 1
+            if start > 0 and text[start - 1] != " ":
+                continue
+            if end + 1 < len(text) and text[end + 1] != " ":
+                continue
+            span_matches[word_of[start]].append((pattern_id, word_of[end]))
+
+        return word_matches, span_matches
+
+    def fit(self, dataset_path, stopwords=None):
+        """
+        Fit the feature extractor and build the gazetteer.
+
+        :param dataset_path: The path of the dataset.
+        :type dataset_path: str.
+        :param stopwords: The stopwords to remove from the input.
+        :type stopwords: list.
+        """
+
+        super().fit(dataset_path, stopwords)
+        self._build_gazetteer()
+
     def get_features(self, text_to_decode, threshold):
         """
         Get the features from the input text.
@@ -26,14 +124,33 @@ class NaiveFeatureExtractor(FeatureExtractor):
         example: get_features("hello", 0.5) ->
             [{"word": "hello", "entity": "greet", "similarities": 1}]
         """
+
+        if self.gazetteer is None:
+            self._build_gazetteer()
+
         text_to_decode = self.preprocess_input(text_to_decode)
+        word_matches, span_matches = self._get_matches(text_to_decode)
 
         matches = []
-        for word in text_to_decode:
-            for entity, examples in self.entities.items():
-                for example in examples:
-                    example = example.lower()
-                    if example not in word:
-                        continue
-                    matches.append({"word": word, "entity": entity, "similarities": 1})
+        for index, word in enumerate(text_to_decode):
+            counts = Counter()
+            for pattern_id in word_matches[index]:
+                for position, count in self.pattern_entities[pattern_id]:
+                    counts[position] += count
+
+            for position in sorted(counts):
+                entity = self.entity_names[position]
+                matches.extend(
+                    {"word": word, "entity": entity, "similarities": 1}
+                    for _ in range(counts[position])
+                )
+
+            for pattern_id, last in sorted(span_matches[index], key=lambda x: -x[1]):
+                span = " ".join(text_to_decode[index : last + 1])
+                for position, count in self.pattern_entities[pattern_id]:
+                    entity = self.entity_names[position]
+                    matches.extend(
+                        {"word": span, "entity": entity, "similarities": 1}
+                        for _ in range(count)
+                    )
         return matches
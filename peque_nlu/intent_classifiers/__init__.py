@@ -5,3 +5,6 @@ from peque_nlu.intent_classifiers.intent_classifier import IntentClassifier
 from peque_nlu.intent_classifiers.model_intent_classifier import (
     ModelIntentClassifier,
 )
+from peque_nlu.intent_classifiers.async_intent_classifier import (
+    AsyncIntentClassifier,
+)
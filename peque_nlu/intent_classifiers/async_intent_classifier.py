@@ -0,0 +1,152 @@
+"""
+The async intent classifier module.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+
+class AsyncIntentClassifier:
+    """
+    The AsyncIntentClassifier class.
+
+    This class wraps an intent classifier for asyncio applications.
+
+    The concurrent `apredict` calls are collected for up to `window` seconds
+    or `max_batch_size` texts and predicted as one `multiple_predict` in a
+    worker thread, so the event loop is never blocked and the overhead of
+    every predict is paid once per batch. A text waits at most `window`
+    seconds before its batch starts.
+
+    The batches and the `aupdate` calls run one at a time in the worker
+    thread, so the predictions never run while updating.
+    """
+
+    batches = 0
+    window = 0.005
+    max_batch_size = 64
+
+    def __init__(self, classifier, window=0.005, max_batch_size=64, executor=None):
+        """
+        Initialize the AsyncIntentClassifier.
+
+        :param classifier: The fitted intent classifier.
+        :type classifier: IntentClassifier.
+
+        :param window: The seconds to wait for more texts to predict.
+        :type window: float.
+
+        :param max_batch_size: The number of texts that starts a batch
+            before the window ends.
+        :type max_batch_size: int.
+
+        :param executor: The executor to predict, by default a single thread.
+        :type executor: Executor.
+        """
+
+        self.classifier = classifier
+        self.window = window
+        self.max_batch_size = max_batch_size
+
+        self.owns_executor = executor is None
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=1)
+        self.executor = executor
+
+        # The pending texts and their timer, by threshold
+        self.pending = {}
+        self.timers = {}
+
+    async def apredict(self, text, threshold=0.2) -> dict:
+        """
+        Predict the intent of a text, in a batch with the concurrent calls.
+
+        :param text: The text to predict.
+        :type text: str.
+        :param threshold: The threshold to apply.
+        :type threshold: float or dict.
+
+        :return: The prediction.
+        :rtype: dict.
+        """
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        if isinstance(threshold, dict):
+            key = tuple(sorted(threshold.items()))
+        else:
+            key = threshold
+
+        if key not in self.pending:
+            self.pending[key] = (threshold, [])
+            self.timers[key] = loop.call_later(self.window, self._flush, key)
+
+        requests = self.pending[key][1]
+        requests.append((text, future))
+        if len(requests) >= self.max_batch_size:
+            self._flush(key)
+
+        return await future
+
+    async def aupdate(self, texts, intents):
+        """
+        Update the intent classifier with new examples, between the batches.
+
+        :param texts: The new examples.
+        :type texts: list.
+        :param intents: The intents of the new examples.
+        :type intents: list.
+        """
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            self.executor, self.classifier.update, texts, intents
+        )
+
+    def _flush(self, key):
+        """
+        Start the batch of the pending texts of a threshold.
+
+        :param key: The key of the threshold.
+        :type key: float or tuple.
+        """
+
+        self.timers.pop(key).cancel()
+        threshold, requests = self.pending.pop(key)
+        self.batches += 1
+
+        texts = [text for text, _ in requests]
+        batch = asyncio.get_running_loop().run_in_executor(
+            self.executor, self.classifier.multiple_predict, texts, threshold
+        )
+        batch.add_done_callback(partial(self._resolve, requests))
+
+    @staticmethod
+    def _resolve(requests, batch):
+        """
+        Give every caller its prediction, or the error of the batch.
+
+        :param requests: The texts and the futures of the callers.
+        :type requests: list.
+        :param batch: The finished batch.
+        :type batch: asyncio.Future.
+        """
+
+        error = batch.exception()
+        for position, (_, future) in enumerate(requests):
+            # The caller can be cancelled while the batch runs
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(batch.result()[position])
+
+    def close(self):
+        """
+        Stop the worker thread, if it was started by this class.
+        """
+
+        if self.owns_executor:
+            self.executor.shutdown()
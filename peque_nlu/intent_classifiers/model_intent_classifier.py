@@ -1,10 +1,19 @@
 """
 The model intent classifier module.
 """
+from copy import copy as shallow_copy
+
 from peque_nlu.intent_classifiers import IntentClassifier
-from peque_nlu.utils import IntentUtils
+from peque_nlu.metrics import INSTRUMENTATION
+from peque_nlu.utils import (
+    IntentUtils,
+    LRUCache,
+    NormalizedText,
+    iter_batches,
+    strip_accents,
+)
 
-from peque_nlu.intent_engines import LogisticIntentEngine
+from peque_nlu.intent_engines import CompiledIntentEngine, LogisticIntentEngine
 
 
 class ModelIntentClassifier(IntentClassifier, IntentUtils):
@@ -12,10 +21,21 @@ class ModelIntentClassifier(IntentClassifier, IntentUtils):
     The ModelIntentClassifier class.
 
     This class is used to create a model intent classifier.
+
+    The predictions can be cached by normalized text and threshold, the cache
+    is bounded, evicts the least recently used ones and is cleared on fit.
     """
 
+    prediction_cache = None
+
     def __init__(
-        self, language, intent_engine=None, feature_extractor=None, saver=None
+        self,
+        language,
+        intent_engine=None,
+        feature_extractor=None,
+        saver=None,
+        cache_size=0,
+        cache_ttl=None,
     ):
         """
         Initialize the ModelIntentClassifier.
@@ -32,6 +52,12 @@ class ModelIntentClassifier(IntentClassifier, IntentUtils):
         :param saver: The saver to use.
         :type saver: Saver.
 
+        :param cache_size: The number of predictions to cache, 0 to disable.
+        :type cache_size: int.
+
+        :param cache_ttl: The seconds a prediction is cached, None for ever.
+        :type cache_ttl: float.
+
         """
 
         if intent_engine is None:
@@ -46,6 +72,9 @@ class ModelIntentClassifier(IntentClassifier, IntentUtils):
 
         self.saver = saver
 
+        if cache_size:
+            self.prediction_cache = LRUCache(cache_size, cache_ttl)
+
     def save(self, path):
         """
         Save the model.
@@ -74,28 +103,143 @@ class ModelIntentClassifier(IntentClassifier, IntentUtils):
 
         return saver.load(path)
 
-    def fit(self, dataset_path):
+    def fit(self, dataset_path, batch_size=None, **stream_options):
         """
         Fit the intent classifier.
 
+        The examples are streamed from the dataset, json or jsonl,
+        without loading the whole file.
+
         :param dataset_path: The path to the dataset.
         :type dataset_path: str.
+        :param batch_size: Train out of core with batches of this size,
+            the intent engine must have `fit_stream`.
+        :type batch_size: int.
+        :param stream_options: The options of `fit_stream`, like n_passes.
+        :type stream_options: dict.
         """
 
-        self.dataset, self.categories = self.load_dataset(dataset_path)
-
-        if self.dataset is None:
-            raise ValueError("You must load the dataset first")
-
-        text = self.dataset["text"]
-        intent = self.dataset["intent"]
+        if batch_size is not None and not hasattr(self.intent_engine, "fit_stream"):
+            raise ValueError("The intent engine can not be trained out of core")
 
         if self.feature_extractor is not None:
             self.feature_extractor.fit(dataset_path, self.intent_engine.stopwords)
 
-        self.intent_engine.fit(text, intent)
+        if batch_size is not None:
+            self.categories = self.intent_engine.fit_stream(
+                lambda: iter_batches(self.iter_dataset(dataset_path), batch_size),
+                **stream_options,
+            )
+        else:
+            text = []
+            intent = []
+            categories = {}
+            for text_item, intent_item in self.iter_dataset(dataset_path):
+                text.append(text_item)
+                intent.append(intent_item)
+                categories.setdefault(intent_item, None)
+
+            if not text:
+                raise ValueError("The dataset has no examples")
+            self.categories = list(categories)
+            self.intent_engine.fit(text, intent)
+
+        if self.prediction_cache is not None:
+            self.prediction_cache.clear()
+
+    def update(self, texts, intents):
+        """
+        Update the intent classifier with new examples, that can have new
+        intents, without fitting it again on the whole dataset.
+
+        The predictions should not run while updating.
+
+        :param texts: The new examples.
+        :type texts: list.
+        :param intents: The intents of the new examples.
+        :type intents: list.
+        """
+
+        texts = list(texts)
+        intents = list(intents)
+        if len(texts) != len(intents):
+            raise ValueError("There must be an intent for every text")
+        if not texts:
+            return
+
+        self.intent_engine.update(texts, intents)
+        for intent in intents:
+            if intent not in self.categories:
+                self.categories.append(intent)
+
+        if self.prediction_cache is not None:
+            self.prediction_cache.clear()
+
+    def _copy(self, intent_engine, feature_extractor) -> "ModelIntentClassifier":
+        """
+        Get a copy of the intent classifier with other components,
+        and its own categories and predictions cache.
+
+        :param intent_engine: The intent engine of the copy.
+        :type intent_engine: IntentEngine.
+        :param feature_extractor: The feature extractor of the copy.
+        :type feature_extractor: FeatureExtractor.
+        :return: The copy.
+        :rtype: ModelIntentClassifier.
+        """
+
+        copy = shallow_copy(self)
+        copy.intent_engine = intent_engine
+        copy.feature_extractor = feature_extractor
+        copy.categories = list(self.categories)
+        if self.prediction_cache is not None:
+            copy.prediction_cache = LRUCache(
+                self.prediction_cache.maxsize, self.prediction_cache.ttl
+            )
+        return copy
+
+    def export(self) -> "ModelIntentClassifier":
+        """
+        Get a copy of the intent classifier, with the intent engine compiled
+        to a CompiledIntentEngine that predicts without sklearn.
+
+        :return: The exported intent classifier.
+        :rtype: ModelIntentClassifier.
+        """
+
+        return self._copy(
+            CompiledIntentEngine(self.intent_engine), self.feature_extractor
+        )
+
+    def quantize(self, dtype="int8") -> "ModelIntentClassifier":
+        """
+        Get a copy of the intent classifier with reduced precision weights
+        and word vectors. The sklearn intent engines are exported first,
+        the components without `quantize` are kept as they are.
+
+        :param dtype: The reduced precision, "float16" or "int8".
+        :type dtype: str.
+        :return: The quantized intent classifier.
+        :rtype: ModelIntentClassifier.
+
+        example: quantize("int8").multiple_predict(["hello"])
+        """
+
+        intent_engine = self.intent_engine
+        if hasattr(intent_engine, "_get_kernel") and not hasattr(
+            intent_engine, "quantize"
+        ):
+            intent_engine = CompiledIntentEngine(intent_engine)
+        if hasattr(intent_engine, "quantize"):
+            intent_engine = intent_engine.quantize(dtype)
+
+        feature_extractor = self.feature_extractor
+        if hasattr(feature_extractor, "quantize"):
+            feature_extractor = feature_extractor.quantize(dtype)
+
+        return self._copy(intent_engine, feature_extractor)
 
-    def multiple_predict(self, texts, threshold=0.2):
+    def multiple_predict(self, texts, threshold=0.2, top_k=None):
         """
         Predict the intent of multiple texts.
 
@@ -103,6 +247,8 @@ class ModelIntentClassifier(IntentClassifier, IntentUtils):
         :type texts: list.
         :param threshold: The threshold to apply.
         :type threshold: float or dict.
+        :param top_k: Also return the k best intents of every text.
+        :type top_k: int.
 
         :return: The predictions.
         :rtype: dict.
@@ -120,23 +266,187 @@ class ModelIntentClassifier(IntentClassifier, IntentUtils):
                                     {"word": "are", "entity": "greet", "similarities": 1},
                                     {"word": "you", "entity": "greet", "similarities": 1}]}]
 
+        With top_k the best intents are ranked in "intents":
+        example: multiple_predict(["hello"], top_k=2) ->
+            [{"text": "hello", "intent": "greet", "probability": 0.9,
+                        "intents": [{"intent": "greet", "probability": 0.9},
+                                    {"intent": "bye", "probability": 0.1}]}]
+
         """
-        intents, probabilities = self.intent_engine.predict(texts)
-        results = []
-        for intent, probability, text in zip(intents, probabilities, texts):
-            results.append({"text": text, "intent": intent, "probability": probability})
+        start = INSTRUMENTATION.start()
+        results = self._cached_multiple_predict(texts, threshold, top_k)
+        INSTRUMENTATION.stop("classifier.multiple_predict", start, len(texts))
+        return results
+
+    def _cached_multiple_predict(self, texts, threshold, top_k=None) -> list:
+        """
+        Predict the intent of multiple texts, with the predictions cache.
+
+        :param texts: The texts to predict.
+        :type texts: list.
+        :param threshold: The threshold to apply.
+        :type threshold: float or dict.
+        :param top_k: The number of ranked intents, None to leave them out.
+        :type top_k: int.
 
-        if self.feature_extractor is None:
+        :return: The predictions.
+        :rtype: list.
+        """
+
+        if self.prediction_cache is None:
+            return self._multiple_predict(texts, threshold, top_k)
+
+        if isinstance(threshold, dict):
+            threshold_key = tuple(sorted(threshold.items()))
+        else:
+            threshold_key = threshold
+
+        keys = [
+            (" ".join(text.lower().split()), threshold_key, top_k) for text in texts
+        ]
+
+        results = []
+        misses = []
+        for index, (text, key) in enumerate(zip(texts, keys)):
+            cached = self.prediction_cache.get(key)
+            if cached is None:
+                misses.append(index)
+            results.append(self._copy_result(cached, text))
+
+        if not misses:
             return results
 
-        for result in results:
-            result["features"] = self.feature_extractor.get_features(
-                result["text"], threshold
-            )
+        predictions = self._multiple_predict(
+            [texts[i] for i in misses], threshold, top_k
+        )
+        for index, prediction in zip(misses, predictions):
+            results[index] = prediction
+            self.prediction_cache.put(keys[index], self._copy_result(prediction))
+
+        return results
+
+    def _copy_result(self, result, text=None) -> dict:
+        """
+        Copy a prediction result, so the cached ones are never modified.
+
+        :param result: The result to copy.
+        :type result: dict.
+        :param text: The text of the copy, None to leave it out.
+        :type text: str.
+        :return: The copy, None if there is no result.
+        :rtype: dict.
+        """
+
+        if result is None:
+            return None
+
+        copy = {"intent": result["intent"], "probability": result["probability"]}
+        if text is not None:
+            copy = {"text": text, **copy}
+        if "intents" in result:
+            copy["intents"] = [dict(i) for i in result["intents"]]
+        if "features" in result:
+            copy["features"] = [dict(f) for f in result["features"]]
+        return copy
+
+    def _multiple_predict(self, texts, threshold, top_k=None) -> list:
+        """
+        Predict the intent of multiple texts, without the predictions cache.
+
+        :param texts: The texts to predict.
+        :type texts: list.
+        :param threshold: The threshold to apply.
+        :type threshold: float or dict.
+        :param top_k: The number of ranked intents, None to leave them out.
+        :type top_k: int.
+
+        :return: The predictions.
+        :rtype: list.
+        """
+        start = INSTRUMENTATION.start()
+        normalized = {}
+        for text in texts:
+            if text not in normalized:
+                normalized[text] = self.normalize(text)
+        INSTRUMENTATION.stop("classifier.normalize", start, len(normalized))
+
+        unique_texts = list(normalized.values())
+        start = INSTRUMENTATION.start()
+        intents, probabilities = self.intent_engine.predict_topk(
+            unique_texts, top_k or 1
+        )
+        INSTRUMENTATION.stop("classifier.engine", start, len(unique_texts))
+        predictions = dict(zip(normalized, zip(intents, probabilities)))
+
+        features = {}
+        if self.feature_extractor is not None:
+            start = INSTRUMENTATION.start()
+            for text, normalized_text in normalized.items():
+                features[text] = self.feature_extractor.get_features(
+                    normalized_text, threshold
+                )
+            INSTRUMENTATION.stop("classifier.features", start, len(normalized))
+
+        results = []
+        for text in texts:
+            intents, probabilities = predictions[text]
+            result = {
+                "text": text,
+                "intent": intents[0],
+                "probability": probabilities[0],
+            }
+            if top_k is not None:
+                result["intents"] = [
+                    {"intent": intent, "probability": probability}
+                    for intent, probability in zip(intents, probabilities)
+                ]
+            if self.feature_extractor is not None:
+                result["features"] = [dict(f) for f in features[text]]
+            results.append(result)
 
         return results
 
-    def predict(self, text, threshold=0.2):
+    def cache_stats(self) -> dict:
+        """
+        Get the statistics of the predictions cache.
+
+        :return: The size, maxsize, hits, misses and hit rate,
+            empty if the cache is disabled.
+        :rtype: dict.
+        """
+
+        if self.prediction_cache is None:
+            return {}
+        return self.prediction_cache.stats()
+
+    def normalize(self, text) -> NormalizedText:
+        """
+        Normalize the text once for the intent engine and the feature extractor.
+
+        :param text: The text to normalize.
+        :type text: str.
+        :return: The normalized text.
+        :rtype: NormalizedText.
+
+        example: normalize("¿Qué tal?") -> "¿qué tal?", with
+            folded "¿que tal?", the engine stems and the extractor words.
+        """
+
+        normalized = NormalizedText(text.lower())
+        normalized.text = text
+        normalized.folded = strip_accents(text).lower()
+
+        if hasattr(self.intent_engine, "tokenize"):
+            normalized.stems = tuple(self.intent_engine.tokenize(normalized))
+
+        if self.feature_extractor is not None:
+            normalized.words = tuple(
+                self.feature_extractor.preprocess_input(normalized)
+            )
+
+        return normalized
+
+    def predict(self, text, threshold=0.2, top_k=None):
         """
         Predict the intent of a text.
 
@@ -144,8 +454,10 @@ class ModelIntentClassifier(IntentClassifier, IntentUtils):
         :type text: str.
         :param threshold: The threshold to apply.
         :type threshold: float.
+        :param top_k: Also return the k best intents.
+        :type top_k: int.
 
         :return: The prediction.
         :rtype: dict.
         """
-        return self.multiple_predict([text], threshold)[0]
+        return self.multiple_predict([text], threshold, top_k)[0]
@@ -6,3 +6,4 @@ from peque_nlu.intent_engines.model_engine import ModelEngine
 from peque_nlu.intent_engines.sgd_engine import SGDIntentEngine
 from peque_nlu.intent_engines.logistic_engine import LogisticIntentEngine
 from peque_nlu.intent_engines.world_vector_intent_engine import WorldVectorIntentEngine
+from peque_nlu.intent_engines.compiled_engine import CompiledIntentEngine
@@ -0,0 +1,349 @@
+"""
+The CompiledIntentEngine class module.
+"""
+from copy import copy as shallow_copy
+from itertools import chain
+
+import numpy as np
+
+from peque_nlu.intent_engines import ModelEngine
+from peque_nlu.metrics import INSTRUMENTATION
+from peque_nlu.quantization import QuantizedArray
+from peque_nlu.utils import LRUCache
+
+MASK_32 = 0xFFFFFFFF
+
+
+def _mix_block(block) -> int:
+    """
+    Mix a 32 bits block of the MurmurHash3 input.
+    """
+
+    block = (block * 0xCC9E2D51) & MASK_32
+    block = ((block << 15) | (block >> 17)) & MASK_32
+    return (block * 0x1B873593) & MASK_32
+
+
+def murmurhash3_32(data, seed=0) -> int:
+    """
+    Hash bytes with the signed 32 bits MurmurHash3, like the sklearn
+    `murmurhash3_32`, so the hashing vectorizer columns are the same.
+
+    :param data: The bytes to hash.
+    :type data: bytes.
+    :param seed: The seed of the hash.
+    :type seed: int.
+    :return: The signed hash.
+    :rtype: int.
+
+    example: murmurhash3_32(b"hola") -> 780306906
+    """
+
+    length = len(data)
+    rounded = length & ~3
+    value = seed & MASK_32
+
+    for position in range(0, rounded, 4):
+        value ^= _mix_block(int.from_bytes(data[position : position + 4], "little"))
+        value = ((value << 13) | (value >> 19)) & MASK_32
+        value = (value * 5 + 0xE6546B64) & MASK_32
+
+    if length & 3:
+        value ^= _mix_block(int.from_bytes(data[rounded:], "little"))
+
+    value ^= length
+    value ^= value >> 16
+    value = (value * 0x85EBCA6B) & MASK_32
+    value ^= value >> 13
+    value = (value * 0xC2B2AE35) & MASK_32
+    value ^= value >> 16
+    return value - (1 << 32) if value & 0x80000000 else value
+
+
+class CompiledIntentEngine(ModelEngine):
+    """
+    The CompiledIntentEngine class.
+
+    This class is a fitted SGDIntentEngine or LogisticIntentEngine exported
+    to plain arrays, that predicts the same probabilities with NumPy only,
+    without the per call validation of sklearn or importing it.
+
+    The tokens are counted with the vocabulary or the hash of the vectorizer,
+    the weights rows of the tokens are summed, and the scores are turned
+    into probabilities with the link of the model:
+
+    - "sigmoid", the calibration of the SGDIntentEngine.
+    - "logistic", a one vs rest logistic regression.
+    - "softmax", a multinomial logistic regression.
+
+    With `quantize` the weights are stored as float16 or int8 with a scale
+    for the weights of every vectorizer column, and only the rows of the
+    tokens are converted back.
+
+    It can not be fitted or updated, export the engine again instead.
+
+    example: CompiledIntentEngine(intent_engine).predict(["hola"])
+    """
+
+    vocabulary = None
+    n_features = None
+    hash_cache = None
+    idf = None
+    norm = None
+    sublinear_tf = False
+    calibration = None
+
+    def __init__(self, intent_engine):  # pylint: disable=super-init-not-called
+        """
+        Compile a fitted intent engine.
+
+        :param intent_engine: The fitted engine to export.
+        :type intent_engine: ModelEngine.
+        """
+
+        if not hasattr(intent_engine, "_get_kernel"):
+            raise ValueError(f"{type(intent_engine).__name__} can not be exported")
+
+        kernel = intent_engine._get_kernel()  # pylint: disable=protected-access
+        vectorizer = intent_engine.vectorizer
+
+        # The tokens are the same as the exported engine ones
+        self.stopwords = intent_engine.stopwords
+        self.stemmer = intent_engine.stemmer
+        self.non_words = intent_engine.non_words
+        self.tokenizer = intent_engine.tokenizer
+        self.non_words_table = intent_engine.non_words_table
+        for name in ("stem_cache", "token_cache"):
+            cache = getattr(intent_engine, name)
+            if cache is not None:
+                setattr(self, name, LRUCache(cache.maxsize, cache.ttl))
+
+        self.stop_words = set(vectorizer.get_stop_words() or ())
+        if hasattr(vectorizer, "vocabulary_"):
+            self.vocabulary = dict(vectorizer.vocabulary_)
+        else:
+            self.n_features = vectorizer.n_features
+            self.alternate_sign = vectorizer.alternate_sign
+            self.hash_cache = LRUCache(10000)
+
+        self.classes = np.asarray(kernel["classes"])
+        # A row of weights for every column, so a text only reads its tokens
+        self.coef = np.ascontiguousarray(kernel["coef"].T, dtype=np.float64)
+        self.intercept = np.asarray(kernel["intercept"], dtype=np.float64)
+        self.link = kernel["link"]
+        if kernel.get("idf") is not None:
+            self.idf = np.asarray(kernel["idf"], dtype=np.float64)
+        self.norm = kernel.get("norm")
+        self.sublinear_tf = kernel.get("sublinear_tf", False)
+        if kernel.get("calibration") is not None:
+            self.calibration = np.asarray(kernel["calibration"], dtype=np.float64)
+
+    def _hash(self, token) -> tuple:
+        """
+        Get the column and the sign of a token, like the HashingVectorizer.
+
+        :param token: The token.
+        :type token: str.
+        :return: The column and the sign.
+        :rtype: tuple.
+        """
+
+        column = self.hash_cache.get(token)
+        if column is not None:
+            return column
+
+        value = murmurhash3_32(token.encode("utf-8"))
+        if value == -(1 << 31):
+            index = ((1 << 31) - 1 - (self.n_features - 1)) % self.n_features
+        else:
+            index = abs(value) % self.n_features
+        sign = -1 if self.alternate_sign and value < 0 else 1
+
+        self.hash_cache.put(token, (index, sign))
+        return index, sign
+
+    def _count(self, text) -> dict:
+        """
+        Count the tokens of a text by column.
+
+        :param text: The input text.
+        :type text: str.
+        :return: The counts by column.
+        :rtype: dict.
+        """
+
+        counts = {}
+        for token in self.tokenize(text.lower()):
+            if token in self.stop_words:
+                continue
+            if self.vocabulary is not None:
+                column = self.vocabulary.get(token)
+                if column is not None:
+                    counts[column] = counts.get(column, 0) + 1
+            else:
+                column, sign = self._hash(token)
+                counts[column] = counts.get(column, 0) + sign
+        return counts
+
+    def _weigh(self, columns, values, lengths) -> np.ndarray:
+        """
+        Weigh the counts of the texts like the TfidfTransformer.
+
+        :param columns: The columns of the tokens of all the texts.
+        :type columns: np.ndarray.
+        :param values: The counts of the tokens of all the texts.
+        :type values: np.ndarray.
+        :param lengths: The number of tokens of every text, with some.
+        :type lengths: np.ndarray.
+        :return: The weighted values.
+        :rtype: np.ndarray.
+        """
+
+        if self.sublinear_tf:
+            values = np.log(values) + 1
+        if self.idf is not None:
+            values = values * self.idf[columns]
+        if self.norm is None or values.size == 0:
+            return values
+
+        magnitudes = values * values if self.norm == "l2" else np.abs(values)
+        if len(lengths) == 1:
+            norms = magnitudes.sum(keepdims=True)
+        else:
+            norms = np.add.reduceat(magnitudes, np.cumsum(lengths) - lengths)
+        if self.norm == "l2":
+            norms = np.sqrt(norms)
+        norms[norms == 0] = 1
+        return values / (norms if len(lengths) == 1 else np.repeat(norms, lengths))
+
+    def _scores(self, text) -> np.ndarray:
+        """
+        Score the texts with the linear model, summing the weights rows of
+        their tokens.
+
+        :param text: The input texts.
+        :type text: list.
+        :return: The (texts, outputs) scores.
+        :rtype: np.ndarray.
+        """
+
+        if len(text) == 1:
+            counts = self._count(text[0])
+            columns = np.fromiter(counts, np.intp, len(counts))
+            values = np.fromiter(counts.values(), np.float64, len(counts))
+            values = self._weigh(columns, values, [len(counts)])
+            return (values @ self.coef[columns] + self.intercept)[np.newaxis]
+
+        counts = [self._count(text_item) for text_item in text]
+        lengths = np.fromiter(map(len, counts), np.intp, len(counts))
+        total = int(lengths.sum())
+        columns = np.fromiter(chain.from_iterable(counts), np.intp, total)
+        values = np.fromiter(
+            chain.from_iterable(c.values() for c in counts), np.float64, total
+        )
+
+        filled = lengths > 0
+        values = self._weigh(columns, values, lengths[filled])
+
+        scores = np.zeros((len(counts), self.coef.shape[1]))
+        if total:
+            weighted = self.coef[columns] * values[:, np.newaxis]
+            starts = np.cumsum(lengths) - lengths
+            scores[filled] = np.add.reduceat(weighted, starts[filled])
+        return scores + self.intercept
+
+    def predict_proba(self, text) -> np.ndarray:
+        """
+        Predict the probabilities of every intent, in the order of `classes`.
+
+        :param text: The input texts.
+        :type text: list.
+        :return: The (texts, intents) probabilities.
+        :rtype: np.ndarray.
+        """
+
+        return self._link(self._scores(text))
+
+    def _link(self, scores) -> np.ndarray:
+        """
+        Turn the scores of the linear model into the probabilities.
+
+        :param scores: The (texts, outputs) scores.
+        :type scores: np.ndarray.
+        :return: The (texts, intents) probabilities.
+        :rtype: np.ndarray.
+        """
+
+        if self.link == "softmax":
+            if scores.shape[1] == 1:
+                scores = np.hstack([-scores, scores])
+            probabilities = np.exp(scores - scores.max(axis=1, keepdims=True))
+        else:
+            if self.link == "sigmoid":
+                scores = -(self.calibration[:, 0] * scores + self.calibration[:, 1])
+            # The big negative scores are 0 probabilities, like expit
+            probabilities = 1 / (1 + np.exp(-np.maximum(scores, -700)))
+
+        if probabilities.shape[1] == 1:
+            return np.hstack([1 - probabilities, probabilities])
+
+        totals = probabilities.sum(axis=1, keepdims=True)
+        if totals.all():
+            return probabilities / totals
+        uniform = np.full_like(probabilities, 1 / probabilities.shape[1])
+        return np.divide(probabilities, totals, out=uniform, where=totals != 0)
+
+    def predict_topk(self, text, k=1) -> tuple:
+        """
+        Predict the k most probable intents of the input texts.
+
+        :param text: The input texts.
+        :type text: list.
+        :param k: The number of intents of every text, at most all of them.
+        :type k: int.
+        :return: The (texts, k) arrays of the intents and their probabilities,
+            the most probable first.
+        :rtype: tuple.
+
+        example: predict_topk(["hello"], 2) -> ([["greet", "bye"]], [[0.9, 0.1]])
+        """
+
+        start = INSTRUMENTATION.start()
+        scores = self._scores(text)
+        probabilities = self._link(scores)
+        INSTRUMENTATION.stop("engine.predict_proba", start, len(text))
+        if self.link != "sigmoid":
+            return self._rank(self.classes, probabilities, k)
+
+        # The calibrated intents are ranked by the decision function, like
+        # the SGDIntentEngine
+        if scores.shape[1] == 1:
+            scores = np.hstack([-scores, scores])
+        return self._rank(self.classes, probabilities, k, scores)
+
+    def quantize(self, dtype="int8") -> "CompiledIntentEngine":
+        """
+        Get a copy of the intent engine with quantized weights.
+
+        :param dtype: The reduced precision, "float16" or "int8".
+        :type dtype: str.
+        :return: The quantized intent engine.
+        :rtype: CompiledIntentEngine.
+        """
+
+        quantized = shallow_copy(self)
+        quantized.coef = QuantizedArray(self.coef, dtype)
+        return quantized
+
+    def fit(self, text, intent):
+        """
+        The compiled engine can not be fitted, fit the original engine and
+        export it again.
+
+        :param text: The input text.
+        :type text: str.
+        """
+
+        raise NotImplementedError(
+            "CompiledIntentEngine can not be fitted, export the engine again"
+        )
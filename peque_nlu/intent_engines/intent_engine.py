@@ -3,6 +3,8 @@ Intent engine abstract class module.
 """
 from abc import ABC, abstractmethod
 
+import numpy as np
+
 
 class BasicIntentEngine(ABC):
     """
@@ -22,6 +24,28 @@ class BasicIntentEngine(ABC):
         example: predict("hello") -> ("greet", 1)
         """
 
+    def predict_topk(self, text, k=1) -> tuple:  # pylint: disable=unused-argument
+        """
+        Predict the k best intents of the input texts, the best first.
+
+        The engines that only know their best intent give it alone.
+
+        :param text: The input texts.
+        :type text: list.
+        :param k: The number of intents of every text.
+        :type k: int.
+        :return: The (texts, k) arrays of the intents and their scores.
+        :rtype: tuple.
+
+        example: predict_topk(["hello"], 2) -> ([["greet", "bye"]], [[0.9, 0.1]])
+        """
+
+        intents, scores = self.predict(text)
+        return (
+            np.array(intents, dtype=object).reshape(-1, 1),
+            np.array(scores, dtype=np.float64).reshape(-1, 1),
+        )
+
     @abstractmethod
     def fit(self, text, intent):
         """
@@ -34,3 +58,19 @@ class BasicIntentEngine(ABC):
         :type intent: str.
 
         """
+
+    def update(self, text, intent):
+        """
+        Update the intent engine with new examples, without fitting it again.
+
+        :param text: The input texts.
+        :type text: list.
+
+        :param intent: The intents of the input texts.
+        :type intent: list.
+
+        """
+
+        raise NotImplementedError(
+            f"{type(self).__name__} can not be updated, fit it again"
+        )
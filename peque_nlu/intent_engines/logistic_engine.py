@@ -1,11 +1,13 @@
 """
 The LogisticIntentEngine module.
 """
-
-import numpy as np
-from sklearn.linear_model import LogisticRegression
+import warnings
 
 from peque_nlu.intent_engines import ModelEngine
+from peque_nlu.utils import LazyModule
+
+sklearn_linear_model = LazyModule("sklearn.linear_model")
+sklearn_exceptions = LazyModule("sklearn.exceptions")
 
 
 class LogisticIntentEngine(ModelEngine):
@@ -14,35 +16,40 @@ class LogisticIntentEngine(ModelEngine):
 
     This class is used to create a logistic regresion
     and use it to detect the intent.
+
+    The logistic regresion has no `partial_fit`, so `update` warm starts it
+    for a few iterations on the replay buffer, not the whole dataset.
     """
 
-    def __init__(self, language):
+    def __init__(self, language, **kwargs):
         """
         Initialize the LogisticIntentEngine.
 
         :param language: The language to use.
         :type language: str.
+        :param kwargs: The ModelEngine options, like the caches sizes.
+        :type kwargs: dict.
         """
 
-        super().__init__(language)
-        self.model = LogisticRegression()
+        super().__init__(language, **kwargs)
+        self.model = sklearn_linear_model.LogisticRegression()
 
-    def predict(self, text) -> tuple:
+    def _get_kernel(self) -> dict:
         """
-        Predict the intent of the input text.
-
-        :param texts: The input text.
-        :type texts: str.
-        :return: The predicted intent and the confidence.
-        :rtype: tuple.
+        Get the arrays of the fitted engine, with the same link function as
+        `LogisticRegression.predict_proba`.
 
-        example: predict("hello") -> ("greet", 1)
+        :return: The CompiledIntentEngine options.
+        :rtype: dict.
         """
 
-        vec_texts = self.vectorizer.transform(text)
-        intents = self.model.predict(vec_texts)
-        probabilities = np.max(self.model.predict_proba(vec_texts), axis=1)
-        return intents, probabilities
+        kernel = super()._get_kernel()
+        ovr = self.model.multi_class in ("ovr", "warn") or (
+            self.model.multi_class == "auto"
+            and (len(self.model.classes_) <= 2 or self.model.solver == "liblinear")
+        )
+        kernel["link"] = "logistic" if ovr else "softmax"
+        return kernel
 
     def fit(self, text, intent):
         """
@@ -51,5 +58,47 @@ class LogisticIntentEngine(ModelEngine):
         :param text: The input text.
         :type text: str.
         """
+        self._remember(text, intent, clear=True)
+
         text = self.vectorizer.fit_transform(text)
         self.model.fit(text, intent)
+
+    def update(self, text, intent, max_iter=10):
+        """
+        Update the intent engine with new examples, that can have new intents,
+        without fitting it again on the whole dataset.
+
+        The model is warm started from its weights and fitted on the replay
+        buffer for at most `max_iter` iterations, so an update costs a few
+        passes over the buffer, at most `replay_size` examples by intent.
+        Unlike the `partial_fit` steps of the SGDIntentEngine, the solver
+        minimizes the loss of only the examples it is given, so a sample
+        proportional to the new examples would forget the other intents.
+        Every update moves the weights towards the buffer, so the examples
+        that are not in it are slowly forgotten.
+
+        :param text: The input texts.
+        :type text: list.
+        :param intent: The intents of the input texts.
+        :type intent: list.
+        :param max_iter: The maximum iterations of the solver.
+        :type max_iter: int.
+        """
+
+        text = list(text)
+        intent = list(intent)
+
+        n_columns = self._extend_vocabulary(text)
+        self._extend_estimator(self.model, n_columns, intent, binary_scale=0.5)
+        self._remember(text, intent)
+
+        texts, intents = self._get_replay()
+        params = {"warm_start": self.model.warm_start, "max_iter": self.model.max_iter}
+        self.model.set_params(warm_start=True, max_iter=max_iter)
+        try:
+            with warnings.catch_warnings():
+                # A few iterations are not expected to converge
+                warnings.simplefilter("ignore", sklearn_exceptions.ConvergenceWarning)
+                self.model.fit(self.vectorizer.transform(texts), intents)
+        finally:
+            self.model.set_params(**params)
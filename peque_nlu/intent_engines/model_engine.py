@@ -1,13 +1,28 @@
 """
 The ModelEngine base class module.
 """
+import random
+import re
 from string import punctuation
-from nltk.corpus import stopwords
-from nltk import word_tokenize
-from nltk.stem import SnowballStemmer
-from sklearn.feature_extraction.text import CountVectorizer
+
+import numpy as np
 
 from peque_nlu.intent_engines import BasicIntentEngine
+from peque_nlu.metrics import INSTRUMENTATION
+from peque_nlu.utils import LazyModule, LRUCache
+
+nltk_corpus = LazyModule("nltk.corpus")
+nltk_stem = LazyModule("nltk.stem")
+nltk_tokenize = LazyModule("nltk.tokenize")
+sklearn_text = LazyModule("sklearn.feature_extraction.text")
+
+# The word_tokenize rules that still apply once the punctuation is removed
+QUOTES_REGEX = re.compile("[«“‘„»”’]")
+CONTRACTIONS_REGEX = re.compile(
+    r"\b(can)(not)\b|\b(gim)(me)\b|\b(gon)(na)\b"
+    r"|\b(got)(ta)\b|\b(lem)(me)\b|\b(wan)(na)(?=\s)",
+    re.IGNORECASE,
+)
 
 
 class ModelEngine(BasicIntentEngine):
@@ -16,28 +31,95 @@ class ModelEngine(BasicIntentEngine):
 
     This class is intended to be a parent class.
     Is used to create a model intent engine.
+
+    The stems of the words are memoized in a bounded cache, and optionally
+    the tokens of whole texts, the caches are saved with the engine.
+
+    The "fast" tokenizer gives the same tokens as the "nltk" one with
+    `str.translate` and precompiled regexes, without the punkt resource.
+
+    The "hashing" vectorizer hashes the tokens to `n_features` columns, so its
+    memory does not grow with the vocabulary of the corpus.
+
+    A replay buffer keeps up to `replay_size` examples of every intent, a
+    uniform sample of the examples seen of the intent, so `update` can mix
+    them with the new examples and refresh the calibration without the whole
+    dataset.
     """
 
-    def __init__(self, language):
+    model = None
+    stem_cache = None
+    token_cache = None
+    tokenizer = "nltk"
+    non_words_table = None
+    replay = None
+    replay_seen = None
+    replay_size = 100
+    alternate_sign = False
+    n_features = 2**14
+
+    def __init__(
+        self,
+        language,
+        stem_cache_size=10000,
+        token_cache_size=0,
+        tokenizer="nltk",
+        vectorizer="count",
+        n_features=2**14,
+        alternate_sign=False,
+    ):
         """
         Initialize the ModelEngine.
 
         :param language: The language to use.
         :type language: str.
+        :param tokenizer: The tokenizer to use, "nltk" or "fast".
+        :type tokenizer: str.
+        :param stem_cache_size: The number of stems to memoize, 0 to disable.
+        :type stem_cache_size: int.
+        :param token_cache_size: The number of texts to memoize their tokens,
+            0 to disable.
+        :type token_cache_size: int.
+        :param vectorizer: The vectorizer to use, "count" or "hashing".
+        :type vectorizer: str.
+        :param n_features: The number of columns of the hashing vectorizer,
+            the weights of the models grow with it for every intent.
+        :type n_features: int.
+        :param alternate_sign: Sign the hashed counts, so the collisions
+            cancel out instead of adding up.
+        :type alternate_sign: bool.
         """
 
-        self.stopwords = stopwords.words(language)
-        self.stemmer = SnowballStemmer(language)
+        self.stopwords = nltk_corpus.stopwords.words(language)
+        self.stemmer = nltk_stem.SnowballStemmer(language)
         self.non_words = list(punctuation)
         self.non_words.extend(["¿", "¡"])
         self.non_words.extend(map(str, range(10)))
 
-        self.vectorizer = CountVectorizer(
-            analyzer="word",
-            tokenizer=self.tokenize,
-            lowercase=True,
-            stop_words=self.stopwords,
-        )
+        if tokenizer not in ("nltk", "fast"):
+            raise ValueError(f"tokenizer must be 'nltk' or 'fast', not {tokenizer}")
+        self.tokenizer = tokenizer
+        self.non_words_table = str.maketrans("", "", "".join(self.non_words))
+
+        self.stem_cache = LRUCache(stem_cache_size) if stem_cache_size else None
+        self.token_cache = LRUCache(token_cache_size) if token_cache_size else None
+
+        if vectorizer not in ("count", "hashing"):
+            raise ValueError(
+                f"vectorizer must be 'count' or 'hashing', not {vectorizer}"
+            )
+        self.alternate_sign = alternate_sign
+        self.n_features = n_features
+
+        if vectorizer == "hashing":
+            self.vectorizer = self._build_hashing_vectorizer(n_features)
+        else:
+            self.vectorizer = sklearn_text.CountVectorizer(
+                analyzer="word",
+                tokenizer=self.tokenize,
+                lowercase=True,
+                stop_words=self.stopwords,
+            )
 
     def _stem_tokens(self, tokens, stemmer) -> list:
         """
@@ -58,7 +140,15 @@ class ModelEngine(BasicIntentEngine):
 
         stemmed = []
         for item in tokens:
-            stemmed.append(stemmer.stem(item))
+            stem = None
+            if self.stem_cache is not None:
+                stem = self.stem_cache.get(item)
+
+            if stem is None:
+                stem = stemmer.stem(item)
+                if self.stem_cache is not None:
+                    self.stem_cache.put(item, stem)
+            stemmed.append(stem)
         return stemmed
 
     def tokenize(self, text) -> list:
@@ -69,12 +159,358 @@ class ModelEngine(BasicIntentEngine):
         :type text: str.
         :return: The tokens.
         :rtype: list.
+
+        If the text is a NormalizedText its stems are reused.
+        """
+
+        stems = getattr(text, "stems", None)
+        if stems is not None:
+            return list(stems)
+
+        if self.token_cache is None:
+            return self._tokenize(text)
+
+        stems = self.token_cache.get(text)
+        if stems is None:
+            stems = tuple(self._tokenize(text))
+            self.token_cache.put(text, stems)
+        return list(stems)
+
+    def _tokenize(self, text) -> list:
         """
+        Tokenize the text, without the tokens cache.
+
+        :param text: The text to tokenize.
+        :type text: str.
+        :return: The tokens.
+        :rtype: list.
+        """
+
+        start = INSTRUMENTATION.start()
+        if self.tokenizer == "fast":
+            tokens = self._fast_word_tokenize(text)
+        else:
+            text = "".join([c for c in text if c not in self.non_words])
+            tokens = nltk_tokenize.word_tokenize(text)
 
-        text = "".join([c for c in text if c not in self.non_words])
-        tokens = word_tokenize(text)
         try:
             stems = self._stem_tokens(tokens, self.stemmer)
         except Exception as _:
             stems = [""]
+        INSTRUMENTATION.stop("engine.tokenize", start)
         return stems
+
+    def _fast_word_tokenize(self, text) -> list:
+        """
+        Remove the non words and split the text in the same tokens
+        as `word_tokenize`.
+
+        :param text: The text to tokenize.
+        :type text: str.
+        :return: The tokens.
+        :rtype: list.
+
+        example: _fast_word_tokenize("¿Cannot “hola”?") ->
+            ["Can", "not", "“", "hola", "”"]
+        """
+
+        text = text.translate(self.non_words_table)
+        text = QUOTES_REGEX.sub(r" \g<0> ", text)
+        text = CONTRACTIONS_REGEX.sub(
+            lambda match: " ".join(["", *filter(None, match.groups()), ""]),
+            f" {text} ",
+        )
+        return text.split()
+
+    def cache_stats(self) -> dict:
+        """
+        Get the statistics of the stems and tokens caches.
+
+        :return: The statistics of every enabled cache.
+        :rtype: dict.
+
+        example: cache_stats() ->
+            {"stems": {"size": 2, "maxsize": 10000, "hits": 3, "misses": 2,
+                "hit_rate": 0.6}}
+        """
+
+        stats = {}
+        if self.stem_cache is not None:
+            stats["stems"] = self.stem_cache.stats()
+        if self.token_cache is not None:
+            stats["tokens"] = self.token_cache.stats()
+        return stats
+
+    def _get_scorer(self) -> object:
+        """
+        Get the fitted estimator that gives the probabilities of the intents.
+
+        :return: The estimator, with `predict_proba` and `classes_`.
+        :rtype: object.
+        """
+
+        return self.model
+
+    def predict(self, text) -> tuple:
+        """
+        Predict the intent of the input text, the best one of `predict_topk`.
+
+        :param text: The input texts.
+        :type text: list.
+        :return: The predicted intents and the confidences.
+        :rtype: tuple.
+
+        example: predict(["hello"]) -> (["greet"], [0.9])
+        """
+
+        intents, probabilities = self.predict_topk(text, 1)
+        return intents[:, 0], probabilities[:, 0]
+
+    def predict_topk(self, text, k=1) -> tuple:
+        """
+        Predict the k best intents of the input texts, the texts are scored
+        once and the intents are ranked from the scores of `_score`.
+
+        :param text: The input texts.
+        :type text: list.
+        :param k: The number of intents of every text, at most all of them.
+        :type k: int.
+        :return: The (texts, k) arrays of the intents and their probabilities,
+            the most probable first.
+        :rtype: tuple.
+
+        example: predict_topk(["hello"], 2) -> ([["greet", "bye"]], [[0.9, 0.1]])
+        """
+
+        scorer = self._get_scorer()
+
+        start = INSTRUMENTATION.start()
+        vec_texts = self.vectorizer.transform(text)
+        INSTRUMENTATION.stop("engine.transform", start, len(text))
+
+        start = INSTRUMENTATION.start()
+        probabilities, scores = self._score(vec_texts)
+        INSTRUMENTATION.stop("engine.predict_proba", start, len(text))
+        return self._rank(scorer.classes_, probabilities, k, scores)
+
+    def _score(self, vec_texts) -> tuple:
+        """
+        Score the vectorized texts with the estimator.
+
+        :param vec_texts: The vectorized texts.
+        :type vec_texts: scipy.sparse.csr_matrix.
+        :return: The (texts, intents) probabilities and the scores the
+            intents are ranked by, the probabilities themselves.
+        :rtype: tuple.
+        """
+
+        probabilities = self._get_scorer().predict_proba(vec_texts)
+        return probabilities, probabilities
+
+    @staticmethod
+    def _rank(classes, probabilities, k, scores=None) -> tuple:
+        """
+        Rank the k best intents of every text.
+
+        :param classes: The intents of the probabilities columns.
+        :type classes: np.ndarray.
+        :param probabilities: The (texts, intents) probabilities.
+        :type probabilities: np.ndarray.
+        :param k: The number of intents.
+        :type k: int.
+        :param scores: The (texts, intents) scores to rank the intents by,
+            by default the probabilities.
+        :type scores: np.ndarray.
+        :return: The (texts, k) arrays of the intents and their probabilities.
+        :rtype: tuple.
+        """
+
+        if scores is None:
+            scores = probabilities
+        if k <= 1:
+            order = scores.argmax(axis=1)[:, np.newaxis]
+        else:
+            # Stable, so the ties keep the order of the classes like argmax
+            order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        return classes[order], np.take_along_axis(probabilities, order, axis=1)
+
+    def _get_kernel(self) -> dict:
+        """
+        Get the arrays of the fitted vectorizer and linear model, to score the
+        texts without sklearn.
+
+        :return: The CompiledIntentEngine options, the subclasses add how
+            the scores are turned into probabilities.
+        :rtype: dict.
+        """
+
+        *transformers, (_, estimator) = getattr(
+            self.model, "steps", [(None, self.model)]
+        )
+        if not hasattr(estimator, "coef_"):
+            raise ValueError("The intent engine must be fitted before exporting it")
+
+        kernel = {
+            "classes": estimator.classes_,
+            "coef": estimator.coef_,
+            "intercept": estimator.intercept_,
+        }
+        for _, transformer in transformers:
+            if not hasattr(transformer, "idf_"):
+                raise ValueError(f"{type(transformer).__name__} can not be exported")
+            kernel["idf"] = transformer.idf_ if transformer.use_idf else None
+            kernel["norm"] = transformer.norm
+            kernel["sublinear_tf"] = transformer.sublinear_tf
+        return kernel
+
+    def _build_hashing_vectorizer(self, n_features) -> object:
+        """
+        Build a stateless vectorizer, that hashes the tokens to the columns
+        so it does not need a vocabulary fitted on the whole corpus.
+
+        :param n_features: The number of columns.
+        :type n_features: int.
+        :return: The vectorizer.
+        :rtype: HashingVectorizer.
+        """
+
+        return sklearn_text.HashingVectorizer(
+            analyzer="word",
+            tokenizer=self.tokenize,
+            lowercase=True,
+            stop_words=self.stopwords,
+            n_features=n_features,
+            alternate_sign=self.alternate_sign,
+            norm=None,
+        )
+
+    def _remember(self, text, intent, clear=False):
+        """
+        Add examples to the replay buffer, when the buffer of an intent is
+        full a new example replaces a random one with probability
+        `replay_size` over the examples seen of the intent.
+
+        :param text: The input texts.
+        :type text: list.
+        :param intent: The intents of the input texts.
+        :type intent: list.
+        :param clear: Empty the buffer first, on fit.
+        :type clear: bool.
+        """
+
+        if self.replay is None or clear:
+            self.replay = {}
+            self.replay_seen = {}
+        elif self.replay_seen is None:
+            # The buffers saved before the seen examples were counted
+            self.replay_seen = {k: len(v) for k, v in self.replay.items()}
+
+        # Seeded by the examples seen, so every call draws new positions and
+        # the engine is saved without a generator
+        generator = random.Random(sum(self.replay_seen.values()))
+        for text_item, intent_item in zip(text, intent):
+            examples = self.replay.setdefault(intent_item, [])
+            seen = self.replay_seen.get(intent_item, 0) + 1
+            self.replay_seen[intent_item] = seen
+            if len(examples) < self.replay_size:
+                examples.append(text_item)
+                continue
+
+            position = generator.randrange(seen)
+            if position < self.replay_size:
+                examples[position] = text_item
+
+    def _get_replay(self, size=None) -> tuple:
+        """
+        Get the examples of the replay buffer.
+
+        :param size: The number of examples to sample, by default all of them.
+            At least one example of every intent is returned.
+        :type size: int.
+        :return: The texts and the intents.
+        :rtype: tuple.
+        """
+
+        if self.replay is None:
+            raise ValueError("The intent engine must be fitted before updating it")
+
+        examples = [
+            (text_item, intent_item)
+            for intent_item, texts in self.replay.items()
+            for text_item in texts
+        ]
+        if size is not None and size < len(examples):
+            generator = random.Random(42)
+            firsts = [
+                (texts[0], intent_item) for intent_item, texts in self.replay.items()
+            ]
+            others = [
+                (text_item, intent_item)
+                for intent_item, texts in self.replay.items()
+                for text_item in texts[1:]
+            ]
+            examples = firsts + generator.sample(others, max(size - len(firsts), 0))
+
+        return [e[0] for e in examples], [e[1] for e in examples]
+
+    def _extend_vocabulary(self, text) -> int:
+        """
+        Add the new words of the texts at the end of the vocabulary,
+        a hashing vectorizer has no vocabulary to extend.
+
+        :param text: The input texts.
+        :type text: list.
+        :return: The number of new columns.
+        :rtype: int.
+        """
+
+        vocabulary = getattr(self.vectorizer, "vocabulary_", None)
+        if vocabulary is None:
+            return 0
+
+        size = len(vocabulary)
+        analyzer = self.vectorizer.build_analyzer()
+        for text_item in text:
+            for term in analyzer(text_item):
+                vocabulary.setdefault(term, len(vocabulary))
+        return len(vocabulary) - size
+
+    @staticmethod
+    def _extend_estimator(estimator, n_columns, intent, binary_scale=1.0):
+        """
+        Add zero columns for the new words and rows for the new intents to a
+        fitted linear estimator, the weights are copied so they are writable.
+
+        :param estimator: The linear estimator, with coef_ and classes_.
+        :type estimator: SGDClassifier or LogisticRegression.
+        :param n_columns: The number of new columns.
+        :type n_columns: int.
+        :param intent: The intents of the new examples.
+        :type intent: list.
+        :param binary_scale: The scale of the two rows of a binary estimator,
+            1 for one vs rest and 0.5 for multinomial.
+        :type binary_scale: float.
+        """
+
+        coef = np.hstack([estimator.coef_, np.zeros((len(estimator.coef_), n_columns))])
+        intercept = np.array(estimator.intercept_, dtype=np.float64)
+        estimator.n_features_in_ = coef.shape[1]
+
+        classes = np.union1d(estimator.classes_, intent)
+        if len(classes) > len(estimator.classes_):
+            if len(coef) == 1:
+                # The binary row scores the second class against the first one
+                coef = np.vstack([-coef, coef]) * binary_scale
+                intercept = np.hstack([-intercept, intercept]) * binary_scale
+
+            positions = np.searchsorted(classes, estimator.classes_)
+            new_coef = np.zeros((len(classes), coef.shape[1]))
+            new_coef[positions] = coef
+            # The new intents start as unlikely as the most unlikely one
+            new_intercept = np.full(len(classes), intercept.min())
+            new_intercept[positions] = intercept
+            coef, intercept = new_coef, new_intercept
+            estimator.classes_ = classes
+
+        estimator.coef_ = coef
+        estimator.intercept_ = intercept
@@ -1,13 +1,19 @@
 """
 The SGDIntentEngine class module.
 """
+import random
+import zlib
+
 import numpy as np
-from sklearn.feature_extraction.text import TfidfTransformer
-from sklearn.pipeline import Pipeline
-from sklearn.linear_model import SGDClassifier
-from sklearn.calibration import CalibratedClassifierCV
 
 from peque_nlu.intent_engines import ModelEngine
+from peque_nlu.utils import LazyModule
+
+sklearn_base = LazyModule("sklearn.base")
+sklearn_text = LazyModule("sklearn.feature_extraction.text")
+sklearn_pipeline = LazyModule("sklearn.pipeline")
+sklearn_linear_model = LazyModule("sklearn.linear_model")
+sklearn_calibration = LazyModule("sklearn.calibration")
 
 
 class SGDIntentEngine(ModelEngine):
@@ -16,23 +22,33 @@ class SGDIntentEngine(ModelEngine):
 
     This class is used to create a SGDClassifier
     and use it to detect the intent.
+
+    With `fit_stream` it is trained out of core, from mini batches in a fixed
+    number of passes, with a hashing vectorizer and a calibration sample.
+
+    With `update` new examples and intents are learned with `partial_fit`,
+    the document frequencies are kept up to date from `n_documents`.
     """
 
-    def __init__(self, language):
+    n_documents = None
+
+    def __init__(self, language, **kwargs):
         """
         Initialize the SGDIntentEngine.
 
         :param language: The language to use.
         :type language: str.
+        :param kwargs: The ModelEngine options, like the caches sizes.
+        :type kwargs: dict.
         """
 
-        super().__init__(language)
-        self.model = Pipeline(
+        super().__init__(language, **kwargs)
+        self.model = sklearn_pipeline.Pipeline(
             [
-                ("tfidf", TfidfTransformer()),
+                ("tfidf", sklearn_text.TfidfTransformer()),
                 (
                     "clf-svm",
-                    SGDClassifier(
+                    sklearn_linear_model.SGDClassifier(
                         loss="hinge",
                         penalty="l2",
                         alpha=1e-3,
@@ -44,25 +60,70 @@ class SGDIntentEngine(ModelEngine):
         )
 
         # Use CalibratedClassifierCV to get probabilities
-        self.calibrator = CalibratedClassifierCV(self.model, cv="prefit")
+        self.calibrator = sklearn_calibration.CalibratedClassifierCV(
+            self.model, cv="prefit"
+        )
 
-    def predict(self, text) -> tuple:
+    def _get_scorer(self) -> object:
         """
-        Predict the intent of the input text.
+        Get the calibrator, that gives the probabilities of the SGDClassifier,
+        the intents are still ranked by the classifier decision function.
 
-        :param text: The input text.
-        :type text: str.
-        :return: The predicted intent and the confidence.
+        :return: The calibrator.
+        :rtype: CalibratedClassifierCV.
+        """
+
+        return self.calibrator
+
+    def _score(self, vec_texts) -> tuple:
+        """
+        Score the vectorized texts with the decision function of the
+        classifier, so the best intent is the one of `model.predict`, and
+        calibrate the same scores into the probabilities.
+
+        :param vec_texts: The vectorized texts.
+        :type vec_texts: scipy.sparse.csr_matrix.
+        :return: The (texts, intents) probabilities and decision scores.
         :rtype: tuple.
+        """
+
+        scores = self.model.decision_function(vec_texts)
+        calibrators = self.calibrator.calibrated_classifiers_[0].calibrators
+        if scores.ndim == 1:
+            positive = calibrators[0].predict(scores)
+            return np.column_stack([1 - positive, positive]), np.column_stack(
+                [-scores, scores]
+            )
+
+        probabilities = np.column_stack(
+            [c.predict(column) for c, column in zip(calibrators, scores.T)]
+        )
+        # Normalized like CalibratedClassifierCV, uniform when all are 0
+        totals = probabilities.sum(axis=1, keepdims=True)
+        uniform = np.full_like(probabilities, 1 / probabilities.shape[1])
+        probabilities = np.divide(probabilities, totals, out=uniform, where=totals != 0)
+        return probabilities, scores
+
+    def _get_kernel(self) -> dict:
+        """
+        Get the arrays of the fitted engine, with the sigmoid calibration of
+        every intent.
 
-        example: predict("hello") -> ("greet", 1)
+        :return: The CompiledIntentEngine options.
+        :rtype: dict.
         """
 
-        vec_texts = self.vectorizer.transform(text)
-        intents = self.model.predict(vec_texts)
+        kernel = super()._get_kernel()
+        calibrated = self.calibrator.calibrated_classifiers_
+        if len(calibrated) != 1 or calibrated[0].method != "sigmoid":
+            raise ValueError("Only a prefit sigmoid calibration can be exported")
+        if not np.array_equal(self.calibrator.classes_, kernel["classes"]):
+            raise ValueError("The calibration must have the intents of the model")
 
-        probabilities = np.max(self.calibrator.predict_proba(vec_texts), axis=1)
-        return intents, probabilities
+        calibrators = calibrated[0].calibrators
+        kernel["link"] = "sigmoid"
+        kernel["calibration"] = np.array([[c.a_, c.b_] for c in calibrators])
+        return kernel
 
     def fit(self, text, intent):
         """
@@ -72,6 +133,330 @@ class SGDIntentEngine(ModelEngine):
         :type text: str.
         """
 
+        self._remember(text, intent, clear=True)
+
         text = self.vectorizer.fit_transform(text)
         self.model.fit(text, intent)
         self.calibrator.fit(text, intent)
+        self.n_documents = text.shape[0]
+
+    @staticmethod
+    def _is_calibration(text, calibration_fraction, held_out=()) -> bool:
+        """
+        Check if an example is held out for the calibration, the same
+        texts are held out in every pass.
+
+        :param text: The text of the example.
+        :type text: str.
+        :param calibration_fraction: The fraction of the examples to hold out.
+        :type calibration_fraction: float.
+        :param held_out: The texts held out besides the fraction.
+        :type held_out: set.
+        :return: True if the example is held out.
+        :rtype: bool.
+        """
+
+        return (
+            zlib.crc32(text.encode("utf-8")) % 10000 < calibration_fraction * 10000
+            or text in held_out
+        )
+
+    def _scan_stream(
+        self, batches, n_features, calibration_fraction, calibration_size
+    ) -> tuple:
+        """
+        Scan the batches once, to get the intents, the document frequencies
+        of the training examples and a reservoir sample of the held out ones.
+
+        Every intent with more than one text has a held out example, the
+        training text of an intent with the lowest hash is held out when the
+        fraction leaves none, and the sample keeps one example of every intent.
+
+        :param batches: The batches, lists of (text, intent).
+        :type batches: iterable.
+        :param n_features: The number of columns of the hashing vectorizer.
+        :type n_features: int.
+        :param calibration_fraction: The fraction of the examples to hold out.
+        :type calibration_fraction: float.
+        :param calibration_size: The maximum number of held out examples.
+        :type calibration_size: int.
+        :return: The intents, the calibration sample, the texts held out
+            besides the fraction, the document frequencies and the number
+            of training examples.
+        :rtype: tuple.
+        """
+
+        intents = {}
+        calibration = []
+        held_out = 0
+        generator = random.Random(42)
+        document_frequencies = np.zeros(n_features)
+        documents = 0
+        first_held_out = {}
+        candidates = {}
+
+        for batch in batches:
+            texts = []
+            for text_item, intent_item in batch:
+                intents.setdefault(intent_item, None)
+                if not self._is_calibration(text_item, calibration_fraction):
+                    texts.append(text_item)
+                    self._add_candidate(candidates, text_item, intent_item)
+                    continue
+
+                first_held_out.setdefault(intent_item, (text_item, intent_item))
+                held_out += 1
+                if len(calibration) < calibration_size:
+                    calibration.append((text_item, intent_item))
+                    continue
+                position = generator.randrange(held_out)
+                if position < calibration_size:
+                    calibration[position] = (text_item, intent_item)
+
+            if texts:
+                counts = self.vectorizer.transform(texts)
+                document_frequencies += np.bincount(
+                    counts.indices, minlength=n_features
+                )
+                documents += len(texts)
+
+        extra_held_out = self._hold_out_intents(calibration, first_held_out, candidates)
+        for text_item, copies in extra_held_out.items():
+            counts = self.vectorizer.transform([text_item])
+            document_frequencies -= copies * np.bincount(
+                counts.indices, minlength=n_features
+            )
+            documents -= copies
+
+        return (
+            list(intents),
+            calibration,
+            set(extra_held_out),
+            document_frequencies,
+            documents,
+        )
+
+    @staticmethod
+    def _add_candidate(candidates, text, intent):
+        """
+        Count a training example of an intent, and keep the text of the
+        intent with the lowest hash and its copies.
+
+        :param candidates: The hash, the text, its copies and the training
+            examples of every intent.
+        :type candidates: dict.
+        :param text: The text of the example.
+        :type text: str.
+        :param intent: The intent of the example.
+        :type intent: str.
+        """
+
+        text_hash = zlib.crc32(text.encode("utf-8"))
+        candidate = candidates.setdefault(intent, [text_hash, text, 0, 0])
+        candidate[3] += 1
+        if text_hash < candidate[0]:
+            candidate[:3] = [text_hash, text, 1]
+        elif text == candidate[1]:
+            candidate[2] += 1
+
+    @staticmethod
+    def _hold_out_intents(calibration, first_held_out, candidates) -> dict:
+        """
+        Add to the calibration sample an example of every intent it misses,
+        a held out one, or the lowest hash text when the intent has other
+        training texts.
+
+        :param calibration: The calibration sample, extended in place.
+        :type calibration: list.
+        :param first_held_out: The first held out example of every intent.
+        :type first_held_out: dict.
+        :param candidates: The lowest hash text of every intent, from
+            `_add_candidate`.
+        :type candidates: dict.
+        :return: The copies of every text held out besides the fraction.
+        :rtype: dict.
+        """
+
+        sampled = {intent_item for _, intent_item in calibration}
+        calibration.extend(
+            example
+            for intent_item, example in first_held_out.items()
+            if intent_item not in sampled
+        )
+
+        extra_held_out = {}
+        for intent_item, (_, text_item, copies, trained) in candidates.items():
+            if intent_item not in first_held_out and trained > copies:
+                extra_held_out[text_item] = copies
+                calibration.append((text_item, intent_item))
+        return extra_held_out
+
+    def fit_stream(
+        self,
+        batches,
+        classes=None,
+        n_passes=5,
+        n_features=None,
+        calibration_fraction=0.1,
+        calibration_size=10000,
+    ) -> list:
+        """
+        Fit the intent engine from mini batches, without loading the dataset.
+
+        The first pass gets the classes, the document frequencies and a
+        reservoir sample of the held out examples, the next passes train the
+        classifier batch by batch, and the sample calibrates the probabilities.
+        The memory depends on the batch size and n_features, not the dataset.
+
+        :param batches: A function that returns an iterator of batches,
+            or a sequence of batches, every batch is a list of (text, intent).
+        :type batches: callable or list.
+        :param classes: All the intents, by default they are searched
+            in the first pass.
+        :type classes: list.
+        :param n_passes: The number of passes to train the classifier.
+        :type n_passes: int.
+        :param n_features: The number of columns of the hashing vectorizer,
+            by default the `n_features` of the engine.
+        :type n_features: int.
+        :param calibration_fraction: The fraction of the examples to hold out,
+            at least one example of every intent with more than one text.
+        :type calibration_fraction: float.
+        :param calibration_size: The maximum number of held out examples
+            to calibrate the probabilities, besides one of every intent.
+        :type calibration_size: int.
+        :return: The intents, in the order they were found.
+        :rtype: list.
+        """
+
+        if not callable(batches):
+            if iter(batches) is batches:
+                raise ValueError(
+                    "batches must be a function or a sequence, "
+                    "an iterator can only be read once"
+                )
+            batches = batches.__iter__
+
+        if n_features is not None:
+            self.n_features = n_features
+        self.vectorizer = self._build_hashing_vectorizer(self.n_features)
+        # Fresh steps, a previous fit may have other columns
+        self.model.steps = [
+            (name, sklearn_base.clone(step)) for name, step in self.model.steps
+        ]
+        tfidf = self.model.steps[0][1]
+        classifier = self.model.steps[-1][1]
+
+        (
+            intents,
+            calibration,
+            held_out,
+            document_frequencies,
+            documents,
+        ) = self._scan_stream(
+            batches(), self.n_features, calibration_fraction, calibration_size
+        )
+        if not documents or not calibration:
+            raise ValueError(
+                "There are not enough examples to train and calibrate, "
+                "check the calibration_fraction"
+            )
+
+        # The same smoothed idf that TfidfTransformer fits
+        tfidf.idf_ = np.log((1 + documents) / (1 + document_frequencies)) + 1
+        classes = np.array(intents if classes is None else classes)
+
+        for _ in range(n_passes):
+            for batch in batches():
+                batch = [
+                    (text_item, intent_item)
+                    for text_item, intent_item in batch
+                    if not self._is_calibration(
+                        text_item, calibration_fraction, held_out
+                    )
+                ]
+                if not batch:
+                    continue
+
+                texts, intent = zip(*batch)
+                features = tfidf.transform(self.vectorizer.transform(texts))
+                classifier.partial_fit(features, intent, classes=classes)
+
+        texts, intent = zip(*calibration)
+        self.calibrator = sklearn_calibration.CalibratedClassifierCV(
+            self.model, cv="prefit"
+        )
+        self.calibrator.fit(self.vectorizer.transform(texts), intent)
+        self.n_documents = documents
+        self._remember(texts, intent, clear=True)
+        return intents
+
+    def _update_idf(self, tfidf, counts):
+        """
+        Add the document frequencies of the new examples to the idf.
+
+        The smoothed idf is log((1 + n) / (1 + df)) + 1, so the document
+        frequencies are recovered from it and the number of documents.
+
+        :param tfidf: The fitted tfidf transformer.
+        :type tfidf: TfidfTransformer.
+        :param counts: The counts of the new examples, with the new columns.
+        :type counts: scipy.sparse.csr_matrix.
+        """
+
+        idf = np.asarray(tfidf.idf_, dtype=np.float64)
+        n_columns = counts.shape[1] - len(idf)
+        new_frequencies = np.bincount(counts.indices, minlength=counts.shape[1])
+
+        if self.n_documents is None:
+            # The new words are as rare as the rarest known one
+            idf = np.concatenate([idf, np.full(n_columns, idf.max())])
+        else:
+            frequencies = (1 + self.n_documents) / np.exp(idf - 1) - 1
+            frequencies = np.concatenate([np.rint(frequencies), np.zeros(n_columns)])
+            self.n_documents += counts.shape[0]
+            idf = np.log((1 + self.n_documents) / (1 + frequencies + new_frequencies))
+            idf += 1
+
+        tfidf.idf_ = idf
+        tfidf.n_features_in_ = len(idf)
+
+    def update(self, text, intent, n_passes=5, replay_ratio=4):
+        """
+        Update the intent engine with new examples, that can have new intents,
+        without fitting it again.
+
+        The new examples are mixed with a sample of the replay buffer, so the
+        known intents are not forgotten, and learned with `partial_fit`.
+        The calibration is fitted again on the same examples, so an update
+        costs a few passes over a sample proportional to the new examples.
+
+        :param text: The input texts.
+        :type text: list.
+        :param intent: The intents of the input texts.
+        :type intent: list.
+        :param n_passes: The number of passes over the new examples.
+        :type n_passes: int.
+        :param replay_ratio: The number of replayed examples for every new one.
+        :type replay_ratio: int.
+        """
+
+        text = list(text)
+        intent = list(intent)
+        tfidf = self.model.steps[0][1]
+        classifier = self.model.steps[-1][1]
+
+        replay_text, replay_intent = self._get_replay(replay_ratio * len(text))
+        n_columns = self._extend_vocabulary(text)
+        self._update_idf(tfidf, self.vectorizer.transform(text))
+        self._extend_estimator(classifier, n_columns, intent)
+        self._remember(text, intent)
+
+        counts = self.vectorizer.transform(text + replay_text)
+        features = tfidf.transform(counts)
+        for _ in range(n_passes):
+            classifier.partial_fit(
+                features, intent + replay_intent, classes=classifier.classes_
+            )
+
+        self.calibrator.fit(counts, intent + replay_intent)
@@ -1,9 +1,64 @@
 """
 The WorldVectorIntentEngine class module.
 """
-from nltk.corpus import stopwords
+import heapq
+import os
+from concurrent.futures import ProcessPoolExecutor
+from copy import copy as shallow_copy
+from functools import partial
+from typing import TYPE_CHECKING
+
+import numpy as np
 from peque_nlu.intent_engines import BasicIntentEngine
-from peque_nlu.utils import glove_load
+from peque_nlu.metrics import INSTRUMENTATION
+from peque_nlu.utils import LazyModule, WordVectors
+
+if TYPE_CHECKING:
+    from gensim.models.keyedvectors import KeyedVectors
+
+ot = LazyModule("ot")
+scipy_distance = LazyModule("scipy.spatial.distance")
+nltk_corpus = LazyModule("nltk.corpus")
+
+# Relative tolerance, so a bound equal to a distance never prunes it
+BOUND_TOLERANCE = 1e-9
+
+_worker_engine = None
+
+
+def _init_worker(intent_engine):
+    """
+    Initialize a predict worker process with the fitted intent engine.
+
+    :param intent_engine: The fitted intent engine.
+    :type intent_engine: WorldVectorIntentEngine.
+    """
+
+    global _worker_engine  # pylint: disable=global-statement
+    _worker_engine = intent_engine
+
+
+def _predict_chunk(texts, k=1) -> tuple:
+    """
+    Predict a chunk of texts in a worker process.
+
+    :param texts: The input texts.
+    :type texts: list.
+    :param k: The number of intents of every text.
+    :type k: int.
+    :return: The intents, the probabilities and the exact and skipped solves.
+    :rtype: tuple.
+    """
+
+    exact_solves = _worker_engine.exact_solves
+    skipped_solves = _worker_engine.skipped_solves
+    intents, probabilities = _worker_engine.predict_topk_batch(texts, k)
+    return (
+        intents,
+        probabilities,
+        _worker_engine.exact_solves - exact_solves,
+        _worker_engine.skipped_solves - skipped_solves,
+    )
 
 
 class WorldVectorIntentEngine(BasicIntentEngine):
@@ -13,9 +68,44 @@ class WorldVectorIntentEngine(BasicIntentEngine):
     This class is used to create a world vector intent engine.
     This works by checking using the glove vectors, to check if there are
     similarities between the input text and the examples.
+
+    The nearest example is searched with two cheap lower bounds of the
+    Word Mover's Distance, the word centroid distance and the relaxed WMD,
+    so the exact distance is only solved for the examples that could still
+    be the nearest one. `exact_solves` and `skipped_solves` count them.
+
+    The distances between the words of a predict batch and the vocabulary of
+    the examples are computed once, every distance is solved from a slice.
+
+    With `n_jobs` the batches of at least `min_parallel_batch` texts are split
+    across worker processes, that receive the fitted engine once on start.
+
+    The glove vectors are shared with the other components that use the same
+    model, through the `word_vectors` handle.
+
+    With `update` the new examples are appended to the index, only the
+    new words and examples are computed.
+
+    With `predict_topk` the intents are ranked by the distance of their
+    nearest example, an example is only solved if it could still be the
+    nearest one of its intent and of the k nearest intents.
+
+    With `quantize` the glove vectors are stored as float16 or int8, and only
+    the vectors of the predicted words are converted back.
     """
 
-    def __init__(self, language, gensim_model=None):
+    examples = None
+    example_centroids = None
+    vocabulary = None
+    vocabulary_index = None
+    vocabulary_vectors = None
+    exact_solves = 0
+    skipped_solves = 0
+    n_jobs = None
+    min_parallel_batch = 16
+    _executor = None
+
+    def __init__(self, language, gensim_model=None, n_jobs=None):
         """
         Initialize the WorldVectorIntentEngine.
 
@@ -25,52 +115,462 @@ class WorldVectorIntentEngine(BasicIntentEngine):
         :param gensim_model: The gensim model to use.
             It can be a model name (str) or a KeyedVectors object.
         :type gensim_model: str or KeyedVectors.
+
+        :param n_jobs: The number of worker processes to predict,
+            -1 to use all the cpus. By default the texts are predicted
+            in the current process.
+        :type n_jobs: int.
         """
 
-        self.stopwords = stopwords.words(language)
+        self.stopwords = nltk_corpus.stopwords.words(language)
         self.json_dataset = None
-        self.glove_vectors = glove_load(gensim_model)
+        self.word_vectors = WordVectors(gensim_model)
+        self.n_jobs = n_jobs
 
-    def _pred(self, text) -> tuple:
+    @property
+    def glove_vectors(self) -> "KeyedVectors":
         """
-        Predict the intent of the input text.
+        The shared glove vectors of the word vectors handle.
 
-        :param text: The input text.
-        :type text: str.
-        :return: The intent and the probability.
+        :return: The glove vectors.
+        :rtype: KeyedVectors.
+        """
+
+        return self.word_vectors.vectors
+
+    def __getstate__(self) -> dict:
+        """
+        Get the state to pickle, without the worker processes.
+
+        :return: The state.
+        :rtype: dict.
+        """
+
+        state = self.__dict__.copy()
+        state.pop("_executor", None)
+        return state
+
+    def __setstate__(self, state):
+        """
+        Set the pickled state, the glove vectors of a pickle saved before the
+        `word_vectors` handle are moved to a handle and indexed again.
+
+        :param state: The state.
+        :type state: dict.
+        """
+
+        state = dict(state)
+        glove_vectors = state.pop("glove_vectors", None)
+        self.__dict__.update(state)
+        if glove_vectors is not None:
+            self.word_vectors = WordVectors(glove_vectors)
+            if self.json_dataset is not None:
+                self._build_index()
+
+    def _get_n_jobs(self) -> int:
+        """
+        Get the number of worker processes to use.
+
+        :return: The number of worker processes.
+        :rtype: int.
+        """
+
+        if self.n_jobs is None:
+            return 1
+        if self.n_jobs < 0:
+            return os.cpu_count() or 1
+        return self.n_jobs
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """
+        Get the worker processes, starting them if needed.
+
+        :return: The executor.
+        :rtype: ProcessPoolExecutor.
+        """
+
+        if self._executor is None:
+            worker_engine = WorldVectorIntentEngine.__new__(WorldVectorIntentEngine)
+            worker_engine.__dict__.update(self.__getstate__())
+            worker_engine.n_jobs = None
+
+            self._executor = ProcessPoolExecutor(
+                max_workers=self._get_n_jobs(),
+                initializer=_init_worker,
+                initargs=(worker_engine,),
+            )
+        return self._executor
+
+    def close(self):
+        """
+        Stop the worker processes, if any.
+        """
+
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _nbow(self, words) -> tuple:
+        """
+        Get the normalized bag of words of a document, like `wmdistance` does.
+
+        :param words: The words of the document.
+        :type words: list.
+        :return: The unique words in the glove vectors and their weights.
         :rtype: tuple.
         """
-        text = text.lower().split()
 
-        results = []
+        words = [word for word in words if word in self.glove_vectors]
+        if not words:
+            return [], None
+
+        unique, counts = np.unique(words, return_counts=True)
+        return list(unique), counts / len(words)
+
+    def _unit_vectors(self, words) -> np.ndarray:
+        """
+        Get the unit vectors of the words.
+
+        :param words: The words, they must be in the glove vectors.
+        :type words: list.
+        :return: A (words, vector size) matrix.
+        :rtype: np.ndarray.
+        """
+
+        if not words:
+            return np.zeros((0, self.glove_vectors.vector_size), dtype=np.float32)
+        return np.array([self.glove_vectors.get_vector(w, norm=True) for w in words])
+
+    def _build_index(self):
+        """
+        Build the examples index.
+
+        All the examples share a vocabulary, every example is stored as the
+        vocabulary indices of its words, their weights and its centroid.
+        """
+
+        self.examples = []
+        self.vocabulary = []
+        self.vocabulary_index = {}
+        self.vocabulary_vectors = self._unit_vectors([])
+        self.example_centroids = np.zeros((0, self.glove_vectors.vector_size))
+
         for intent, examples in self.json_dataset.items():
-            for example in examples:
-                example = example.lower().split()
-                similarity = self.glove_vectors.wmdistance(text, example)
-                results.append((intent, similarity))
+            self._index_examples(examples, [intent] * len(examples))
 
-        results = sorted(results, key=lambda x: x[1])
-        return results[0]
+    def _index_examples(self, text, intent):
+        """
+        Append examples to the index, with their new words.
 
-    def predict(self, text) -> tuple:
+        :param text: The examples.
+        :type text: list.
+        :param intent: The intents of the examples.
+        :type intent: list.
         """
-        Predict the intent of the input text.
+
+        vocabulary = self.vocabulary_index
+        if vocabulary is None:
+            vocabulary = {w: i for i, w in enumerate(self.vocabulary)}
+            self.vocabulary_index = vocabulary
+
+        new_words = []
+        examples = []
+        for text_item, intent_item in zip(text, intent):
+            words, weights = self._nbow(text_item.lower().split())
+            for word in words:
+                if word not in vocabulary:
+                    vocabulary[word] = len(vocabulary)
+                    new_words.append(word)
+
+            indices = np.array([vocabulary[w] for w in words], dtype=np.intp)
+            examples.append((intent_item, indices, weights))
+
+        # A loaded index can have arrays or tuples instead of lists
+        if not isinstance(self.vocabulary, list):
+            self.vocabulary = list(self.vocabulary)
+        if not isinstance(self.examples, list):
+            self.examples = list(self.examples)
+
+        self.vocabulary.extend(new_words)
+        self.vocabulary_vectors = np.concatenate(
+            [self.vocabulary_vectors, self._unit_vectors(new_words)]
+        )
+
+        centroids = np.full((len(examples), self.glove_vectors.vector_size), np.inf)
+        for position, (_, indices, weights) in enumerate(examples):
+            if weights is not None:
+                centroids[position] = weights @ self.vocabulary_vectors[indices]
+
+        self.examples.extend(examples)
+        self.example_centroids = np.concatenate([self.example_centroids, centroids])
+
+    def _word_distances(self, texts) -> tuple:
+        """
+        Get the distances between the words of the texts and the vocabulary.
+
+        :param texts: The tokenized texts.
+        :type texts: list.
+        :return: The row of every word, their unit vectors
+            and the (words, vocabulary) distances matrix.
+        :rtype: tuple.
+        """
+
+        words = sorted({w for text in texts for w in text if w in self.glove_vectors})
+        vectors = self._unit_vectors(words)
+        distances = scipy_distance.cdist(vectors, self.vocabulary_vectors)
+        return {w: row for row, w in enumerate(words)}, vectors, distances
+
+    def _wmdistance(self, weights, example_weights, costs) -> float:
+        """
+        Get the Word Mover's Distance from the costs between the words,
+        with the same special cases as `wmdistance`.
+
+        :param weights: The normalized bag of words of the text.
+        :type weights: np.ndarray.
+        :param example_weights: The normalized bag of words of the example.
+        :type example_weights: np.ndarray.
+        :param costs: The distances between the words of the text and example.
+        :type costs: np.ndarray.
+        :return: The distance.
+        :rtype: float.
+        """
+
+        if costs.shape == (1, 1) and costs[0, 0] == 0:
+            return 0.0
+
+        if abs(np.sum(costs)) < 1e-8:
+            return float("inf")
+
+        return ot.emd2(weights, example_weights, costs)
+
+    def _nearest(self, weights, centroid, distances, k=1) -> list:
+        """
+        Search the nearest example of the k nearest intents, solving the
+        exact distance only for the examples whose lower bounds could still
+        beat the nearest example of their intent and the k-th nearest intent.
+
+        :param weights: The normalized bag of words of the text.
+        :type weights: np.ndarray.
+        :param centroid: The centroid of the text.
+        :type centroid: np.ndarray.
+        :param distances: The distances between the text words and the vocabulary.
+        :type distances: np.ndarray.
+        :param k: The number of intents.
+        :type k: int.
+        :return: The distance and the index of the nearest example of up to
+            k intents, the nearest first.
+        :rtype: list.
+        """
+
+        centroid_distances = np.linalg.norm(self.example_centroids - centroid, axis=1)
+
+        # The ties are broken by the index of the example, like `min`
+        no_match = (float("inf"), len(self.examples))
+        nearest = {}
+        kth = no_match
+        for position, index in enumerate(np.argsort(centroid_distances, kind="stable")):
+            if centroid_distances[index] * (1 - BOUND_TOLERANCE) > kth[0]:
+                self.skipped_solves += len(self.examples) - position
+                break
+
+            intent, indices, example_weights = self.examples[index]
+            if example_weights is None:
+                self.skipped_solves += 1
+                continue
+
+            costs = distances[:, indices]
+            bound = max(
+                weights @ costs.min(axis=1),
+                example_weights @ costs.min(axis=0),
+            )
+            bound = bound * (1 - BOUND_TOLERANCE)
+            if (bound, index) > min(nearest.get(intent, no_match), kth):
+                self.skipped_solves += 1
+                continue
+
+            self.exact_solves += 1
+            distance = (self._wmdistance(weights, example_weights, costs), index)
+            if distance < nearest.get(intent, no_match):
+                nearest[intent] = distance
+                if len(nearest) >= k:
+                    kth = heapq.nsmallest(k, nearest.values())[-1]
+
+        return sorted(nearest.values())[:k]
+
+    def _pred(self, text, word_distances=None, k=1) -> tuple:
+        """
+        Predict the k nearest intents of the input text.
 
         :param text: The input text.
         :type text: str.
-        :return: The intent and the probability.
+        :param word_distances: The `_word_distances` of a batch with the text.
+        :type word_distances: tuple.
+        :param k: The number of intents, at most all of them.
+        :type k: int.
+        :return: The intents and the distances of their nearest examples,
+            the intents without a match are last with an infinite distance.
+        :rtype: tuple.
+        """
+        if self.examples is None or self.vocabulary is None:
+            self._build_index()
+
+        text = text.lower().split()
+        if word_distances is None:
+            word_distances = self._word_distances([text])
+        rows, vectors, distances = word_distances
+
+        nearest = []
+        words, weights = self._nbow(text)
+        if words:
+            rows = [rows[word] for word in words]
+            nearest = self._nearest(
+                weights, weights @ vectors[rows], distances[rows], k
+            )
+
+        intents = [self.examples[index][0] for _, index in nearest]
+        probabilities = [distance for distance, _ in nearest]
+        for intent in self.json_dataset:
+            if len(intents) >= k:
+                break
+            if intent not in intents:
+                intents.append(intent)
+                probabilities.append(float("inf"))
+        return intents, probabilities
+
+    def _get_k(self, k) -> int:
+        """
+        Get the number of intents to predict, at least one and at most all.
+
+        :param k: The requested number of intents.
+        :type k: int.
+        :return: The number of intents.
+        :rtype: int.
+        """
+
+        return max(1, min(k, len(self.json_dataset)))
+
+    def predict_topk_batch(self, texts, k=1) -> tuple:
+        """
+        Predict the k nearest intents of the input texts in the current process.
+
+        :param texts: The input texts.
+        :type texts: list.
+        :param k: The number of intents of every text.
+        :type k: int.
+        :return: The intents and the distances of every text.
         :rtype: tuple.
         """
 
+        if self.examples is None or self.vocabulary is None:
+            self._build_index()
+
+        k = self._get_k(k)
+        word_distances = self._word_distances([t.lower().split() for t in texts])
+
         intents = []
         probabilities = []
 
-        for text_item in text:
-            result = self._pred(text_item)
+        for text_item in texts:
+            result = self._pred(text_item, word_distances, k)
             intents.append(result[0])
             probabilities.append(result[1])
         return intents, probabilities
 
+    def predict_batch(self, texts) -> tuple:
+        """
+        Predict the intent of the input texts in the current process.
+
+        :param texts: The input texts.
+        :type texts: list.
+        :return: The intents and the probabilities.
+        :rtype: tuple.
+        """
+
+        intents, probabilities = self.predict_topk_batch(texts, 1)
+        return [i[0] for i in intents], [p[0] for p in probabilities]
+
+    def predict(self, text) -> tuple:
+        """
+        Predict the intent of the input text, the nearest of `predict_topk`.
+
+        :param text: The input text.
+        :type text: str.
+        :return: The intent and the probability.
+        :rtype: tuple.
+        """
+
+        intents, probabilities = self.predict_topk(text, 1)
+        return intents[:, 0].tolist(), probabilities[:, 0].tolist()
+
+    def predict_topk(self, text, k=1) -> tuple:
+        """
+        Predict the k nearest intents of the input texts, by the distance of
+        their nearest example.
+
+        :param text: The input texts.
+        :type text: list.
+        :param k: The number of intents of every text, at most all of them.
+        :type k: int.
+        :return: The (texts, k) arrays of the intents and their distances,
+            the nearest first.
+        :rtype: tuple.
+        """
+
+        if self.examples is None or self.vocabulary is None:
+            self._build_index()
+
+        k = self._get_k(k)
+        text = list(text)
+        n_jobs = self._get_n_jobs()
+
+        start = INSTRUMENTATION.start()
+        if n_jobs < 2 or len(text) < self.min_parallel_batch:
+            intents, probabilities = self.predict_topk_batch(text, k)
+        else:
+            chunk_size = -(-len(text) // n_jobs)
+            chunks = [
+                text[position : position + chunk_size]
+                for position in range(0, len(text), chunk_size)
+            ]
+
+            intents = []
+            probabilities = []
+            for result in self._get_executor().map(
+                partial(_predict_chunk, k=k), chunks
+            ):
+                intents.extend(result[0])
+                probabilities.extend(result[1])
+                self.exact_solves += result[2]
+                self.skipped_solves += result[3]
+        INSTRUMENTATION.stop("engine.predict", start, len(text))
+
+        shape = (len(text), k)
+        return (
+            np.array(intents, dtype=object).reshape(shape),
+            np.array(probabilities, dtype=np.float64).reshape(shape),
+        )
+
+    def quantize(self, dtype="int8") -> "WorldVectorIntentEngine":
+        """
+        Get a copy of the intent engine with quantized glove vectors, its
+        index is built again from them.
+
+        :param dtype: The reduced precision, "float16" or "int8".
+        :type dtype: str.
+        :return: The quantized intent engine.
+        :rtype: WorldVectorIntentEngine.
+        """
+
+        quantized = shallow_copy(self)
+        quantized._executor = None  # pylint: disable=protected-access
+        quantized.word_vectors = self.word_vectors.quantize(dtype)
+        if self.json_dataset is not None:
+            quantized.json_dataset = {
+                intent: list(examples) for intent, examples in self.json_dataset.items()
+            }
+            quantized._build_index()  # pylint: disable=protected-access
+        return quantized
+
     def fit(self, text, intent):
         """
         Fit the intent engine to train the model.
@@ -81,6 +581,7 @@ class WorldVectorIntentEngine(BasicIntentEngine):
         :type intent: str.
         """
 
+        self.close()
         self.json_dataset = {}
 
         for text_item, intent_item in zip(text, intent):
@@ -88,3 +589,30 @@ class WorldVectorIntentEngine(BasicIntentEngine):
                 self.json_dataset[intent_item] = []
 
             self.json_dataset[intent_item].append(text_item)
+
+        self._build_index()
+
+    def update(self, text, intent):
+        """
+        Update the intent engine with new examples, that can have new intents,
+        appending them to the index.
+
+        :param text: The input texts.
+        :type text: list.
+        :param intent: The intents of the input texts.
+        :type intent: list.
+        """
+
+        if self.json_dataset is None:
+            raise ValueError("The intent engine must be fitted before updating it")
+        if self.examples is None or self.vocabulary is None:
+            self._build_index()
+
+        # The worker processes have the previous index
+        self.close()
+
+        text = list(text)
+        intent = list(intent)
+        for text_item, intent_item in zip(text, intent):
+            self.json_dataset.setdefault(intent_item, []).append(text_item)
+        self._index_examples(text, intent)
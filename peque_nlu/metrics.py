@@ -0,0 +1,348 @@
+"""
+The metrics module.
+
+The classifiers, engines and feature extractors time their stages with
+`INSTRUMENTATION`, and send the seconds and the number of texts to its sinks.
+Without sinks the timers are not started, so it costs a couple of calls.
+
+example:
+    registry = INSTRUMENTATION.add_sink(MetricsRegistry())
+    model.multiple_predict(texts)
+    registry.snapshot()["engine.transform"]["count"] -> 1
+    format_prometheus(registry.snapshot())
+"""
+import bisect
+import threading
+import time
+
+# The upper bounds in seconds of the histogram buckets
+DEFAULT_BUCKETS = (
+    0.00001,
+    0.000025,
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+class Instrumentation:
+    """
+    The Instrumentation class.
+
+    This class sends the timings of the stages to the sinks, a sink is an
+    object with a `record(stage, seconds, items)` method or a function with
+    the same arguments.
+    """
+
+    def __init__(self):
+        """
+        Initialize the Instrumentation, without sinks.
+        """
+
+        # A tuple, so the sinks can be changed while other threads record
+        self.sinks = ()
+
+    @property
+    def enabled(self) -> bool:
+        """
+        If there is any sink.
+
+        :return: True if the stages are timed.
+        :rtype: bool.
+        """
+
+        return bool(self.sinks)
+
+    def add_sink(self, sink):
+        """
+        Add a sink.
+
+        :param sink: The sink, with a record method or a function.
+        :type sink: MetricsRegistry or callable.
+        :return: The sink.
+        :rtype: MetricsRegistry or callable.
+        """
+
+        self.sinks = self.sinks + (sink,)
+        return sink
+
+    def remove_sink(self, sink):
+        """
+        Remove a sink.
+
+        :param sink: The sink to remove.
+        :type sink: MetricsRegistry or callable.
+        """
+
+        self.sinks = tuple(s for s in self.sinks if s is not sink)
+
+    def start(self) -> float:
+        """
+        Start timing a stage.
+
+        :return: The start time, None if there are no sinks.
+        :rtype: float.
+        """
+
+        if not self.sinks:
+            return None
+        return time.perf_counter()
+
+    def stop(self, stage, start, items=1):
+        """
+        Stop timing a stage and send it to the sinks.
+
+        :param stage: The name of the stage.
+        :type stage: str.
+        :param start: The start time of `start`, None to ignore the stage.
+        :type start: float.
+        :param items: The number of texts of the stage.
+        :type items: int.
+        """
+
+        if start is None:
+            return
+
+        seconds = time.perf_counter() - start
+        for sink in self.sinks:
+            record = getattr(sink, "record", sink)
+            record(stage, seconds, items)
+
+
+class Histogram:
+    """
+    The Histogram class.
+
+    This class counts the observations in buckets with fixed upper bounds,
+    like the Prometheus histograms.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        Initialize the Histogram.
+
+        :param buckets: The sorted upper bounds of the buckets.
+        :type buckets: tuple.
+        """
+
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.items = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value, items=1):
+        """
+        Add an observation.
+
+        :param value: The observed value.
+        :type value: float.
+        :param items: The number of items of the observation.
+        :type items: int.
+        """
+
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.items += items
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def snapshot(self) -> dict:
+        """
+        Get the state of the histogram.
+
+        :return: The count, items, sum, max and the cumulative counts of
+            every bucket, the last one is infinite.
+        :rtype: dict.
+        """
+
+        cumulative = []
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            cumulative.append((bound, total))
+
+        return {
+            "count": self.count,
+            "items": self.items,
+            "sum": self.sum,
+            "max": self.max,
+            "buckets": cumulative,
+        }
+
+
+class MetricsRegistry:
+    """
+    The MetricsRegistry class.
+
+    This class is an in memory sink, with a histogram of the seconds of
+    every stage.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        Initialize the MetricsRegistry.
+
+        :param buckets: The upper bounds in seconds of the histogram buckets.
+        :type buckets: tuple.
+        """
+
+        self.buckets = buckets
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def record(self, stage, seconds, items=1):
+        """
+        Record the seconds of a stage.
+
+        :param stage: The name of the stage.
+        :type stage: str.
+        :param seconds: The seconds of the stage.
+        :type seconds: float.
+        :param items: The number of texts of the stage.
+        :type items: int.
+        """
+
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram(self.buckets)
+            histogram.observe(seconds, items)
+
+    def snapshot(self) -> dict:
+        """
+        Get the histograms of every stage.
+
+        :return: The `Histogram.snapshot` of every stage.
+        :rtype: dict.
+        """
+
+        with self.lock:
+            return {
+                stage: histogram.snapshot()
+                for stage, histogram in sorted(self.histograms.items())
+            }
+
+    def reset(self):
+        """
+        Remove all the histograms.
+        """
+
+        with self.lock:
+            self.histograms = {}
+
+
+def format_prometheus(snapshot, name="peque_nlu_stage") -> str:
+    """
+    Format a registry snapshot in the Prometheus text format.
+
+    :param snapshot: The `MetricsRegistry.snapshot`.
+    :type snapshot: dict.
+    :param name: The prefix of the metric names.
+    :type name: str.
+    :return: The metrics text.
+    :rtype: str.
+    """
+
+    lines = [
+        f"# HELP {name}_seconds The seconds of every stage.",
+        f"# TYPE {name}_seconds histogram",
+    ]
+    for stage, histogram in snapshot.items():
+        for bound, count in histogram["buckets"]:
+            bound = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(
+                f'{name}_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}'
+            )
+        lines.append(f'{name}_seconds_sum{{stage="{stage}"}} {histogram["sum"]!r}')
+        lines.append(f'{name}_seconds_count{{stage="{stage}"}} {histogram["count"]}')
+
+    lines.append(f"# HELP {name}_items_total The texts of every stage.")
+    lines.append(f"# TYPE {name}_items_total counter")
+    for stage, histogram in snapshot.items():
+        lines.append(f'{name}_items_total{{stage="{stage}"}} {histogram["items"]}')
+
+    return "\n".join(lines) + "\n"
+
+
+def _escape_label(value) -> str:
+    """
+    Escape a label value of the Prometheus text format.
+
+    :param value: The label value.
+    :type value: str.
+    :return: The escaped value.
+    :rtype: str.
+    """
+
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_registry_prometheus(stats, name="peque_nlu_models") -> str:
+    """
+    Format the statistics of a model registry in the Prometheus text format.
+
+    :param stats: The `ModelRegistry.stats`.
+    :type stats: dict.
+    :param name: The prefix of the metric names.
+    :type name: str.
+    :return: The metrics text.
+    :rtype: str.
+    """
+
+    lines = [
+        f"# HELP {name}_resident_bytes The bytes of the arrays of every model, "
+        "without the shared word vectors.",
+        f"# TYPE {name}_resident_bytes gauge",
+    ]
+    for tenant, size in stats["sizes"].items():
+        lines.append(
+            f'{name}_resident_bytes{{tenant="{_escape_label(tenant)}"}} {size}'
+        )
+    lines.append(f"# HELP {name}_vector_bytes The bytes of the shared word vectors.")
+    lines.append(f"# TYPE {name}_vector_bytes gauge")
+    for key, size in stats["vector_sizes"].items():
+        lines.append(f'{name}_vector_bytes{{key="{_escape_label(key)}"}} {size}')
+
+    gauges = [
+        ("loaded", stats["models"], "The loaded models."),
+        ("bytes", stats["bytes"], "The bytes of the loaded models."),
+        ("max_bytes", stats["max_bytes"], "The bytes budget of the models."),
+    ]
+    counters = [
+        ("hits", stats["hits"], "The gets of loaded models."),
+        ("misses", stats["misses"], "The gets that loaded or waited for a model."),
+        ("loads", stats["loads"], "The loaded models."),
+        ("shared_loads", stats["shared_loads"], "The gets that waited for a load."),
+        ("load_errors", stats["load_errors"], "The failed loads."),
+        ("load_seconds", stats["load_seconds"], "The seconds of the loads."),
+        ("evictions", stats["evictions"], "The evicted models."),
+    ]
+    for kind, metrics in (("gauge", gauges), ("counter", counters)):
+        for metric, value, description in metrics:
+            if value is None:
+                continue
+            metric = f"{name}_{metric}" + ("_total" if kind == "counter" else "")
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} {kind}")
+            lines.append(f"{metric} {value!r}")
+
+    return "\n".join(lines) + "\n"
+
+
+INSTRUMENTATION = Instrumentation()
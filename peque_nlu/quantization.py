@@ -0,0 +1,296 @@
+"""
+The quantization module.
+
+The weights of the linear engines and the word vectors are stored with
+reduced precision, as float16 or as int8 with a scale for every row, and read
+a few rows at a time, so the full precision matrices are never rebuilt.
+
+example:
+    quantized = model.quantize("int8")
+    quantization_report(model, texts, intents, "int8")["saving"] -> 0.87
+"""
+import numpy as np
+
+QUANTIZED_DTYPES = ("float16", "int8")
+
+# The rows quantized at a time, so a big matrix is never copied in float
+QUANTIZE_ROWS = 1 << 16
+
+
+class QuantizedArray:
+    """
+    The QuantizedArray class.
+
+    This class is a matrix stored as float16, or as int8 with the scale of
+    every row, the largest absolute value of the row over 127. Indexing it
+    gives the rows back in their original dtype, only the indexed rows are
+    converted.
+    """
+
+    scales = None
+
+    def __init__(self, array, dtype="int8"):
+        """
+        Quantize a matrix.
+
+        :param array: The matrix to quantize, a QuantizedArray of the same
+            dtype shares its values.
+        :type array: np.ndarray or QuantizedArray.
+        :param dtype: The reduced precision, "float16" or "int8".
+        :type dtype: str.
+        """
+
+        if dtype not in QUANTIZED_DTYPES:
+            raise ValueError(
+                f"The dtype must be one of {QUANTIZED_DTYPES}, not {dtype}"
+            )
+
+        if isinstance(array, QuantizedArray) and array.values.dtype == dtype:
+            self.float_dtype = array.float_dtype
+            self.values = array.values
+            self.scales = array.scales
+            return
+
+        array = np.asarray(array)
+        if array.ndim != 2:
+            raise ValueError("Only matrices can be quantized")
+
+        self.float_dtype = array.dtype.name
+        if dtype == "float16":
+            if array.size and np.abs(array).max() > np.finfo(np.float16).max:
+                raise ValueError("The values are too big for float16, use int8")
+            self.values = array.astype(np.float16)
+            return
+
+        self.values = np.empty(array.shape, dtype=np.int8)
+        self.scales = np.empty(len(array), dtype=np.float32)
+        for start in range(0, len(array), QUANTIZE_ROWS):
+            rows = array[start : start + QUANTIZE_ROWS]
+            scales = np.abs(rows).max(axis=1, initial=0) / 127
+            self.scales[start : start + len(rows)] = scales
+            scales[scales == 0] = 1
+            self.values[start : start + len(rows)] = np.rint(rows / scales[:, None])
+
+    @property
+    def shape(self) -> tuple:
+        """
+        The shape of the matrix.
+
+        :return: The rows and columns.
+        :rtype: tuple.
+        """
+
+        return self.values.shape
+
+    @property
+    def nbytes(self) -> int:
+        """
+        The bytes of the values and the scales.
+
+        :return: The bytes.
+        :rtype: int.
+        """
+
+        if self.scales is None:
+            return self.values.nbytes
+        return self.values.nbytes + self.scales.nbytes
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __getitem__(self, rows) -> np.ndarray:
+        """
+        Get rows in their original dtype.
+
+        :param rows: A row, a slice or a list of rows.
+        :type rows: int or slice or list.
+        :return: The rows.
+        :rtype: np.ndarray.
+        """
+
+        values = self.values[rows].astype(self.float_dtype)
+        if self.scales is None:
+            return values
+        return values * self.scales[rows][..., np.newaxis]
+
+    # The copy argument of NumPy 2, the rows are always a new array
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        del copy
+        values = self[:]
+        return values if dtype is None else values.astype(dtype)
+
+
+class QuantizedVectors:
+    """
+    The QuantizedVectors class.
+
+    This class is the part of the gensim KeyedVectors used by the word vector
+    components, with the vectors in a QuantizedArray.
+    """
+
+    def __init__(self, keyed_vectors, dtype="int8"):
+        """
+        Quantize word vectors.
+
+        :param keyed_vectors: The word vectors to quantize.
+        :type keyed_vectors: KeyedVectors or QuantizedVectors.
+        :param dtype: The reduced precision, "float16" or "int8".
+        :type dtype: str.
+        """
+
+        self.index_to_key = list(keyed_vectors.index_to_key)
+        self.key_to_index = dict(keyed_vectors.key_to_index)
+        self.vector_size = keyed_vectors.vector_size
+        self.vectors = QuantizedArray(keyed_vectors.vectors, dtype)
+
+    def __len__(self) -> int:
+        return len(self.index_to_key)
+
+    def __contains__(self, key) -> bool:
+        return key in self.key_to_index
+
+    def __getitem__(self, keys) -> np.ndarray:
+        """
+        Get the vector of a key, or the matrix of a list of keys.
+
+        :param keys: The key or the keys.
+        :type keys: str or list.
+        :return: The vectors.
+        :rtype: np.ndarray.
+        """
+
+        if isinstance(keys, str):
+            return self.vectors[self.key_to_index[keys]]
+        return self.vectors[[self.key_to_index[key] for key in keys]]
+
+    def get_vector(self, key, norm=False) -> np.ndarray:
+        """
+        Get the vector of a key, like `KeyedVectors.get_vector`.
+
+        :param key: The key.
+        :type key: str.
+        :param norm: Get the unit vector.
+        :type norm: bool.
+        :return: The vector.
+        :rtype: np.ndarray.
+        """
+
+        vector = self[key]
+        if not norm:
+            return vector
+
+        length = np.linalg.norm(vector)
+        return vector / length if length else vector
+
+
+def get_nbytes(value, memo=None) -> int:
+    """
+    Get the bytes of the arrays of an object graph, the shared arrays are
+    counted once.
+
+    :param value: The object, like a classifier.
+    :type value: object.
+    :param memo: The objects already counted, by id.
+    :type memo: dict.
+    :return: The bytes.
+    :rtype: int.
+
+    example: get_nbytes({"a": np.zeros(2), "b": np.zeros(2, np.int8)}) -> 18
+    """
+
+    if value is None or isinstance(value, (bool, int, float, str, bytes)):
+        return 0
+
+    # The objects are kept, so the ids of the states copies are never reused
+    memo = {} if memo is None else memo
+    if id(value) in memo:
+        return 0
+    memo[id(value)] = value
+
+    if isinstance(value, (np.ndarray, QuantizedArray)):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(get_nbytes(v, memo) for v in value.values())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sum(get_nbytes(v, memo) for v in value)
+
+    # object.__getstate__ is only defined since Python 3.11
+    getstate = getattr(type(value), "__getstate__", None)
+    if getstate is not None and getstate is not getattr(object, "__getstate__", None):
+        state = value.__getstate__()
+    else:
+        state = vars(value) if hasattr(value, "__dict__") else None
+    return get_nbytes(state, memo) if isinstance(state, dict) else 0
+
+
+def _get_agreement(first, second) -> float:
+    """
+    Get the fraction of equal values.
+
+    :param first: The first values.
+    :type first: list.
+    :param second: The second values.
+    :type second: list.
+    :return: The agreement, from 0 to 1.
+    :rtype: float.
+    """
+
+    return float(np.mean([a == b for a, b in zip(first, second)]))
+
+
+def quantization_report(model, texts, intents=None, dtype="int8", threshold=0.2):
+    """
+    Compare a classifier with its quantized copy.
+
+    :param model: The fitted classifier.
+    :type model: ModelIntentClassifier.
+    :param texts: The texts to predict.
+    :type texts: list.
+    :param intents: The true intents of the texts, to get the accuracies.
+    :type intents: list.
+    :param dtype: The reduced precision, "float16" or "int8".
+    :type dtype: str.
+    :param threshold: The threshold of the features.
+    :type threshold: float or dict.
+    :return: The bytes of the arrays of both models and the saving, the
+        agreement of their best intents and of their features, and with the
+        intents their accuracies and its change.
+    :rtype: dict.
+    """
+
+    quantized = model.quantize(dtype)
+    texts = list(texts)
+    predictions = model.multiple_predict(texts, threshold)
+    quantized_predictions = quantized.multiple_predict(texts, threshold)
+
+    nbytes = get_nbytes(model)
+    quantized_nbytes = get_nbytes(quantized)
+    report = {
+        "dtype": dtype,
+        "bytes": nbytes,
+        "quantized_bytes": quantized_nbytes,
+        "saving": 1 - quantized_nbytes / nbytes if nbytes else 0.0,
+        "agreement": _get_agreement(
+            [p["intent"] for p in predictions],
+            [p["intent"] for p in quantized_predictions],
+        ),
+    }
+
+    if model.feature_extractor is not None:
+        report["features_agreement"] = _get_agreement(
+            [{(f["word"], f["entity"]) for f in p["features"]} for p in predictions],
+            [
+                {(f["word"], f["entity"]) for f in p["features"]}
+                for p in quantized_predictions
+            ],
+        )
+
+    if intents is not None:
+        intents = list(intents)
+        report["accuracy"] = _get_agreement([p["intent"] for p in predictions], intents)
+        report["quantized_accuracy"] = _get_agreement(
+            [p["intent"] for p in quantized_predictions], intents
+        )
+        report["accuracy_change"] = report["quantized_accuracy"] - report["accuracy"]
+
+    return report
@@ -0,0 +1,291 @@
+"""
+The registry module.
+
+The ModelRegistry keeps the models of many tenants, like one classifier per
+bot, loading every model on its first use and evicting the least recently
+used ones when their arrays exceed a memory budget.
+
+example:
+    registry = ModelRegistry(NumpySaver(), lambda tenant: f"models/{tenant}",
+                             max_bytes=2 << 30)
+    registry.get("bot_a").predict("hola")
+    registry.stats()["evictions"] -> 0
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from peque_nlu.metrics import INSTRUMENTATION
+from peque_nlu.quantization import get_nbytes
+from peque_nlu.utils import VECTOR_REGISTRY
+
+
+class ModelRegistry:
+    """
+    The ModelRegistry class.
+
+    This class loads the model of a tenant with the saver the first time it
+    is used. The concurrent gets of a model that is loading wait for the
+    same load, and a failed load is raised to all of them and tried again
+    by the next get.
+
+    The size of a model is the bytes of its arrays, without the word vectors
+    of the VECTOR_REGISTRY. The word vectors shared by the models of many
+    tenants are counted once, until the last of them is evicted. When the
+    bytes exceed `max_bytes` the least recently used models are dropped, the
+    last loaded model is kept even if it is bigger than the budget.
+
+    The loads are timed as the "registry.load" stage of `INSTRUMENTATION`.
+    """
+
+    def __init__(self, saver, paths, max_bytes=None):
+        """
+        Initialize the ModelRegistry.
+
+        :param saver: The saver to load the models.
+        :type saver: IntentSaver.
+        :param paths: The path of the model of every tenant, a dict or a
+            function of the tenant.
+        :type paths: dict or callable.
+        :param max_bytes: The bytes of the loaded models, None for no limit.
+        :type max_bytes: int.
+        """
+
+        self.saver = saver
+        self.paths = paths
+        self.max_bytes = max_bytes
+
+        self.models = OrderedDict()
+        self.sizes = {}
+        # The keys of the shared word vectors of every tenant, and the bytes
+        # and the number of tenants of every key
+        self.vector_keys = {}
+        self.vectors = {}
+        self.loading = {}
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.shared_loads = 0
+        self.load_errors = 0
+        self.load_seconds = 0.0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.models)
+
+    def __contains__(self, tenant) -> bool:
+        return tenant in self.models
+
+    @property
+    def resident_bytes(self) -> int:
+        """
+        The bytes of the loaded models.
+
+        :return: The bytes.
+        :rtype: int.
+        """
+
+        return sum(self.sizes.values()) + self.vector_bytes
+
+    @property
+    def vector_bytes(self) -> int:
+        """
+        The bytes of the shared word vectors of the loaded models.
+
+        :return: The bytes.
+        :rtype: int.
+        """
+
+        return sum(nbytes for nbytes, _ in self.vectors.values())
+
+    def _measure(self, model) -> tuple:
+        """
+        Get the bytes of a model, without the shared word vectors.
+
+        :param model: The model.
+        :type model: ModelIntentClassifier.
+        :return: The bytes and the bytes of every shared word vectors it uses.
+        :rtype: tuple.
+        """
+
+        memo = {}
+        size = get_nbytes(model, memo)
+
+        with VECTOR_REGISTRY.lock:
+            entries = list(VECTOR_REGISTRY.entries.items())
+
+        vectors = {}
+        for key, (word_vectors, _) in entries:
+            if id(word_vectors) in memo:
+                with self.lock:
+                    nbytes = self.vectors.get(key, (None,))[0]
+                if nbytes is None:
+                    nbytes = get_nbytes(word_vectors)
+                vectors[key] = nbytes
+        return size - sum(vectors.values()), vectors
+
+    def _get_path(self, tenant) -> str:
+        """
+        Get the path of the model of a tenant.
+
+        :param tenant: The tenant.
+        :type tenant: str.
+        :return: The path.
+        :rtype: str.
+        """
+
+        if callable(self.paths):
+            return self.paths(tenant)
+        if tenant not in self.paths:
+            raise KeyError(f"The tenant {tenant} has no model")
+        return self.paths[tenant]
+
+    def get(self, tenant) -> object:
+        """
+        Get the model of a tenant, loading it if needed.
+
+        :param tenant: The tenant.
+        :type tenant: str.
+        :return: The model.
+        :rtype: ModelIntentClassifier.
+        """
+
+        path = None
+        with self.lock:
+            model = self.models.get(tenant)
+            if model is not None:
+                self.models.move_to_end(tenant)
+                self.hits += 1
+                return model
+
+            self.misses += 1
+            future = self.loading.get(tenant)
+            if future is not None:
+                self.shared_loads += 1
+            else:
+                path = self._get_path(tenant)
+                future = self.loading[tenant] = Future()
+
+        if path is None:
+            return future.result()
+        return self._load(tenant, path, future)
+
+    def _load(self, tenant, path, future) -> object:
+        """
+        Load the model of a tenant and evict the others over the budget.
+
+        :param tenant: The tenant.
+        :type tenant: str.
+        :param path: The path of the model.
+        :type path: str.
+        :param future: The future of the concurrent gets.
+        :type future: Future.
+        :return: The model.
+        :rtype: ModelIntentClassifier.
+        """
+
+        start = INSTRUMENTATION.start()
+        load_start = time.perf_counter()
+        try:
+            model = self.saver.load(path)
+            size, vectors = self._measure(model)
+        except BaseException as error:
+            with self.lock:
+                self.load_errors += 1
+                del self.loading[tenant]
+            future.set_exception(error)
+            raise
+        seconds = time.perf_counter() - load_start
+        INSTRUMENTATION.stop("registry.load", start)
+
+        with self.lock:
+            self.loads += 1
+            self.load_seconds += seconds
+            self.models[tenant] = model
+            self.sizes[tenant] = size
+            self.vector_keys[tenant] = list(vectors)
+            for key, nbytes in vectors.items():
+                self.vectors.setdefault(key, [nbytes, 0])[1] += 1
+            del self.loading[tenant]
+            self._evict()
+
+        future.set_result(model)
+        return model
+
+    def _evict(self):
+        """
+        Evict the least recently used models while the loaded ones exceed
+        the budget, the lock must be held.
+        """
+
+        if self.max_bytes is None:
+            return
+
+        while len(self.models) > 1 and self.resident_bytes > self.max_bytes:
+            self._remove(next(iter(self.models)))
+
+    def _remove(self, tenant):
+        """
+        Remove the model of a tenant, and the shared word vectors that no
+        other model uses, the lock must be held.
+
+        :param tenant: The tenant.
+        :type tenant: str.
+        """
+
+        del self.models[tenant]
+        del self.sizes[tenant]
+        for key in self.vector_keys.pop(tenant):
+            self.vectors[key][1] -= 1
+            if not self.vectors[key][1]:
+                del self.vectors[key]
+        self.evictions += 1
+
+    def evict(self, tenant) -> bool:
+        """
+        Evict the model of a tenant, the next get loads it again.
+
+        :param tenant: The tenant.
+        :type tenant: str.
+        :return: True if the model was loaded.
+        :rtype: bool.
+        """
+
+        with self.lock:
+            if tenant not in self.models:
+                return False
+            self._remove(tenant)
+            return True
+
+    def stats(self) -> dict:
+        """
+        Get the statistics of the registry.
+
+        :return: The loaded models, their bytes and the budget, the hits,
+            misses, loads, the misses that waited for another load, the
+            failed loads, the seconds of the loads, the evictions, the bytes
+            of every loaded model and of every shared word vectors.
+        :rtype: dict.
+        """
+
+        with self.lock:
+            return {
+                "models": len(self.models),
+                "bytes": self.resident_bytes,
+                "max_bytes": self.max_bytes,
+                "loading": len(self.loading),
+                "hits": self.hits,
+                "misses": self.misses,
+                "loads": self.loads,
+                "shared_loads": self.shared_loads,
+                "load_errors": self.load_errors,
+                "load_seconds": self.load_seconds,
+                "evictions": self.evictions,
+                "sizes": dict(self.sizes),
+                "vector_sizes": {
+                    key: nbytes for key, (nbytes, _) in self.vectors.items()
+                },
+            }
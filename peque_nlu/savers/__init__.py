@@ -3,3 +3,4 @@ Savers package.
 """
 from peque_nlu.savers.savers import IntentSaver
 from peque_nlu.savers.pickle_saver import PickleSaver
+from peque_nlu.savers.numpy_saver import NumpySaver
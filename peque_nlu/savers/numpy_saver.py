@@ -0,0 +1,583 @@
+"""
+The numpy_saver module.
+"""
+import importlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+from collections import OrderedDict
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+
+from peque_nlu.savers import IntentSaver
+from peque_nlu.utils import LazyModule
+
+pd = LazyModule("pandas")
+sp = LazyModule("scipy.sparse")
+nltk_stem = LazyModule("nltk.stem")
+
+FORMAT_NAME = "peque_nlu.numpy"
+FORMAT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+
+# Bigger collections of strings are stored as arrays instead of json
+MAX_JSON_STRINGS = 32
+
+# Smaller arrays are stored in the manifest instead of their own npy file
+MAX_JSON_ARRAY = 32
+
+# Only these classes can be loaded, the manifest never names arbitrary code
+SAVABLE_CLASSES = [
+    "peque_nlu.intent_classifiers.ModelIntentClassifier",
+    "peque_nlu.intent_engines.LogisticIntentEngine",
+    "peque_nlu.intent_engines.SGDIntentEngine",
+    "peque_nlu.intent_engines.WorldVectorIntentEngine",
+    "peque_nlu.intent_engines.CompiledIntentEngine",
+    "peque_nlu.feature_extractors.GloveFeatureExtractor",
+    "peque_nlu.feature_extractors.NaiveFeatureExtractor",
+    "peque_nlu.feature_extractors.gazetteer.Gazetteer",
+    "peque_nlu.utils.LRUCache",
+    "peque_nlu.utils.WordVectors",
+    "peque_nlu.quantization.QuantizedArray",
+    "peque_nlu.quantization.QuantizedVectors",
+    "peque_nlu.savers.PickleSaver",
+    "peque_nlu.savers.NumpySaver",
+    "gensim.models.keyedvectors.KeyedVectors",
+    "sklearn.feature_extraction.text.CountVectorizer",
+    "sklearn.feature_extraction.text.HashingVectorizer",
+    "sklearn.feature_extraction.text.TfidfTransformer",
+    "sklearn.pipeline.Pipeline",
+    "sklearn.linear_model.LogisticRegression",
+    "sklearn.linear_model.SGDClassifier",
+    "sklearn.calibration.CalibratedClassifierCV",
+    "sklearn.calibration._CalibratedClassifier",
+    "sklearn.calibration._SigmoidCalibration",
+]
+
+# Attributes that are only used to train and can not be stored without pickle
+SKIPPED_ATTRIBUTES = {"loss_function_"}
+
+
+def _is_instance(value, module_name, class_name) -> bool:
+    """
+    Check if the value is an instance of a class, without importing its module.
+
+    :param value: The value to check.
+    :type value: object.
+    :param module_name: The module of the class.
+    :type module_name: str.
+    :param class_name: The name of the class.
+    :type class_name: str.
+    :return: True if the value is an instance of the class.
+    :rtype: bool.
+    """
+
+    module = sys.modules.get(module_name)
+    return module is not None and isinstance(value, getattr(module, class_name))
+
+
+def _get_class_name(cls) -> str:
+    """
+    Get the name of a class in the SAVABLE_CLASSES.
+
+    :param cls: The class.
+    :type cls: type.
+    :return: The name, or None if the class can not be saved.
+    :rtype: str.
+    """
+
+    for name in SAVABLE_CLASSES:
+        module_name, class_name = name.rsplit(".", 1)
+        module = sys.modules.get(module_name)
+        if module is not None and getattr(module, class_name, None) is cls:
+            return name
+    return None
+
+
+def _is_strings(values) -> bool:
+    """
+    Check if the values are many strings, to store them as an array.
+
+    :param values: The values to check.
+    :type values: list.
+    :return: True if they should be stored as an array.
+    :rtype: bool.
+    """
+
+    return len(values) > MAX_JSON_STRINGS and all(isinstance(v, str) for v in values)
+
+
+class SharedIndex(Mapping):
+    """
+    The SharedIndex class.
+
+    A read only string to int dict over two arrays, the keys sorted, that
+    are searched with `np.searchsorted`. The attached models use it for the
+    vocabularies, so the memory mapped arrays are shared by the processes
+    instead of building a dict in every one of them.
+    """
+
+    def __init__(self, keys, values):
+        """
+        Initialize the SharedIndex.
+
+        :param keys: The sorted keys.
+        :type keys: np.ndarray.
+        :param values: The values of the keys.
+        :type values: np.ndarray.
+        """
+
+        self.key_array = keys
+        self.value_array = values
+        # Longer keys are not in the array, and searching them would cast it
+        self.max_length = keys.dtype.itemsize // np.dtype("U1").itemsize
+
+    def __getitem__(self, key) -> int:
+        if isinstance(key, str) and len(key) <= self.max_length:
+            position = self.key_array.searchsorted(key)
+            if position < len(self.key_array) and self.key_array[position] == key:
+                return int(self.value_array[position])
+        raise KeyError(key)
+
+    def __iter__(self):
+        return map(str, self.key_array)
+
+    def __len__(self) -> int:
+        return len(self.key_array)
+
+
+class SharedStrings(Sequence):
+    """
+    The SharedStrings class.
+
+    A read only list of strings over an array, that the processes attached
+    to a model share.
+    """
+
+    def __init__(self, values):
+        """
+        Initialize the SharedStrings.
+
+        :param values: The strings.
+        :type values: np.ndarray.
+        """
+
+        self.array = values
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [str(value) for value in self.array[index]]
+        return str(self.array[index])
+
+    def __len__(self) -> int:
+        return len(self.array)
+
+    def __contains__(self, value) -> bool:
+        return isinstance(value, str) and bool((self.array == value).any())
+
+
+class _StateWriter:
+    """
+    Write the state of an object graph as json and npy files.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.memo = {}
+        self.arrays = 0
+        # Keep the written values alive, so their ids are never reused
+        self.written = []
+
+    def write_array(self, array) -> dict:
+        """
+        Write an array as a npy file.
+        """
+
+        if id(array) in self.memo:
+            return {"ref": self.memo[id(array)]}
+
+        is_object = array.dtype == object
+        values = array
+        if is_object:
+            if not all(isinstance(v, str) for v in array.flat):
+                raise TypeError("Only object arrays of strings can be saved")
+            values = array.astype(str)
+
+        if values.size <= MAX_JSON_ARRAY:
+            return {
+                "small": values.tolist(),
+                "dtype": values.dtype.str,
+                "shape": list(values.shape),
+                "object": is_object,
+            }
+
+        name = f"array_{self.arrays}"
+        self.arrays += 1
+        np.save(os.path.join(self.path, f"{name}.npy"), values, allow_pickle=False)
+
+        self.memo[id(array)] = name
+        self.written.append(array)
+        return {"array": name, "object": is_object}
+
+    def write_object(self, value) -> dict:
+        """
+        Write an object of the SAVABLE_CLASSES.
+        """
+
+        if id(value) in self.memo:
+            return {"ref": self.memo[id(value)]}
+
+        name = f"object_{len(self.memo)}"
+        self.memo[id(value)] = name
+        self.written.append(value)
+
+        # The default __getstate__ of Python 3.11 gives None for an empty __dict__
+        state = value.__getstate__() if hasattr(value, "__getstate__") else None
+        if state is None:
+            state = vars(value)
+
+        state = {k: v for k, v in state.items() if k not in SKIPPED_ATTRIBUTES}
+        return {
+            "object": _get_class_name(type(value)),
+            "name": name,
+            "state": {k: self.write(v) for k, v in state.items()},
+        }
+
+    def write(
+        self, value
+    ):  # pylint: disable=too-many-return-statements,too-many-branches
+        """
+        Write any value of the object graph.
+        """
+
+        if value is None or isinstance(value, (bool, int, float, str)):
+            return value
+        if isinstance(value, np.generic):
+            return value.item()
+        if isinstance(value, np.ndarray):
+            return self.write_array(value)
+        if isinstance(value, type):
+            return {"type": np.dtype(value).name}
+        if isinstance(value, (list, tuple, set)):
+            kind = type(value).__name__
+            values = sorted(value) if isinstance(value, set) else list(value)
+            if _is_strings(values):
+                return {kind: self.write_array(np.array(values, dtype=str))}
+            return {kind: [self.write(v) for v in values]}
+        if isinstance(value, dict):
+            return self.write_dict(value)
+        if isinstance(value, SharedIndex):
+            return self.write_index(value.key_array, value.value_array)
+        if isinstance(value, SharedStrings):
+            return {"list": self.write_array(value.array)}
+        if "scipy.sparse" in sys.modules and sp.issparse(value):
+            value = value.tocsr()
+            return {
+                "sparse": {
+                    "data": self.write_array(value.data),
+                    "indices": self.write_array(value.indices),
+                    "indptr": self.write_array(value.indptr),
+                    "shape": list(value.shape),
+                }
+            }
+        if _is_instance(value, "nltk.stem", "SnowballStemmer"):
+            return {"stemmer": type(value.stemmer).__name__[: -len("Stemmer")]}
+        if hasattr(value, "__self__") and hasattr(value, "__func__"):
+            return {"method": self.write(value.__self__), "name": value.__name__}
+        if _is_instance(value, "pandas", "DataFrame"):
+            return {
+                "dataframe": {
+                    str(column): self.write(value[column].to_numpy())
+                    for column in value.columns
+                }
+            }
+        if _get_class_name(type(value)) is not None:
+            return self.write_object(value)
+
+        raise TypeError(f"{type(value)} can not be saved by the NumpySaver")
+
+    def write_dict(self, value) -> dict:
+        """
+        Write a dict, the big string to int ones as two arrays.
+        """
+
+        kind = "ordered_dict" if isinstance(value, OrderedDict) else "dict"
+        keys = list(value)
+        is_index = _is_strings(keys) and all(
+            isinstance(v, (int, np.integer)) for v in value.values()
+        )
+        if is_index:
+            keys = np.array(keys, dtype=str)
+            order = np.argsort(keys, kind="stable")
+            values = np.array(list(value.values()))
+            return self.write_index(keys[order], values[order])
+        return {kind: [[self.write(k), self.write(v)] for k, v in value.items()]}
+
+    def write_index(self, keys, values) -> dict:
+        """
+        Write a string to int dict as the arrays of its sorted keys and
+        their values.
+        """
+
+        return {
+            "index": {
+                "keys": self.write_array(keys),
+                "values": self.write_array(values),
+                "sorted": True,
+            }
+        }
+
+
+class _StateReader:
+    """
+    Read the state of an object graph from json and npy files.
+
+    When shared the big string collections are not copied to the process:
+    the object arrays stay string arrays, the lists are SharedStrings and
+    the string to int dicts are SharedIndex.
+    """
+
+    def __init__(self, path, shared=False):
+        self.path = path
+        self.shared = shared
+        self.memo = {}
+
+    def read_array(self, value) -> np.ndarray:
+        """
+        Read a npy file as a read only memory map.
+        """
+
+        array = np.load(
+            os.path.join(self.path, f"{value['array']}.npy"),
+            mmap_mode="r",
+            allow_pickle=False,
+        )
+        if value["object"] and not self.shared:
+            array = array.astype(object)
+
+        self.memo[value["array"]] = array
+        return array
+
+    def read_index(self, content) -> object:
+        """
+        Read a string to int dict, a SharedIndex when shared.
+        """
+
+        keys = self.read_array(content["keys"])
+        values = self.read_array(content["values"])
+        if not self.shared:
+            return dict(zip(keys.tolist(), values.tolist()))
+
+        # The dicts saved before the keys were sorted are sorted in memory
+        if not content.get("sorted"):
+            order = np.argsort(keys, kind="stable")
+            keys, values = keys[order], values[order]
+        return SharedIndex(keys, values)
+
+    def read_object(self, value) -> object:
+        """
+        Read an object of the SAVABLE_CLASSES.
+        """
+
+        if value["object"] not in SAVABLE_CLASSES:
+            raise ValueError(f"{value['object']} can not be loaded by the NumpySaver")
+
+        module_name, class_name = value["object"].rsplit(".", 1)
+        cls = getattr(importlib.import_module(module_name), class_name)
+
+        instance = cls.__new__(cls)
+        self.memo[value["name"]] = instance
+
+        state = {k: self.read(v) for k, v in value["state"].items()}
+        if hasattr(instance, "__setstate__"):
+            instance.__setstate__(state)
+        else:
+            instance.__dict__.update(state)
+        return instance
+
+    def read(
+        self, value
+    ):  # pylint: disable=too-many-return-statements,too-many-branches
+        """
+        Read any value of the object graph.
+        """
+
+        if not isinstance(value, dict):
+            return value
+
+        kind, content = next(iter(value.items()))
+        if kind == "ref":
+            return self.memo[content]
+        if kind == "array":
+            return self.read_array(value)
+        if kind == "small":
+            array = np.array(content, dtype=value["dtype"]).reshape(value["shape"])
+            return array.astype(object) if value["object"] else array
+        if kind == "object":
+            return self.read_object(value)
+        if kind == "type":
+            return np.dtype(content).type
+        if kind in ("list", "tuple", "set"):
+            values = content
+            if isinstance(content, dict) and self.shared and kind == "list":
+                return SharedStrings(self.read_array(content))
+            if isinstance(content, dict):
+                values = self.read_array(content).tolist()
+            else:
+                values = [self.read(v) for v in values]
+            return {"list": list, "tuple": tuple, "set": set}[kind](values)
+        if kind in ("dict", "ordered_dict"):
+            items = [(self.read(k), self.read(v)) for k, v in content]
+            return OrderedDict(items) if kind == "ordered_dict" else dict(items)
+        if kind == "index":
+            return self.read_index(content)
+        if kind == "sparse":
+            return sp.csr_matrix(
+                (
+                    self.read_array(content["data"]),
+                    self.read_array(content["indices"]),
+                    self.read_array(content["indptr"]),
+                ),
+                shape=tuple(content["shape"]),
+            )
+        if kind == "stemmer":
+            return nltk_stem.SnowballStemmer(content.lower())
+        if kind == "method":
+            return getattr(self.read(content), value["name"])
+        if kind == "dataframe":
+            return pd.DataFrame({k: self.read(v) for k, v in content.items()})
+
+        raise ValueError(f"Unknown value {kind} in the manifest")
+
+
+class NumpySaver(IntentSaver):
+    """
+    The NumpySaver class.
+
+    This class is used to save and load the models without pickle.
+    The model is saved in a directory, the arrays (coefficients, vocabulary
+    index, embeddings) as npy files that are loaded as read only memory maps,
+    and the rest of the state in a json manifest with a format version.
+
+    `publish` saves a fitted model in shared memory, the worker processes
+    that `attach` to it map the same pages instead of loading a copy, and
+    search the vocabularies in the same sorted keys.
+    """
+
+    def save(self, model, path):
+        """
+        Save the model to the path.
+
+        :param model: The model to save.
+        :type model: object.
+        :param path: The directory to save the model.
+        :type path: str.
+        """
+
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            if name.startswith("array_") and name.endswith(".npy"):
+                os.remove(os.path.join(path, name))
+
+        writer = _StateWriter(path)
+        manifest = {
+            "format": FORMAT_NAME,
+            "version": FORMAT_VERSION,
+            "model": writer.write(self._quantize(model)),
+        }
+
+        with open(os.path.join(path, MANIFEST_NAME), "w", encoding="utf-8") as file:
+            json.dump(manifest, file)
+
+    def load(self, path) -> object:
+        """
+        Load the model from the path.
+
+        :param path: The directory to load the model.
+        :type path: str.
+        :return: The model.
+        :rtype: object.
+        """
+
+        return self._read(path)
+
+    def _read(self, path, shared=False) -> object:
+        """
+        Read the model of the path.
+
+        :param path: The directory to load the model.
+        :type path: str.
+        :param shared: Read the big string collections without copying them.
+        :type shared: bool.
+        :return: The model.
+        :rtype: object.
+        """
+
+        with open(os.path.join(path, MANIFEST_NAME), encoding="utf-8") as file:
+            manifest = json.load(file)
+
+        if manifest.get("format") != FORMAT_NAME:
+            raise ValueError(f"{path} is not a NumpySaver model")
+        if manifest.get("version") != FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported NumpySaver format version {manifest.get('version')}"
+            )
+
+        reader = _StateReader(path, shared)
+        return self._quantize(reader.read(manifest["model"]))
+
+    def publish(self, model, path=None) -> str:
+        """
+        Publish the model in shared memory, for pre-fork worker processes.
+
+        :param model: The fitted model to publish.
+        :type model: object.
+        :param path: The directory to publish the model,
+            by default a new directory in /dev/shm.
+        :type path: str.
+        :return: The directory the workers attach to.
+        :rtype: str.
+        """
+
+        if path is None:
+            shared_memory = "/dev/shm" if os.path.isdir("/dev/shm") else None
+            path = tempfile.mkdtemp(prefix="peque_nlu_", dir=shared_memory)
+
+        self.save(model, path)
+        return path
+
+    def attach(self, path) -> object:
+        """
+        Attach to a published model, the arrays are mapped read only
+        and shared by all the processes attached to it.
+
+        Unlike `load`, the vocabularies are not copied to the process: they
+        are SharedIndex, searched in the sorted keys, the lists of strings
+        are SharedStrings and the object arrays are string arrays. An
+        attached model only predicts, it can not be updated.
+
+        Every process still builds the objects of the model, their small
+        attributes, the sets and the arrays of at most MAX_JSON_ARRAY values,
+        and fills its own caches. That memory does not grow with the size
+        of the vocabularies or the vectors.
+
+        :param path: The directory of the published model.
+        :type path: str.
+        :return: The model.
+        :rtype: object.
+        """
+
+        return self._read(path, shared=True)
+
+    def unpublish(self, path):
+        """
+        Remove a published model, the attached processes keep their mappings.
+
+        :param path: The directory of the published model.
+        :type path: str.
+        """
+
+        shutil.rmtree(path, ignore_errors=True)
@@ -23,7 +23,7 @@ class PickleSaver(IntentSaver):
         """
 
         with open(path, "wb") as file:
-            pickle.dump(model, file)
+            pickle.dump(self._quantize(model), file)
 
     def load(self, path) -> object:
         """
@@ -37,4 +37,4 @@ class PickleSaver(IntentSaver):
 
         with open(path, "rb") as file:
             model = pickle.load(file)
-        return model
+        return self._quantize(model)
@@ -7,8 +7,41 @@ from abc import ABC, abstractmethod
 class IntentSaver(ABC):
     """
     Abstract class for intent savers.
+
+    With `quantize` the models are quantized when saved and loaded, so the
+    full precision models can also be loaded with reduced precision. A full
+    precision model is loaded whole and then quantized, so the peak memory
+    of its load is not reduced, the models saved quantized are loaded with
+    less memory.
     """
 
+    quantize = None
+
+    def __init__(self, quantize=None):
+        """
+        Initialize the saver.
+
+        :param quantize: The reduced precision of the models, "float16" or
+            "int8". By default the models keep their precision.
+        :type quantize: str.
+        """
+
+        self.quantize = quantize
+
+    def _quantize(self, model) -> object:
+        """
+        Quantize a model if the saver quantizes them.
+
+        :param model: The model.
+        :type model: object.
+        :return: The quantized model, or the same model.
+        :rtype: object.
+        """
+
+        if self.quantize is None or not hasattr(model, "quantize"):
+            return model
+        return model.quantize(self.quantize)
+
     @abstractmethod
     def save(self, model, path):
         """
@@ -0,0 +1,555 @@
+"""
+The HTTP inference server module.
+
+Serve a saved model with the standard library only:
+
+    python -m peque_nlu.serve model_directory --saver numpy --port 8000
+
+The endpoints are:
+
+- POST /predict, {"text": "hola", "threshold": 0.2} -> the prediction.
+- POST /predict/batch, {"texts": ["hola", ...]} -> {"predictions": [...]}.
+- GET /health, the server is running.
+- GET /ready, the model is loaded, 503 until then.
+- GET /stats, the requests count and latency percentiles.
+- GET /metrics, the timings of the stages in the Prometheus text format,
+  with --metrics.
+
+The texts of the concurrent requests are predicted together in batches, the
+requests whose texts go over `max_concurrency` texts in flight are rejected
+with 503, and a batch of more texts than that with 413.
+"""
+import argparse
+import asyncio
+import json
+import signal
+import time
+from collections import deque
+from http import HTTPStatus
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from peque_nlu.intent_classifiers import AsyncIntentClassifier
+from peque_nlu.metrics import INSTRUMENTATION, MetricsRegistry, format_prometheus
+from peque_nlu.savers import NumpySaver, PickleSaver
+
+SAVERS = {"numpy": NumpySaver, "pickle": PickleSaver}
+MAX_BODY_SIZE = 1 << 20
+# The latencies kept for the percentiles, for every endpoint
+LATENCY_WINDOW = 10000
+THRESHOLD_ERROR = "threshold must be a number or an object of numbers"
+
+
+def _is_threshold(threshold) -> bool:
+    """
+    Check a threshold of a request is a number, or an object with the
+    number of every entity.
+
+    :param threshold: The threshold of the request.
+    :type threshold: object.
+    :return: True if it is a valid threshold.
+    :rtype: bool.
+    """
+
+    values = threshold.values() if isinstance(threshold, dict) else [threshold]
+    return all(
+        isinstance(value, (int, float)) and not isinstance(value, bool)
+        for value in values
+    )
+
+
+def _json_default(value) -> object:
+    """
+    Convert the NumPy values of a payload, like the float32 similarities of
+    the glove features, to their Python values.
+
+    :param value: The value json can not encode.
+    :type value: object.
+    :return: The Python value.
+    :rtype: object.
+    """
+
+    if isinstance(value, (np.generic, np.ndarray)):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class InferenceServer:
+    """
+    The InferenceServer class.
+
+    This class serves an intent classifier over HTTP/1.1 with asyncio.
+    The model is loaded in a thread once the server starts, so the health
+    endpoint answers while loading.
+    """
+
+    model = None
+    async_model = None
+    load_error = None
+    registry = None
+
+    def __init__(
+        self,
+        loader,
+        window=0.005,
+        max_batch_size=64,
+        max_concurrency=256,
+        metrics=False,
+    ):
+        """
+        Initialize the InferenceServer.
+
+        :param loader: A function that returns the fitted intent classifier.
+        :type loader: callable.
+
+        :param window: The seconds to wait for more texts to predict.
+        :type window: float.
+
+        :param max_batch_size: The number of texts that starts a batch.
+        :type max_batch_size: int.
+
+        :param max_concurrency: The number of texts predicted at once, the
+            requests over it are rejected, it is also the largest batch.
+        :type max_concurrency: int.
+
+        :param metrics: Time the stages of the model, for /metrics.
+        :type metrics: bool.
+        """
+
+        self.loader = loader
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+
+        self.in_flight = 0
+        self.rejected = 0
+        self.counts = {}
+        self.latencies = {}
+        self.started = time.monotonic()
+
+        if metrics:
+            self.registry = MetricsRegistry()
+
+    @property
+    def ready(self) -> bool:
+        """
+        If the model is loaded.
+
+        :return: True if the model is loaded.
+        :rtype: bool.
+        """
+
+        return self.async_model is not None
+
+    async def start(self, host="127.0.0.1", port=8000) -> asyncio.AbstractServer:
+        """
+        Start the server and load the model.
+
+        :param host: The host to listen.
+        :type host: str.
+        :param port: The port to listen, 0 for any free port.
+        :type port: int.
+        :return: The asyncio server.
+        :rtype: asyncio.AbstractServer.
+        """
+
+        server = await asyncio.start_server(self._handle_connection, host, port)
+        if self.registry is not None:
+            INSTRUMENTATION.add_sink(self.registry)
+        loading = asyncio.get_running_loop().run_in_executor(None, self.loader)
+        loading.add_done_callback(self._set_model)
+        return server
+
+    def _set_model(self, loading):
+        """
+        Set the loaded model, or the error loading it.
+
+        :param loading: The finished loading.
+        :type loading: asyncio.Future.
+        """
+
+        if loading.exception() is not None:
+            self.load_error = repr(loading.exception())
+            return
+
+        self.model = loading.result()
+        self.async_model = AsyncIntentClassifier(
+            self.model, window=self.window, max_batch_size=self.max_batch_size
+        )
+
+    def close(self):
+        """
+        Stop the worker thread of the model and the stage timings.
+        """
+
+        if self.async_model is not None:
+            self.async_model.close()
+        if self.registry is not None:
+            INSTRUMENTATION.remove_sink(self.registry)
+
+    async def _handle_connection(self, reader, writer):
+        """
+        Answer the requests of a connection, while it is kept alive.
+
+        :param reader: The stream to read.
+        :type reader: asyncio.StreamReader.
+        :param writer: The stream to write.
+        :type writer: asyncio.StreamWriter.
+        """
+
+        try:
+            keep_alive = True
+            while keep_alive:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                    length = int(headers.get("content-length", 0))
+                    if length < 0:
+                        raise ValueError("negative content-length")
+                except ValueError:
+                    status = HTTPStatus.BAD_REQUEST
+                    content_type, data = self._encode({"error": "bad request"})
+                    keep_alive = False
+                else:
+                    keep_alive = (
+                        version == "HTTP/1.1"
+                        and headers.get("connection", "").lower() != "close"
+                    )
+                    if length > MAX_BODY_SIZE:
+                        status = HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+                        content_type, data = self._encode(
+                            {"error": "the body is too large"}
+                        )
+                        keep_alive = False
+                    else:
+                        body = await reader.readexactly(length)
+                        status, content_type, data = await self._answer(
+                            method, target, body
+                        )
+
+                writer.write(
+                    (
+                        f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                        f"Content-Type: {content_type}; charset=utf-8\r\n"
+                        f"Content-Length: {len(data)}\r\n"
+                        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+                        "\r\n"
+                    ).encode("latin-1")
+                    + data
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _encode(payload) -> tuple:
+        """
+        Encode a payload, the texts as plain text and the rest as json.
+
+        :param payload: The payload of the response.
+        :type payload: dict or list or str.
+        :return: The content type and the body.
+        :rtype: tuple.
+        """
+
+        if isinstance(payload, str):
+            return "text/plain; version=0.0.4", payload.encode("utf-8")
+        data = json.dumps(payload, ensure_ascii=False, default=_json_default)
+        return "application/json", data.encode("utf-8")
+
+    async def _answer(self, method, target, body) -> tuple:
+        """
+        Answer a request, the errors of the endpoints and of the encoding
+        are internal server errors, so the client always gets a response.
+
+        :param method: The HTTP method.
+        :type method: str.
+        :param target: The request target.
+        :type target: str.
+        :param body: The request body.
+        :type body: bytes.
+        :return: The status, the content type and the body.
+        :rtype: tuple.
+        """
+
+        try:
+            status, payload = await self._respond(method, target, body)
+            return (status, *self._encode(payload))
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            payload = {"error": repr(error)}
+            return (HTTPStatus.INTERNAL_SERVER_ERROR, *self._encode(payload))
+
+    async def _respond(self, method, target, body) -> tuple:
+        """
+        Route a request to its endpoint.
+
+        :param method: The HTTP method.
+        :type method: str.
+        :param target: The request target.
+        :type target: str.
+        :param body: The request body.
+        :type body: bytes.
+        :return: The status and the json payload.
+        :rtype: tuple.
+        """
+
+        path = urlsplit(target).path.rstrip("/")
+        endpoints = {
+            "/health": ("GET", self._health),
+            "/ready": ("GET", self._ready),
+            "/stats": ("GET", self._stats),
+            "/metrics": ("GET", self._metrics),
+            "/predict": ("POST", self._predict),
+            "/predict/batch": ("POST", self._predict_batch),
+        }
+
+        if path not in endpoints:
+            return HTTPStatus.NOT_FOUND, {"error": f"{path} not found"}
+        endpoint_method, endpoint = endpoints[path]
+        if method != endpoint_method:
+            return HTTPStatus.METHOD_NOT_ALLOWED, {"error": f"use {endpoint_method}"}
+        if method == "GET":
+            return endpoint()
+
+        if not self.ready:
+            return HTTPStatus.SERVICE_UNAVAILABLE, {"error": "the model is not ready"}
+
+        try:
+            request = json.loads(body)
+        except ValueError:
+            return HTTPStatus.BAD_REQUEST, {"error": "the body must be json"}
+        if not isinstance(request, dict):
+            return HTTPStatus.BAD_REQUEST, {"error": "the body must be an object"}
+
+        # Every text counts against the concurrency, a batch that can never
+        # fit is too large
+        texts = request.get("texts")
+        size = len(texts) if isinstance(texts, list) else 1
+        if size > max(self.max_concurrency, 1):
+            return HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {
+                "error": f"at most {self.max_concurrency} texts by request"
+            }
+        if self.in_flight + size > self.max_concurrency:
+            self.rejected += 1
+            return HTTPStatus.SERVICE_UNAVAILABLE, {"error": "too many requests"}
+
+        self.in_flight += size
+        start = time.perf_counter()
+        try:
+            return await endpoint(request)
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": repr(error)}
+        finally:
+            self.in_flight -= size
+            self.counts[path] = self.counts.get(path, 0) + 1
+            latencies = self.latencies.setdefault(path, deque(maxlen=LATENCY_WINDOW))
+            latencies.append(time.perf_counter() - start)
+
+    async def _predict(self, request) -> tuple:
+        """
+        Predict the intent of a text.
+
+        :param request: The request, with the text and optionally the threshold.
+        :type request: dict.
+        :return: The status and the prediction.
+        :rtype: tuple.
+        """
+
+        text = request.get("text")
+        if not isinstance(text, str):
+            return HTTPStatus.BAD_REQUEST, {"error": "text must be a string"}
+
+        threshold = request.get("threshold", 0.2)
+        if not _is_threshold(threshold):
+            return HTTPStatus.BAD_REQUEST, {"error": THRESHOLD_ERROR}
+
+        prediction = await self.async_model.apredict(text, threshold)
+        return HTTPStatus.OK, prediction
+
+    async def _predict_batch(self, request) -> tuple:
+        """
+        Predict the intent of multiple texts.
+
+        :param request: The request, with the texts and optionally the threshold.
+        :type request: dict.
+        :return: The status and the predictions.
+        :rtype: tuple.
+        """
+
+        texts = request.get("texts")
+        if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+            return HTTPStatus.BAD_REQUEST, {"error": "texts must be a list of strings"}
+
+        threshold = request.get("threshold", 0.2)
+        if not _is_threshold(threshold):
+            return HTTPStatus.BAD_REQUEST, {"error": THRESHOLD_ERROR}
+
+        predictions = await asyncio.gather(
+            *[self.async_model.apredict(text, threshold) for text in texts]
+        )
+        return HTTPStatus.OK, {"predictions": list(predictions)}
+
+    def _health(self) -> tuple:
+        """
+        Check the server is running.
+
+        :return: The status and the uptime.
+        :rtype: tuple.
+        """
+
+        return HTTPStatus.OK, {
+            "status": "ok",
+            "uptime": time.monotonic() - self.started,
+        }
+
+    def _ready(self) -> tuple:
+        """
+        Check the model is loaded.
+
+        :return: The status, 503 until the model is loaded.
+        :rtype: tuple.
+        """
+
+        if self.ready:
+            return HTTPStatus.OK, {"ready": True}
+        return HTTPStatus.SERVICE_UNAVAILABLE, {
+            "ready": False,
+            "error": self.load_error,
+        }
+
+    def _stats(self) -> tuple:
+        """
+        Get the requests count and the latency percentiles of every endpoint.
+
+        :return: The status and the statistics.
+        :rtype: tuple.
+
+        example: _stats() -> (200, {"in_flight": 0, "rejected": 0, "batches": 2,
+            "endpoints": {"/predict": {"count": 3, "mean_ms": 2.1,
+                "p50_ms": 2.0, "p95_ms": 2.5, "p99_ms": 2.5}}})
+        """
+
+        endpoints = {}
+        for path, latencies in self.latencies.items():
+            ordered = sorted(latencies)
+            stats = {
+                "count": self.counts[path],
+                "mean_ms": 1000 * sum(ordered) / len(ordered),
+            }
+            for percentile in (50, 95, 99):
+                position = min(len(ordered) - 1, len(ordered) * percentile // 100)
+                stats[f"p{percentile}_ms"] = 1000 * ordered[position]
+            endpoints[path] = stats
+
+        return HTTPStatus.OK, {
+            "ready": self.ready,
+            "in_flight": self.in_flight,
+            "rejected": self.rejected,
+            "batches": self.async_model.batches if self.ready else 0,
+            "endpoints": endpoints,
+        }
+
+    def _metrics(self) -> tuple:
+        """
+        Get the timings of the stages, in the Prometheus text format.
+
+        :return: The status and the metrics text.
+        :rtype: tuple.
+        """
+
+        if self.registry is None:
+            return HTTPStatus.NOT_FOUND, {"error": "start the server with metrics"}
+        return HTTPStatus.OK, format_prometheus(self.registry.snapshot())
+
+
+async def serve(loader, host, port, **options):
+    """
+    Serve the model until cancelled.
+
+    :param loader: A function that returns the fitted intent classifier.
+    :type loader: callable.
+    :param host: The host to listen.
+    :type host: str.
+    :param port: The port to listen.
+    :type port: int.
+    :param options: The InferenceServer options.
+    :type options: dict.
+    """
+
+    inference_server = InferenceServer(loader, **options)
+    server = await inference_server.start(host, port)
+    address = server.sockets[0].getsockname()
+    print(f"Serving on http://{address[0]}:{address[1]}", flush=True)
+
+    # Stop gracefully on SIGTERM too, like the process managers send
+    try:
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGTERM, asyncio.current_task().cancel
+        )
+    except NotImplementedError:
+        pass
+
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        inference_server.close()
+
+
+def main(args=None):
+    """
+    Run the server from the command line.
+
+    :param args: The command line arguments, by default sys.argv.
+    :type args: list.
+    """
+
+    parser = argparse.ArgumentParser(
+        prog="python -m peque_nlu.serve",
+        description="Serve a saved model over HTTP.",
+    )
+    parser.add_argument("path", help="The path of the saved model.")
+    parser.add_argument("--saver", choices=list(SAVERS), default="numpy")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--window", type=float, default=0.005)
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--max-concurrency", type=int, default=256)
+    parser.add_argument(
+        "--metrics", action="store_true", help="Time the stages, for /metrics."
+    )
+    args = parser.parse_args(args)
+
+    saver = SAVERS[args.saver]()
+    try:
+        asyncio.run(
+            serve(
+                lambda: saver.load(args.path),
+                args.host,
+                args.port,
+                window=args.window,
+                max_batch_size=args.max_batch_size,
+                max_concurrency=args.max_concurrency,
+                metrics=args.metrics,
+            )
+        )
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+
+
+if __name__ == "__main__":
+    main()
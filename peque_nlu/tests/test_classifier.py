@@ -1,6 +1,12 @@
 """
 Test the classifier module.
 """
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from peque_nlu import utils
 from peque_nlu.utils import glove_load
 from peque_nlu.intent_engines import (
     SGDIntentEngine,
@@ -12,11 +18,12 @@ from peque_nlu.feature_extractors import (
     GloveFeatureExtractor,
 )
 
-from peque_nlu.intent_classifiers import ModelIntentClassifier
+from peque_nlu.intent_classifiers import AsyncIntentClassifier, ModelIntentClassifier
 
 
 SMALL_TALK_QUERY = "Hola como te encuentras?"
 DATASET_PATH = "intents_example.json"
+JSONL_DATASET_PATH = "intents_example.jsonl"
 
 glove_vectors = None
 
@@ -298,3 +305,135 @@ def test_naive_feature_extractor_single():
     assert feature_one["word"] == "ultimo"
     assert feature_one["entity"] == "timing"
     assert feature_one["similarities"] == 1
+
+
+def test_normalized_multiple_predict():
+    """
+    Test the ModelIntentClassifier normalizes every text once.
+    """
+    intent_engine = LogisticIntentEngine("spanish", token_cache_size=10)
+    feature_extractor = NaiveFeatureExtractor()
+    model = ModelIntentClassifier("spanish", intent_engine, feature_extractor)
+    model.fit(DATASET_PATH)
+
+    normalized = model.normalize("Quiero lo ÚLTIMO de python")
+    assert normalized == "quiero lo último de python"
+    assert normalized.folded == "quiero lo ultimo de python"
+    assert list(normalized.stems) == intent_engine.tokenize(
+        "Quiero lo último de python"
+    )
+    assert list(normalized.words) == ["quiero", "ultimo", "python"]
+
+    texts = [SMALL_TALK_QUERY, "Quiero lo ÚLTIMO de python", SMALL_TALK_QUERY]
+    misses = intent_engine.cache_stats()["tokens"]["misses"]
+    prediction = model.multiple_predict(texts)
+    assert intent_engine.cache_stats()["tokens"]["misses"] == misses + 1
+
+    assert [p["text"] for p in prediction] == texts
+    assert prediction[0] == prediction[2]
+    assert prediction[0]["features"] is not prediction[2]["features"]
+    assert prediction[1]["features"] == feature_extractor.get_features(texts[1], 0.2)
+
+
+def test_prediction_cache(monkeypatch):
+    """
+    Test the ModelIntentClassifier predictions cache, with a fake clock so
+    the items only expire when the clock is moved.
+    """
+    now = [0.0]
+    monkeypatch.setattr(utils, "time", SimpleNamespace(monotonic=lambda: now[0]))
+
+    intent_engine = SGDIntentEngine("spanish")
+    feature_extractor = NaiveFeatureExtractor()
+    model = ModelIntentClassifier(
+        "spanish", intent_engine, feature_extractor, cache_size=2, cache_ttl=0.5
+    )
+    model.fit(DATASET_PATH)
+
+    first_prediction = model.predict(SMALL_TALK_QUERY)
+    prediction = model.multiple_predict(
+        ["hola  COMO te encuentras?", "Quiero aprender sobre lo último de python"]
+    )
+    assert prediction[0]["text"] == "hola  COMO te encuentras?"
+    assert prediction[0]["intent"] == first_prediction["intent"]
+    assert prediction[0]["features"] == first_prediction["features"]
+    assert model.cache_stats()["hits"] == 1
+
+    model.predict(SMALL_TALK_QUERY, threshold={"timing": 0.5})
+    assert model.cache_stats()["misses"] == 3
+
+    now[0] += 0.6
+    model.predict(SMALL_TALK_QUERY)
+    assert model.cache_stats()["misses"] == 4
+
+    model.fit(DATASET_PATH)
+    assert model.cache_stats()["size"] == 0
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        predictions = list(executor.map(model.predict, [SMALL_TALK_QUERY] * 20))
+    assert all(p == first_prediction for p in predictions)
+    assert model.cache_stats()["hits"] > 1
+
+
+def test_streaming_dataset():
+    """
+    Test the ModelIntentClassifier fits the same from a json or jsonl dataset,
+    and the dataset cache is refreshed when the file changes.
+    """
+    with open(DATASET_PATH, encoding="utf-8") as file:
+        dataset = json.load(file)
+
+    with open(JSONL_DATASET_PATH, "w", encoding="utf-8") as file:
+        file.write(json.dumps({"entities": dataset["entities"]}) + "\n")
+        for intent, examples in dataset["intents"].items():
+            for example in examples:
+                file.write(json.dumps({"text": example, "intent": intent}) + "\n")
+
+    texts = [SMALL_TALK_QUERY, "Quiero aprender sobre lo último de python"]
+    predictions = []
+    for dataset_path in [DATASET_PATH, JSONL_DATASET_PATH]:
+        model = ModelIntentClassifier(
+            "spanish", SGDIntentEngine("spanish"), NaiveFeatureExtractor()
+        )
+        model.fit(dataset_path)
+        assert model.categories == list(dataset["intents"])
+        predictions.append(model.multiple_predict(texts))
+    assert predictions[0] == predictions[1]
+
+    assert model.get_entities(JSONL_DATASET_PATH) == dataset["entities"]
+    assert model.load_dataset(JSONL_DATASET_PATH)[1] == list(dataset["intents"])
+
+    with open(JSONL_DATASET_PATH, "w", encoding="utf-8") as file:
+        file.write(json.dumps({"text": "hola", "intent": "greet"}) + "\n")
+    os.utime(JSONL_DATASET_PATH, ns=(0, 0))
+
+    assert model.load_dataset(JSONL_DATASET_PATH)[1] == ["greet"]
+    os.remove(JSONL_DATASET_PATH)
+
+
+def test_async_intent_classifier():
+    """
+    Test the concurrent apredict calls are predicted in batches.
+    """
+    model = ModelIntentClassifier("spanish", SGDIntentEngine("spanish"))
+    model.fit(DATASET_PATH)
+    texts = [SMALL_TALK_QUERY, "Quiero aprender sobre lo último de python"] * 5
+    expected = model.multiple_predict(texts)
+
+    async def predict_all(async_model):
+        predictions = await asyncio.gather(
+            *[async_model.apredict(text) for text in texts]
+        )
+        await async_model.aupdate(["pideme una pizza"] * 3, ["food"] * 3)
+        return predictions
+
+    async_model = AsyncIntentClassifier(model, window=0.2, max_batch_size=4)
+    try:
+        predictions = asyncio.run(predict_all(async_model))
+    finally:
+        async_model.close()
+
+    assert predictions == expected
+    # Two full batches, and the last two texts wait the window
+    assert async_model.batches == 3
+    assert model.categories[-1] == "food"
@@ -0,0 +1,81 @@
+"""
+Test the feature extractors module.
+"""
+import os
+import numpy as np
+from gensim.models.keyedvectors import KeyedVectors
+
+from peque_nlu.feature_extractors import GloveFeatureExtractor, NaiveFeatureExtractor
+from peque_nlu.savers import PickleSaver
+
+PICKLE_PATH = "test_feature_extractor.pkl"
+
+
+def get_random_vectors():
+    """
+    Get small random vectors, so the tests do not need to download a model.
+    """
+    generator = np.random.default_rng(42)
+    words = [f"word{letter}" for letter in "abcdefghijklmnopqrstuvwxyz"]
+
+    vectors = KeyedVectors(10)
+    vectors.add_vectors(words, generator.normal(size=(26, 10)).astype(np.float32))
+    return vectors
+
+
+def test_glove_feature_extractor_index():
+    """
+    Test the GloveFeatureExtractor index gives the same similarities as gensim.
+    """
+    glove_vectors = get_random_vectors()
+    feature_extractor = GloveFeatureExtractor(glove_vectors)
+    feature_extractor.stopwords = []
+    feature_extractor.entities = {
+        "first": ["worda", "wordb", "unknown"],
+        "second": ["wordc"],
+        "third": ["unknown"],
+    }
+
+    features = feature_extractor.get_features("wordc wordd unknown", -1.0)
+    assert [(f["word"], f["entity"]) for f in features] == [
+        ("wordc", "first"),
+        ("wordc", "second"),
+        ("wordd", "first"),
+        ("wordd", "second"),
+        ("unknown", "first"),
+        ("unknown", "third"),
+    ]
+
+    expected = max(glove_vectors.similarity(["worda", "wordb"], "wordd"))
+    assert np.isclose(features[2]["similarities"], expected)
+    assert features[1]["similarities"] == 1
+
+    features = feature_extractor.get_features("wordd", {"first": 1.0, "second": -1.0})
+    assert [f["entity"] for f in features] == ["second"]
+
+
+def test_naive_feature_extractor_gazetteer():
+    """
+    Test the NaiveFeatureExtractor gazetteer, with multi word examples.
+    """
+    feature_extractor = NaiveFeatureExtractor()
+    feature_extractor.stopwords = ["de", "la"]
+    feature_extractor.entities = {
+        "timing": ["ultim", "la última versión"],
+        "technology": ["python", "Visual Studio"],
+    }
+
+    saver = PickleSaver()
+    saver.save(feature_extractor, PICKLE_PATH)
+    feature_extractor = saver.load(PICKLE_PATH)
+    os.remove(PICKLE_PATH)
+
+    features = feature_extractor.get_features(
+        "Quiero la ultima version de visual studio y de python", 0.2
+    )
+    assert [(f["word"], f["entity"]) for f in features] == [
+        ("ultima", "timing"),
+        ("ultima version", "timing"),
+        ("visual studio", "technology"),
+        ("python", "technology"),
+    ]
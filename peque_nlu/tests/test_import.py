@@ -0,0 +1,50 @@
+"""
+Test the import time of the package.
+"""
+import subprocess
+import sys
+
+PACKAGES = [
+    "peque_nlu.intent_classifiers",
+    "peque_nlu.feature_extractors",
+    "peque_nlu.savers",
+]
+HEAVY_MODULES = ["pandas", "gensim", "nltk", "sklearn", "ot", "scipy"]
+
+# The seconds that importing the packages can take, numpy is most of it
+IMPORT_BUDGET = 1.0
+
+
+def get_import_times(modules) -> dict:
+    """
+    Get the cumulative import time in seconds of every module imported,
+    like `python -X importtime` reports it.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    import_times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+
+        _, cumulative, module = line.split("|")
+        if cumulative.strip().isdigit():
+            import_times[module.strip()] = int(cumulative) / 1e6
+    return import_times
+
+
+def test_import_time():
+    """
+    Test the packages are imported without the heavy dependencies, in budget.
+    """
+    import_times = get_import_times(PACKAGES)
+
+    imported = {module.split(".")[0] for module in import_times}
+    assert not imported.intersection(HEAVY_MODULES)
+
+    assert sum(import_times[package] for package in PACKAGES) < IMPORT_BUDGET
@@ -0,0 +1,385 @@
+"""
+Test the intent engines module.
+"""
+import json
+import pickle
+import numpy as np
+import pytest
+from peque_nlu.intent_classifiers import ModelIntentClassifier
+from peque_nlu.intent_engines import (
+    CompiledIntentEngine,
+    LogisticIntentEngine,
+    SGDIntentEngine,
+    WorldVectorIntentEngine,
+)
+from peque_nlu.tests.test_feature_extractor import get_random_vectors
+
+TEXTS = [
+    "worda wordb wordc",
+    "wordd worde",
+    "wordf wordg wordh wordi",
+    "wordj wordk",
+    "wordl wordm wordn",
+    "wordo wordp wordq",
+    "wordr words",
+    "wordt wordu wordv wordw",
+]
+DATASET_PATH = "intents_example.json"
+INTENTS = ["one", "two", "three", "four", "one", "two", "three", "four"]
+SPANISH_TEXTS = [
+    "Hola como te encuentras?",
+    "Quiero aprender sobre lo último de python",
+    "hola, quiero aprender python",
+]
+TOKENIZER_TEXTS = SPANISH_TEXTS + [
+    "¿Qué tal? ¡Muy bien! Son las 3:30...",
+    "Él dijo «hola» y “adiós”, (niño) ‘señor’",
+    "I can't, I cannot... gonna wanna gotta lemme gimme",
+    "Don't e-mail me at test@example.com, it's $5.",
+    "",
+]
+
+
+def test_world_vector_intent_engine_pruning():
+    """
+    Test the WorldVectorIntentEngine pruned search finds the nearest example.
+    """
+    glove_vectors = get_random_vectors()
+    intent_engine = WorldVectorIntentEngine("spanish", glove_vectors)
+    intent_engine.fit(TEXTS, INTENTS)
+
+    queries = ["worda wordk", "wordw wordx", "wordz", "unknown"]
+    intents, distances = intent_engine.predict(queries)
+
+    for query, intent, distance in zip(queries[:-1], intents, distances):
+        expected = min(
+            (glove_vectors.wmdistance(query.split(), text.split()), text_intent)
+            for text, text_intent in zip(TEXTS, INTENTS)
+        )
+        assert abs(distance - expected[0]) < 1e-9
+        assert intent == expected[1]
+        assert intent_engine.predict([query]) == ([intent], [distance])
+
+    assert intents[-1] == INTENTS[0]
+    assert distances[-1] == float("inf")
+    assert intent_engine.skipped_solves > 0
+    assert intent_engine.exact_solves + intent_engine.skipped_solves == 6 * len(TEXTS)
+
+
+def test_world_vector_intent_engine_parallel():
+    """
+    Test the WorldVectorIntentEngine predict with worker processes.
+    """
+    glove_vectors = get_random_vectors()
+    intent_engine = WorldVectorIntentEngine("spanish", glove_vectors, n_jobs=2)
+    intent_engine.min_parallel_batch = 2
+    intent_engine.fit(TEXTS, INTENTS)
+
+    queries = ["worda wordk", "wordw wordx", "wordz", "unknown", "wordb"] * 3
+    try:
+        prediction = intent_engine.predict(queries)
+    finally:
+        intent_engine.close()
+
+    assert prediction == intent_engine.predict_batch(queries)
+    assert intent_engine.exact_solves > 0
+
+
+def test_model_engine_caches():
+    """
+    Test the ModelEngine stems and tokens caches give the same tokens.
+    """
+    intent_engine = LogisticIntentEngine("spanish", token_cache_size=2)
+    uncached_engine = LogisticIntentEngine("spanish", stem_cache_size=0)
+    assert not uncached_engine.cache_stats()
+
+    for text in SPANISH_TEXTS * 2:
+        assert intent_engine.tokenize(text) == uncached_engine.tokenize(text)
+
+    stats = intent_engine.cache_stats()
+    assert stats["tokens"]["size"] == 2
+    assert stats["tokens"]["misses"] == 6
+    assert stats["stems"]["hits"] > 0
+
+    intent_engine = pickle.loads(pickle.dumps(intent_engine))
+    assert intent_engine.cache_stats() == stats
+
+
+def test_model_engine_fast_tokenizer():
+    """
+    Test the ModelEngine fast tokenizer gives the same tokens as nltk.
+    """
+    nltk_engine = LogisticIntentEngine("spanish")
+    fast_engine = LogisticIntentEngine("spanish", tokenizer="fast")
+
+    for text in TOKENIZER_TEXTS:
+        assert fast_engine.tokenize(text) == nltk_engine.tokenize(text)
+        assert fast_engine.tokenize(text.lower()) == nltk_engine.tokenize(text.lower())
+
+
+def test_sgd_intent_engine_fit_stream():
+    """
+    Test the SGDIntentEngine trained out of core from mini batches.
+    """
+    model = ModelIntentClassifier("spanish", SGDIntentEngine("spanish"))
+    model.fit(DATASET_PATH, batch_size=8, n_passes=15, calibration_fraction=0.3)
+
+    with open(DATASET_PATH, encoding="utf-8") as file:
+        assert model.categories == list(json.load(file)["intents"])
+
+    prediction = model.multiple_predict(SPANISH_TEXTS[:2])
+    assert [p["intent"] for p in prediction] == ["small_talk", "search"]
+    assert all(0 < p["probability"] <= 1 for p in prediction)
+
+    with pytest.raises(ValueError):
+        SGDIntentEngine("spanish").fit_stream(iter([[("hola", "greet")]]))
+
+
+def test_sgd_intent_engine_fit_stream_calibration():
+    """
+    Test every intent has held out examples to calibrate with the default
+    fraction, and the hashing vectorizer has the columns of the engine.
+    """
+    model = ModelIntentClassifier(
+        "spanish", SGDIntentEngine("spanish", n_features=2**12)
+    )
+    dataset = list(model.iter_dataset(DATASET_PATH))
+    intent_engine = model.intent_engine
+    intent_engine.fit_stream([dataset[:16], dataset[16:]])
+
+    assert intent_engine.vectorizer.n_features == 2**12
+    assert set(intent_engine.replay) == {intent for _, intent in dataset}
+    calibration = [text for texts in intent_engine.replay.values() for text in texts]
+    assert len(calibration) < len(dataset) / 2
+
+
+@pytest.mark.parametrize("intent_engine_class", [SGDIntentEngine, LogisticIntentEngine])
+def test_model_engine_update(intent_engine_class):
+    """
+    Test the model engines learn new examples and intents with update.
+    """
+    model = ModelIntentClassifier("spanish", intent_engine_class("spanish"))
+    model.fit(DATASET_PATH)
+
+    model.update(
+        ["pideme una pizza", "quiero ordenar una pizza", "pedir pizza a domicilio"],
+        ["food"] * 3,
+    )
+    assert model.categories[-1] == "food"
+
+    prediction = model.multiple_predict(SPANISH_TEXTS[:2] + ["pide una pizza"])
+    assert [p["intent"] for p in prediction] == ["small_talk", "search", "food"]
+
+    with pytest.raises(ValueError):
+        model.update(["hola"], [])
+
+
+def test_model_engine_replay_reservoir():
+    """
+    Test the replay buffer keeps a sample of all the examples seen of an
+    intent, and the logistic update runs a bounded number of iterations on
+    the bounded buffer.
+    """
+    model = ModelIntentClassifier("spanish", LogisticIntentEngine("spanish"))
+    model.fit(DATASET_PATH)
+    intent_engine = model.intent_engine
+    intent_engine.replay_size = 10
+
+    fit = intent_engine.model.fit
+    sizes = []
+
+    def fit_sample(features, intents):
+        sizes.append(features.shape[0])
+        return fit(features, intents)
+
+    intent_engine.model.fit = fit_sample
+    texts = [f"pizza {chr(97 + i // 26)}{chr(97 + i % 26)}" for i in range(500)]
+    for start in range(0, len(texts), 50):
+        intent_engine.update(texts[start : start + 50], ["food"] * 50, max_iter=3)
+    del intent_engine.model.fit
+    # Every update fits the replay buffer, not all the examples seen
+    assert max(sizes) <= 10 * len(intent_engine.replay)
+
+    assert intent_engine.replay_seen["food"] == 500
+    positions = [texts.index(text) for text in intent_engine.replay["food"]]
+    assert len(positions) == 10
+    assert min(positions) < 250 <= max(positions)
+
+    replay_text, replay_intent = intent_engine._get_replay(20)  # pylint: disable=W0212
+    assert len(set(zip(replay_text, replay_intent))) == 20
+    assert set(replay_intent) == set(intent_engine.replay)
+
+    assert intent_engine.model.n_iter_.max() <= 3
+    assert intent_engine.model.max_iter == 100
+    assert not intent_engine.model.warm_start
+    assert model.predict("pizza zz")["intent"] == "food"
+
+
+def test_world_vector_intent_engine_update():
+    """
+    Test the WorldVectorIntentEngine update appends to the same index as fit.
+    """
+    glove_vectors = get_random_vectors()
+    intent_engine = WorldVectorIntentEngine("spanish", glove_vectors)
+    intent_engine.fit(TEXTS[:5], INTENTS[:5])
+    intent_engine.update(TEXTS[5:] + ["wordx wordy"], INTENTS[5:] + ["five"])
+
+    fitted_engine = WorldVectorIntentEngine("spanish", glove_vectors)
+    fitted_engine.fit(TEXTS + ["wordx wordy"], INTENTS + ["five"])
+
+    queries = ["worda wordk", "wordw wordx", "wordy", "unknown"]
+    assert intent_engine.predict(queries) == fitted_engine.predict(queries)
+    assert intent_engine.predict(["wordy"])[0] == ["five"]
+
+
+@pytest.mark.parametrize("intent_engine_class", [SGDIntentEngine, LogisticIntentEngine])
+def test_model_engine_hashing_vectorizer(intent_engine_class):
+    """
+    Test the model engines with the hashing vectorizer, that has no vocabulary.
+    """
+    intent_engine = intent_engine_class(
+        "spanish", vectorizer="hashing", n_features=2**12, alternate_sign=True
+    )
+    model = ModelIntentClassifier("spanish", intent_engine)
+    model.fit(DATASET_PATH)
+
+    assert not hasattr(intent_engine.vectorizer, "vocabulary_")
+    assert intent_engine.vectorizer.transform(SPANISH_TEXTS).shape[1] == 2**12
+
+    prediction = model.multiple_predict(SPANISH_TEXTS[:2])
+    assert [p["intent"] for p in prediction] == ["small_talk", "search"]
+
+    with pytest.raises(ValueError):
+        intent_engine_class("spanish", vectorizer="tfidf")
+
+
+@pytest.mark.parametrize("intent_engine_class", [SGDIntentEngine, LogisticIntentEngine])
+def test_model_engine_predict_topk(intent_engine_class):
+    """
+    Test the model engines rank all the intents from one scoring pass.
+    """
+    model = ModelIntentClassifier("spanish", intent_engine_class("spanish"))
+    model.fit(DATASET_PATH)
+    intent_engine = model.intent_engine
+
+    scorer = intent_engine._get_scorer()  # pylint: disable=protected-access
+    n_intents = len(scorer.classes_)
+    intents, probabilities = intent_engine.predict_topk(SPANISH_TEXTS, n_intents + 1)
+    assert intents.shape == probabilities.shape == (len(SPANISH_TEXTS), n_intents)
+
+    expected = scorer.predict_proba(intent_engine.vectorizer.transform(SPANISH_TEXTS))
+    for row, intent_row, probability_row in zip(expected, intents, probabilities):
+        assert sorted(intent_row) == sorted(scorer.classes_)
+        columns = np.searchsorted(scorer.classes_, intent_row)
+        assert abs(probability_row - row[columns]).max() < 1e-9
+
+    best_intents, best_probabilities = intent_engine.predict(SPANISH_TEXTS)
+    assert list(best_intents) == list(intents[:, 0])
+    assert list(best_probabilities) == list(probabilities[:, 0])
+
+    prediction = model.predict(SPANISH_TEXTS[0], top_k=2)
+    assert prediction["intents"][0] == {
+        "intent": prediction["intent"],
+        "probability": prediction["probability"],
+    }
+    assert prediction["intents"][1]["intent"] == intents[0, 1]
+    assert "intents" not in model.predict(SPANISH_TEXTS[0])
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_sgd_intent_engine_calibrated_intents(stream):
+    """
+    Test the SGD intents are ranked by the classifier, not by the calibration,
+    and every intent can be predicted.
+    """
+    model = ModelIntentClassifier("spanish", SGDIntentEngine("spanish"))
+    model.fit(DATASET_PATH, batch_size=16 if stream else None)
+    texts, intents = zip(*model.iter_dataset(DATASET_PATH))
+    intent_engine = model.intent_engine
+
+    predicted, probabilities = intent_engine.predict(texts)
+    vec_texts = intent_engine.vectorizer.transform(texts)
+    assert list(predicted) == list(intent_engine.model.predict(vec_texts))
+    assert set(predicted) == set(intents)
+
+    calibrated = intent_engine.calibrator.predict_proba(vec_texts)
+    columns = np.searchsorted(intent_engine.calibrator.classes_, predicted)
+    assert abs(probabilities - calibrated[np.arange(len(texts)), columns]).max() < 1e-9
+
+
+def test_world_vector_intent_engine_predict_topk():
+    """
+    Test the WorldVectorIntentEngine ranks the intents by their nearest example.
+    """
+    glove_vectors = get_random_vectors()
+    intent_engine = WorldVectorIntentEngine("spanish", glove_vectors)
+    intent_engine.fit(TEXTS, INTENTS)
+
+    queries = ["worda wordk", "wordw wordx", "wordz", "unknown"]
+    intents, distances = intent_engine.predict_topk(queries, 3)
+    assert intents.shape == distances.shape == (len(queries), 3)
+
+    for query, intent_row, distance_row in zip(queries[:-1], intents, distances):
+        nearest = {}
+        for text, intent in zip(TEXTS, INTENTS):
+            distance = glove_vectors.wmdistance(query.split(), text.split())
+            nearest[intent] = min(nearest.get(intent, float("inf")), distance)
+        expected = sorted(nearest.items(), key=lambda item: item[1])[:3]
+
+        assert list(intent_row) == [intent for intent, _ in expected]
+        assert max(abs(distance_row - [d for _, d in expected])) < 1e-9
+
+    assert list(intents[-1]) == INTENTS[:3]
+    assert list(distances[-1]) == [float("inf")] * 3
+    assert intent_engine.predict_topk(queries, 10)[0].shape == (len(queries), 4)
+    assert intent_engine.predict(queries) == (
+        list(intents[:, 0]),
+        list(distances[:, 0]),
+    )
+
+
+@pytest.mark.parametrize(
+    "intent_engine_class,options",
+    [
+        (SGDIntentEngine, {}),
+        (LogisticIntentEngine, {}),
+        (SGDIntentEngine, {"vectorizer": "hashing", "alternate_sign": True}),
+        (LogisticIntentEngine, {"vectorizer": "hashing", "n_features": 2**10}),
+    ],
+)
+def test_compiled_intent_engine(intent_engine_class, options):
+    """
+    Test the CompiledIntentEngine gives the probabilities of the sklearn engine.
+    """
+    model = ModelIntentClassifier("spanish", intent_engine_class("spanish", **options))
+    model.fit(DATASET_PATH)
+    intent_engine = model.intent_engine
+
+    compiled = CompiledIntentEngine(intent_engine)
+    texts = SPANISH_TEXTS + ["", "palabras desconocidas"]
+    expected = intent_engine._get_scorer().predict_proba(  # pylint: disable=W0212
+        intent_engine.vectorizer.transform(texts)
+    )
+    assert abs(compiled.predict_proba(texts) - expected).max() < 1e-9
+    for text in texts:
+        assert (
+            abs(compiled.predict_proba([text]) - expected[texts.index(text)]).max()
+            < 1e-9
+        )
+
+    intents, probabilities = compiled.predict_topk(texts, 2)
+    expected_intents, expected_probabilities = intent_engine.predict_topk(texts, 2)
+    assert (intents == expected_intents).all()
+    assert abs(probabilities - expected_probabilities).max() < 1e-9
+
+    exported = model.export()
+    assert isinstance(exported.intent_engine, CompiledIntentEngine)
+    prediction = exported.predict(SPANISH_TEXTS[0], top_k=2)
+    assert (
+        prediction["intents"][0]["intent"] == model.predict(SPANISH_TEXTS[0])["intent"]
+    )
+
+    with pytest.raises(NotImplementedError):
+        compiled.fit(texts, texts)
+    with pytest.raises(ValueError):
+        CompiledIntentEngine(WorldVectorIntentEngine("spanish"))
@@ -0,0 +1,80 @@
+"""
+Test the metrics module.
+"""
+from peque_nlu.feature_extractors import NaiveFeatureExtractor
+from peque_nlu.intent_classifiers import ModelIntentClassifier
+from peque_nlu.intent_engines import SGDIntentEngine
+from peque_nlu.metrics import (
+    INSTRUMENTATION,
+    Histogram,
+    MetricsRegistry,
+    format_prometheus,
+)
+
+DATASET_PATH = "intents_example.json"
+TEXTS = ["Hola como te encuentras?", "Quiero aprender sobre lo último de python"]
+
+
+def test_stage_timings():
+    """
+    Test the stages of multiple_predict are sent to every sink.
+    """
+    model = ModelIntentClassifier(
+        "spanish", SGDIntentEngine("spanish"), NaiveFeatureExtractor()
+    )
+    model.fit(DATASET_PATH)
+
+    registry = INSTRUMENTATION.add_sink(MetricsRegistry())
+    calls = []
+    callback = INSTRUMENTATION.add_sink(lambda *args: calls.append(args))
+    try:
+        model.multiple_predict(TEXTS)
+    finally:
+        INSTRUMENTATION.remove_sink(registry)
+        INSTRUMENTATION.remove_sink(callback)
+
+    assert not INSTRUMENTATION.enabled
+    model.multiple_predict(TEXTS)
+
+    snapshot = registry.snapshot()
+    for stage in [
+        "classifier.multiple_predict",
+        "classifier.normalize",
+        "classifier.engine",
+        "engine.tokenize",
+        "engine.transform",
+        "engine.predict_proba",
+        "classifier.features",
+    ]:
+        assert snapshot[stage]["count"] > 0
+        assert snapshot[stage]["buckets"][-1][1] == snapshot[stage]["count"]
+
+    assert snapshot["engine.transform"]["items"] == 2
+    assert snapshot["classifier.features"]["items"] == 2
+    assert len(calls) == sum(h["count"] for h in snapshot.values())
+
+
+def test_histogram_prometheus():
+    """
+    Test the histogram buckets and the Prometheus text format.
+    """
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in [0.05, 0.1, 0.5, 2.0]:
+        histogram.observe(value, items=3)
+
+    registry = MetricsRegistry()
+    registry.histograms["stage"] = histogram
+    snapshot = registry.snapshot()
+    assert snapshot["stage"]["buckets"] == [(0.1, 2), (1.0, 3), (float("inf"), 4)]
+    assert snapshot["stage"]["items"] == 12
+    assert snapshot["stage"]["max"] == 2.0
+
+    text = format_prometheus(snapshot)
+    assert 'peque_nlu_stage_seconds_bucket{stage="stage",le="0.1"} 2' in text
+    assert 'peque_nlu_stage_seconds_bucket{stage="stage",le="+Inf"} 4' in text
+    assert 'peque_nlu_stage_seconds_sum{stage="stage"} 2.65' in text
+    assert 'peque_nlu_stage_seconds_count{stage="stage"} 4' in text
+    assert 'peque_nlu_stage_items_total{stage="stage"} 12' in text
+
+    registry.reset()
+    assert not registry.snapshot()
@@ -0,0 +1,139 @@
+"""
+Test the quantization module.
+"""
+import numpy as np
+import pytest
+
+from peque_nlu.feature_extractors import GloveFeatureExtractor
+from peque_nlu.intent_classifiers import ModelIntentClassifier
+from peque_nlu.intent_engines import (
+    CompiledIntentEngine,
+    LogisticIntentEngine,
+    WorldVectorIntentEngine,
+)
+from peque_nlu.quantization import (
+    QuantizedArray,
+    QuantizedVectors,
+    get_nbytes,
+    quantization_report,
+)
+from peque_nlu.tests.test_feature_extractor import get_random_vectors
+
+DATASET_PATH = "intents_example.json"
+
+
+def test_quantized_array():
+    """
+    Test the quantized rows are close to the original ones.
+    """
+    generator = np.random.default_rng(42)
+    array = generator.normal(size=(100, 20)) * generator.uniform(0.01, 10, (100, 1))
+    array[3] = 0
+
+    quantized = QuantizedArray(array, "int8")
+    assert quantized.values.dtype == np.int8
+    assert quantized.shape == array.shape
+    assert quantized.nbytes == 100 * 20 + 100 * 4
+    assert quantized[5].dtype == np.float64
+    errors = np.abs(np.asarray(quantized) - array)
+    assert (errors <= quantized.scales[:, np.newaxis] / 2 + 1e-12).all()
+    assert not quantized[3].any()
+    assert np.array_equal(quantized[[7, 2]], np.vstack([quantized[7], quantized[2]]))
+    assert QuantizedArray(quantized, "int8").values is quantized.values
+
+    quantized = QuantizedArray(array.astype(np.float32), "float16")
+    assert quantized[[1, 2]].dtype == np.float32
+    assert np.allclose(quantized[:], array, rtol=1e-3, atol=1e-4)
+
+    with pytest.raises(ValueError):
+        QuantizedArray(array, "int4")
+    with pytest.raises(ValueError):
+        QuantizedArray(array * 1e6, "float16")
+
+
+class ArraysHolder:
+    """
+    An object with arrays and no __getstate__ of its own.
+    """
+
+    def __init__(self, *arrays):
+        self.arrays = arrays
+
+
+class EmptyHolder:
+    """
+    An object with an empty __dict__.
+    """
+
+
+class StateHolder(ArraysHolder):
+    """
+    An object that leaves out its cache when pickled.
+    """
+
+    def __getstate__(self) -> dict:
+        return {"arrays": self.arrays[:1]}
+
+
+def test_get_nbytes():
+    """
+    Test the bytes of the arrays of plain objects, with and without
+    __getstate__, the shared arrays are counted once.
+    """
+    array = np.zeros(4)
+    assert get_nbytes(ArraysHolder(array, array, np.zeros(2, np.int8))) == 34
+    assert get_nbytes(EmptyHolder()) == 0
+    assert get_nbytes(StateHolder(array, np.zeros(100))) == 32
+    assert get_nbytes([ArraysHolder(array), StateHolder(array)]) == 32
+
+
+def test_quantized_classifier():
+    """
+    Test the quantized classifier predicts like the full precision one.
+    """
+    model = ModelIntentClassifier("spanish", LogisticIntentEngine("spanish"))
+    model.fit(DATASET_PATH)
+    texts, intents = zip(*model.iter_dataset(DATASET_PATH))
+
+    quantized = model.quantize("int8")
+    assert isinstance(quantized.intent_engine, CompiledIntentEngine)
+    assert quantized.intent_engine.coef.values.dtype == np.int8
+    assert model.intent_engine.model is not None
+
+    report = quantization_report(model, texts, intents, "int8")
+    assert report["quantized_bytes"] == get_nbytes(quantized)
+    assert report["saving"] > 0.5
+    assert report["agreement"] == 1
+    assert report["accuracy_change"] == 0
+
+    expected = model.multiple_predict(texts[:5])
+    for result, expected_result in zip(quantized.multiple_predict(texts[:5]), expected):
+        assert result["intent"] == expected_result["intent"]
+        assert abs(result["probability"] - expected_result["probability"]) < 0.05
+
+
+def test_quantized_word_vectors():
+    """
+    Test the components quantize their shared glove vectors once.
+    """
+    glove_vectors = get_random_vectors()
+    intent_engine = WorldVectorIntentEngine("spanish", glove_vectors)
+    feature_extractor = GloveFeatureExtractor(glove_vectors)
+    feature_extractor.stopwords = []
+    feature_extractor.entities = {"first": ["worda", "wordb"], "second": ["wordc"]}
+    intent_engine.fit(
+        ["worda wordb", "wordc wordd", "worde wordf wordg"], ["ab", "cd", "efg"]
+    )
+
+    quantized_engine = intent_engine.quantize("int8")
+    quantized_extractor = feature_extractor.quantize("int8")
+    assert isinstance(quantized_engine.glove_vectors, QuantizedVectors)
+    assert quantized_extractor.glove_vectors is quantized_engine.glove_vectors
+    assert intent_engine.glove_vectors is glove_vectors
+
+    texts = ["wordb wordh", "wordd", "wordf wordz worde"]
+    assert quantized_engine.predict(texts)[0] == intent_engine.predict(texts)[0]
+    for text in texts:
+        expected = feature_extractor.get_features(text, 0.0)
+        features = quantized_extractor.get_features(text, 0.0)
+        assert [f["entity"] for f in features] == [f["entity"] for f in expected]
@@ -0,0 +1,184 @@
+"""
+Test the registry module.
+"""
+import shutil
+import threading
+import time
+
+import pytest
+
+from peque_nlu.feature_extractors import GloveFeatureExtractor
+from peque_nlu.intent_classifiers import ModelIntentClassifier
+from peque_nlu.intent_engines import SGDIntentEngine, WorldVectorIntentEngine
+from peque_nlu.metrics import (
+    INSTRUMENTATION,
+    MetricsRegistry,
+    format_registry_prometheus,
+)
+from peque_nlu.quantization import get_nbytes
+from peque_nlu.registry import ModelRegistry
+from peque_nlu.savers import IntentSaver, NumpySaver
+from peque_nlu.tests.test_feature_extractor import get_random_vectors
+
+DATASET_PATH = "intents_example.json"
+REGISTRY_PATH = "test_registry_model"
+
+
+class SlowSaver(IntentSaver):
+    """
+    A saver that counts the loads and takes some time to load.
+    """
+
+    def __init__(self, fail=False):
+        super().__init__()
+        self.fail = fail
+        self.loads = 0
+
+    def save(self, model, path):
+        pass
+
+    def load(self, path) -> object:
+        self.loads += 1
+        time.sleep(0.1)
+        if self.fail:
+            raise OSError(f"Can not load {path}")
+        return {"path": path}
+
+
+class MemorySaver(IntentSaver):
+    """
+    A saver that loads the models of a dict.
+    """
+
+    def __init__(self, models):
+        super().__init__()
+        self.models = models
+
+    def save(self, model, path):
+        self.models[path] = model
+
+    def load(self, path) -> object:
+        return self.models[path]
+
+
+def test_model_registry_eviction():
+    """
+    Test the models are loaded on the first get and the least recently used
+    ones are evicted over the budget.
+    """
+    model = ModelIntentClassifier("spanish", SGDIntentEngine("spanish"))
+    model.fit(DATASET_PATH)
+    NumpySaver().save(model, REGISTRY_PATH)
+
+    paths = {tenant: REGISTRY_PATH for tenant in ("first", "second", "third")}
+    registry = ModelRegistry(NumpySaver(), paths)
+    metrics = INSTRUMENTATION.add_sink(MetricsRegistry())
+    try:
+        first = registry.get("first")
+        size = registry.stats()["bytes"]
+        registry.max_bytes = 2 * size
+
+        assert registry.get("first") is first
+        assert first.predict("Hola como te encuentras?")
+        registry.get("second")
+        registry.get("first")
+        registry.get("third")
+    finally:
+        INSTRUMENTATION.remove_sink(metrics)
+        shutil.rmtree(REGISTRY_PATH)
+
+    assert "second" not in registry
+    assert registry.get("first") is first
+    stats = registry.stats()
+    assert stats["sizes"] == {"third": size, "first": size}
+    assert (stats["loads"], stats["hits"], stats["evictions"]) == (3, 3, 1)
+    assert metrics.snapshot()["registry.load"]["count"] == 3
+
+    text = format_registry_prometheus(stats)
+    assert f'peque_nlu_models_resident_bytes{{tenant="first"}} {size}' in text
+    assert "peque_nlu_models_evictions_total 1" in text
+
+    with pytest.raises(KeyError):
+        registry.get("unknown")
+
+
+def test_model_registry_concurrent_loads():
+    """
+    Test the concurrent gets of a model load it once, and a failed load
+    is raised to all of them.
+    """
+    saver = SlowSaver()
+    registry = ModelRegistry(saver, lambda tenant: f"models/{tenant}")
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(registry.get("bot")))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert saver.loads == 1
+    assert all(result is results[0] for result in results)
+    assert registry.stats()["shared_loads"] == 7
+
+    saver.fail = True
+    errors = []
+
+    def get_failing():
+        try:
+            registry.get("failing")
+        except OSError as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=get_failing) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(errors) == 4 and saver.loads == 2
+    saver.fail = False
+    assert registry.get("failing") == {"path": "models/failing"}
+    assert registry.stats()["load_errors"] == 1
+
+
+def test_model_registry_shared_vectors():
+    """
+    Test the word vectors shared by many models are counted once,
+    until the last of them is evicted.
+    """
+    glove_vectors = get_random_vectors()
+    models = {}
+    for tenant, texts in (("first", ["worda", "wordb"]), ("second", ["wordc"])):
+        model = ModelIntentClassifier(
+            "spanish",
+            WorldVectorIntentEngine("spanish", glove_vectors),
+            GloveFeatureExtractor(glove_vectors),
+        )
+        model.intent_engine.fit(texts, ["one", "two"][: len(texts)])
+        models[tenant] = model
+
+    vector_bytes = get_nbytes(glove_vectors)
+    sizes = {tenant: get_nbytes(m) - vector_bytes for tenant, m in models.items()}
+    registry = ModelRegistry(
+        MemorySaver(models),
+        {tenant: tenant for tenant in models},
+        max_bytes=sum(sizes.values()) + vector_bytes,
+    )
+
+    registry.get("first")
+    registry.get("second")
+    stats = registry.stats()
+    assert stats["evictions"] == 0
+    assert stats["sizes"] == sizes
+    assert list(stats["vector_sizes"].values()) == [vector_bytes]
+    assert stats["bytes"] == sum(sizes.values()) + vector_bytes
+
+    registry.evict("first")
+    assert registry.resident_bytes == sizes["second"] + vector_bytes
+    registry.evict("second")
+    assert registry.resident_bytes == 0
+    assert not registry.stats()["vector_sizes"]
@@ -1,11 +1,30 @@
 """
 Test the saver module.
 """
+import gc
+import json
+import multiprocessing
 import os
-from peque_nlu.intent_engines import SGDIntentEngine
-from peque_nlu.savers import PickleSaver
+import pickle
+import re
+import shutil
+import subprocess
+import sys
+import numpy as np
+import pytest
+from gensim.models.keyedvectors import KeyedVectors
+from nltk.corpus import stopwords
+from peque_nlu.intent_engines import SGDIntentEngine, WorldVectorIntentEngine
+from peque_nlu.intent_classifiers import ModelIntentClassifier
+from peque_nlu.feature_extractors import GloveFeatureExtractor, NaiveFeatureExtractor
+from peque_nlu.savers import NumpySaver, PickleSaver
+from peque_nlu.savers.numpy_saver import SharedIndex, SharedStrings
+from peque_nlu.tests.test_feature_extractor import get_random_vectors
+from peque_nlu.utils import VECTOR_REGISTRY
 
 PICKLE_PATH = "test.pkl"
+NUMPY_PATH = "test_numpy_model"
+DATASET_PATH = "intents_example.json"
 
 
 def test_save_pickle():
@@ -29,3 +48,313 @@ def test_load_pickle():
     intent_engine = saver.load(PICKLE_PATH)
     assert intent_engine is not None
     os.remove(PICKLE_PATH)
+
+
+def test_numpy_saver():
+    """
+    Test the NumpySaver gives the same predictions with memory mapped arrays.
+    """
+    model = ModelIntentClassifier("spanish", SGDIntentEngine("spanish"))
+    model.fit(DATASET_PATH)
+
+    saver = NumpySaver()
+    saver.save(model, NUMPY_PATH)
+    assert os.path.exists(os.path.join(NUMPY_PATH, "manifest.json"))
+    loaded_model = saver.load(NUMPY_PATH)
+
+    coefficients = loaded_model.intent_engine.model.steps[-1][1].coef_
+    assert isinstance(coefficients, np.memmap)
+    assert not coefficients.flags.writeable
+
+    texts = ["Hola como te encuentras?", "Quiero aprender sobre lo último de python"]
+    assert loaded_model.multiple_predict(texts) == model.multiple_predict(texts)
+
+    with open(os.path.join(NUMPY_PATH, "manifest.json"), encoding="utf-8") as file:
+        manifest = json.load(file)
+    manifest["version"] += 1
+    with open(os.path.join(NUMPY_PATH, "manifest.json"), "w", encoding="utf-8") as file:
+        json.dump(manifest, file)
+
+    with pytest.raises(ValueError):
+        saver.load(NUMPY_PATH)
+    shutil.rmtree(NUMPY_PATH)
+
+
+def test_numpy_saver_empty_state():
+    """
+    Test the NumpySaver saves the objects with an empty __dict__, like an
+    unfitted feature extractor.
+    """
+    model = ModelIntentClassifier(
+        "spanish", SGDIntentEngine("spanish"), NaiveFeatureExtractor()
+    )
+    assert not vars(model.feature_extractor)
+
+    saver = NumpySaver()
+    saver.save(model, NUMPY_PATH)
+    try:
+        loaded_model = saver.load(NUMPY_PATH)
+    finally:
+        shutil.rmtree(NUMPY_PATH)
+
+    assert isinstance(loaded_model.feature_extractor, NaiveFeatureExtractor)
+    assert not vars(loaded_model.feature_extractor)
+
+
+def test_numpy_saver_exported():
+    """
+    Test an exported model is loaded and predicts without sklearn installed,
+    nltk imports it when it is.
+    """
+    model = ModelIntentClassifier("spanish", SGDIntentEngine("spanish"))
+    model.fit(DATASET_PATH)
+    exported = model.export()
+    NumpySaver().save(exported, NUMPY_PATH)
+
+    texts = ["Hola como te encuentras?", "Quiero aprender sobre lo último de python"]
+    code = (
+        "import json, sys\n"
+        "class NoSklearn:\n"
+        "    def find_spec(self, name, path, target=None):\n"
+        "        if name.split('.')[0] == 'sklearn':\n"
+        "            raise ModuleNotFoundError(name)\n"
+        "sys.meta_path.insert(0, NoSklearn())\n"
+        "from peque_nlu.savers import NumpySaver\n"
+        f"model = NumpySaver().load({NUMPY_PATH!r})\n"
+        f"predictions = model.multiple_predict({texts!r}, top_k=2)\n"
+        "print(json.dumps([[p['intent'], p['probability']] for p in predictions]))\n"
+    )
+    try:
+        result = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        )
+    finally:
+        shutil.rmtree(NUMPY_PATH)
+
+    expected = [[p["intent"], p["probability"]] for p in model.multiple_predict(texts)]
+    predictions = json.loads(result.stdout)
+    assert [intent for intent, _ in predictions] == [i for i, _ in expected]
+    assert max(abs(p - e[1]) for (_, p), e in zip(predictions, expected)) < 1e-9
+
+
+def test_numpy_saver_quantized():
+    """
+    Test the NumpySaver quantizes the models when saving and loading them.
+    """
+    model = ModelIntentClassifier("spanish", SGDIntentEngine("spanish"))
+    model.fit(DATASET_PATH)
+    texts = ["Hola como te encuentras?", "Quiero aprender sobre lo último de python"]
+    expected = [p["intent"] for p in model.multiple_predict(texts)]
+
+    NumpySaver(quantize="int8").save(model, NUMPY_PATH)
+    loaded_model = NumpySaver().load(NUMPY_PATH)
+    coefficients = loaded_model.intent_engine.coef
+    assert coefficients.values.dtype == np.int8
+    assert isinstance(coefficients.values, np.memmap)
+    assert [p["intent"] for p in loaded_model.multiple_predict(texts)] == expected
+
+    NumpySaver().save(model, NUMPY_PATH)
+    loaded_model = NumpySaver(quantize="float16").load(NUMPY_PATH)
+    assert loaded_model.intent_engine.coef.values.dtype == np.float16
+    assert [p["intent"] for p in loaded_model.multiple_predict(texts)] == expected
+    shutil.rmtree(NUMPY_PATH)
+
+
+def test_shared_word_vectors():
+    """
+    Test the components share the word vectors, and they are saved once.
+    """
+    # The optional imports of nltk keep the frames of its first caller alive,
+    # with their errors, so it is imported before the vectors exist
+    stopwords.words("spanish")
+    glove_vectors = get_random_vectors()
+    intent_engine = WorldVectorIntentEngine("spanish", glove_vectors)
+    feature_extractor = GloveFeatureExtractor(glove_vectors)
+    key = intent_engine.word_vectors.key
+    assert VECTOR_REGISTRY.entries[key][1] == 2
+
+    saver = PickleSaver()
+    saver.save((intent_engine, feature_extractor), PICKLE_PATH)
+    loaded_engine, loaded_extractor = saver.load(PICKLE_PATH)
+    os.remove(PICKLE_PATH)
+
+    assert loaded_engine.glove_vectors is intent_engine.glove_vectors
+    assert loaded_extractor.glove_vectors is intent_engine.glove_vectors
+    assert VECTOR_REGISTRY.entries[key][1] == 4
+
+    del intent_engine, feature_extractor, loaded_engine, loaded_extractor
+    gc.collect()
+    assert key not in VECTOR_REGISTRY
+
+
+def test_load_legacy_glove_pickle():
+    """
+    Test the pickles of the glove components saved with the glove vectors in
+    their state, before the word vectors handle, are loaded and indexed.
+    """
+    glove_vectors = get_random_vectors()
+    texts = ["worda wordb", "wordc wordd", "worde wordf"]
+    intents = ["ab", "cd", "ef"]
+    entities = {"first": ["worda", "wordb"], "second": ["wordc"]}
+
+    legacy_engine = WorldVectorIntentEngine.__new__(WorldVectorIntentEngine)
+    legacy_engine.__dict__.update(
+        stopwords=[],
+        json_dataset={intent: [text] for text, intent in zip(texts, intents)},
+        glove_vectors=glove_vectors,
+    )
+    legacy_extractor = GloveFeatureExtractor.__new__(GloveFeatureExtractor)
+    legacy_extractor.__dict__.update(
+        entities=entities, stopwords=[], glove_vectors=glove_vectors
+    )
+    with open(PICKLE_PATH, "wb") as file:
+        pickle.dump((legacy_engine, legacy_extractor), file)
+
+    loaded_engine, loaded_extractor = PickleSaver().load(PICKLE_PATH)
+    os.remove(PICKLE_PATH)
+
+    intent_engine = WorldVectorIntentEngine("spanish", glove_vectors)
+    intent_engine.fit(texts, intents)
+    feature_extractor = GloveFeatureExtractor(glove_vectors)
+    feature_extractor.stopwords = []
+    feature_extractor.entities = entities
+
+    assert "glove_vectors" not in vars(loaded_engine)
+    assert loaded_engine.glove_vectors is intent_engine.glove_vectors
+    assert loaded_engine.examples is not None
+    queries = ["wordb wordh", "wordd", "wordf wordz"]
+    assert loaded_engine.predict(queries) == intent_engine.predict(queries)
+
+    assert loaded_extractor.glove_vectors is intent_engine.glove_vectors
+    assert loaded_extractor.entity_matrix is not None
+    for query in queries:
+        expected = feature_extractor.get_features(query, 0.0)
+        assert loaded_extractor.get_features(query, 0.0) == expected
+
+
+def test_attach_shared_index():
+    """
+    Test an attached model predicts like a loaded one, with the vocabulary
+    searched in the shared sorted keys instead of a dict.
+    """
+    model = ModelIntentClassifier("spanish", SGDIntentEngine("spanish"))
+    model.fit(DATASET_PATH)
+
+    saver = NumpySaver()
+    path = saver.publish(model)
+    try:
+        loaded_model = saver.load(path)
+        attached_model = saver.attach(path)
+    finally:
+        saver.unpublish(path)
+
+    vocabulary = model.intent_engine.vectorizer.vocabulary_
+    loaded_vocabulary = loaded_model.intent_engine.vectorizer.vocabulary_
+    shared_vocabulary = attached_model.intent_engine.vectorizer.vocabulary_
+    assert isinstance(loaded_vocabulary, dict)
+    assert isinstance(shared_vocabulary, SharedIndex)
+    assert isinstance(shared_vocabulary.key_array, np.memmap)
+    assert dict(shared_vocabulary) == loaded_vocabulary == vocabulary
+    assert "palabra desconocida" * 10 not in shared_vocabulary
+    assert shared_vocabulary.get(3) is None
+
+    texts = ["Hola como te encuentras?", "Quiero aprender sobre lo último de python"]
+    assert attached_model.multiple_predict(texts) == model.multiple_predict(texts)
+
+    # The shared arrays are saved again as they are
+    saver.save(attached_model, NUMPY_PATH)
+    try:
+        assert saver.load(NUMPY_PATH).intent_engine.vectorizer.vocabulary_ == vocabulary
+    finally:
+        shutil.rmtree(NUMPY_PATH)
+
+    strings = SharedStrings(np.array(["a", "bc", "d"]))
+    assert list(strings) == ["a", "bc", "d"] and strings[1:] == ["bc", "d"]
+    assert "bc" in strings and "b" not in strings and 1 not in strings
+
+
+def get_private_memory() -> int:
+    """
+    Get the memory the process wrote, the pages shared with the parent
+    process are not counted until they are copied.
+    """
+    with open("/proc/self/smaps_rollup", encoding="utf-8") as file:
+        status = file.read()
+    return int(re.search(r"Private_Dirty:\s+(\d+)", status).group(1)) * 1024
+
+
+def attach_worker(path, queue):
+    """
+    Attach to a published model and predict, in a worker process.
+    """
+    before = get_private_memory()
+    model = NumpySaver().attach(path)
+    model.multiple_predict(["Hola como te encuentras?", "visual studio"], 0.5)
+    queue.put(get_private_memory() - before)
+
+
+@pytest.mark.skipif(
+    not os.path.exists("/proc/self/smaps_rollup")
+    or "fork" not in multiprocessing.get_all_start_methods(),
+    reason="Needs /proc and fork",
+)
+def test_publish_shared_memory():
+    """
+    Test the workers attached to a published model share its arrays and its
+    vocabulary, only the state of every process is private.
+    """
+    with open(DATASET_PATH, encoding="utf-8") as file:
+        dataset = json.load(file)
+    words = {
+        word
+        for examples in dataset["intents"].values()
+        for example in examples
+        for word in example.lower().split()
+    }
+    words = sorted(words) + [f"word{index}" for index in range(200000)]
+
+    # A vocabulary heavy model, its keys are bigger than its vectors
+    glove_vectors = KeyedVectors(8)
+    generator = np.random.default_rng(42)
+    glove_vectors.add_vectors(
+        words, generator.normal(size=(len(words), 8)).astype(np.float32)
+    )
+
+    model = ModelIntentClassifier(
+        "spanish",
+        WorldVectorIntentEngine("spanish", glove_vectors),
+        GloveFeatureExtractor(glove_vectors),
+    )
+    model.fit(DATASET_PATH)
+    # Import the modules used to predict before forking, like a server would
+    model.multiple_predict(["Hola como te encuentras?"], 0.5)
+
+    saver = NumpySaver()
+    path = saver.publish(model)
+    shared = sum(
+        os.path.getsize(os.path.join(path, name))
+        for name in os.listdir(path)
+        if name.endswith(".npy")
+    )
+
+    # The collections do not touch the pages of the parent objects
+    gc.freeze()
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    workers = [
+        context.Process(target=attach_worker, args=(path, queue)) for _ in range(3)
+    ]
+    try:
+        for worker in workers:
+            worker.start()
+        growths = [queue.get(timeout=120) for _ in workers]
+        for worker in workers:
+            worker.join()
+    finally:
+        gc.unfreeze()
+        saver.unpublish(path)
+
+    # Every process builds the objects and the small attributes of the
+    # model, about 4 MB, the 200000 keys would be more than 20 MB more
+    assert shared > 20 * 2**20
+    assert all(growth < 6 * 2**20 for growth in growths)
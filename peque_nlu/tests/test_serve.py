@@ -0,0 +1,246 @@
+"""
+Test the HTTP inference server module.
+"""
+import asyncio
+import http.client
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from peque_nlu.feature_extractors import GloveFeatureExtractor
+from peque_nlu.intent_classifiers import ModelIntentClassifier
+from peque_nlu.intent_engines import SGDIntentEngine, WorldVectorIntentEngine
+from peque_nlu.metrics import INSTRUMENTATION
+from peque_nlu.serve import InferenceServer
+from peque_nlu.tests.test_feature_extractor import get_random_vectors
+
+DATASET_PATH = "intents_example.json"
+SMALL_TALK_QUERY = "Hola como te encuentras?"
+
+
+def run_server(inference_server, address, stop):
+    """
+    Run the server on a free local port until stop is set.
+    """
+
+    async def serve():
+        server = await inference_server.start("127.0.0.1", 0)
+        address.extend(server.sockets[0].getsockname()[:2])
+        await asyncio.get_running_loop().run_in_executor(None, stop.wait)
+        server.close()
+        await server.wait_closed()
+        inference_server.close()
+
+    asyncio.run(serve())
+
+
+def request(address, method, path, body=None) -> tuple:
+    """
+    Send a request to the server, get the status and the json or text
+    response.
+    """
+    connection = http.client.HTTPConnection(*address, timeout=10)
+    try:
+        connection.request(
+            method, path, body=None if body is None else json.dumps(body)
+        )
+        response = connection.getresponse()
+        if response.getheader("Content-Type").startswith("text/plain"):
+            return response.status, response.read().decode("utf-8")
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def test_inference_server():
+    """
+    Test the endpoints of the server, before and after loading the model.
+    """
+    model = ModelIntentClassifier("spanish", SGDIntentEngine("spanish"))
+    model.fit(DATASET_PATH)
+
+    loaded = threading.Event()
+
+    def loader():
+        loaded.wait()
+        return model
+
+    inference_server = InferenceServer(loader, window=0.05)
+    address = []
+    stop = threading.Event()
+    thread = threading.Thread(target=run_server, args=(inference_server, address, stop))
+    thread.start()
+
+    try:
+        while not address:
+            stop.wait(0.01)
+
+        assert request(address, "GET", "/health")[0] == 200
+        assert request(address, "GET", "/ready") == (
+            503,
+            {"ready": False, "error": None},
+        )
+        assert request(address, "POST", "/predict", {"text": "hola"})[0] == 503
+
+        loaded.set()
+        while request(address, "GET", "/ready")[0] != 200:
+            stop.wait(0.01)
+
+        status, prediction = request(
+            address, "POST", "/predict", {"text": SMALL_TALK_QUERY}
+        )
+        assert status == 200
+        assert prediction == model.predict(SMALL_TALK_QUERY)
+
+        texts = [SMALL_TALK_QUERY, "Quiero aprender sobre lo último de python"]
+        status, response = request(address, "POST", "/predict/batch", {"texts": texts})
+        assert status == 200
+        assert response["predictions"] == model.multiple_predict(texts)
+
+        # The concurrent requests share the batches
+        with ThreadPoolExecutor(8) as executor:
+            responses = list(
+                executor.map(
+                    lambda _: request(address, "POST", "/predict", {"text": "hola"}),
+                    range(8),
+                )
+            )
+        assert all(status == 200 for status, _ in responses)
+
+        assert request(address, "POST", "/predict", {"texts": "hola"})[0] == 400
+        assert request(address, "GET", "/predict")[0] == 405
+        assert request(address, "GET", "/unknown")[0] == 404
+        assert request(address, "GET", "/metrics")[0] == 404
+
+        inference_server.max_concurrency = 0
+        assert request(address, "POST", "/predict", {"text": "hola"})[0] == 503
+
+        status, stats = request(address, "GET", "/stats")
+        assert status == 200
+        assert stats["rejected"] == 1
+        assert stats["batches"] < 10
+        assert stats["endpoints"]["/predict"]["count"] == 10
+        assert stats["endpoints"]["/predict"]["p99_ms"] > 0
+    finally:
+        loaded.set()
+        stop.set()
+        thread.join()
+
+
+def test_inference_server_limits():
+    """
+    Test the texts of the batches count against the concurrency, and the
+    thresholds that are not numbers are bad requests.
+    """
+    model = ModelIntentClassifier("spanish", SGDIntentEngine("spanish"))
+    model.fit(DATASET_PATH)
+
+    inference_server = InferenceServer(lambda: model, max_concurrency=2)
+    address = []
+    stop = threading.Event()
+    thread = threading.Thread(target=run_server, args=(inference_server, address, stop))
+    thread.start()
+
+    try:
+        while not address or request(address, "GET", "/ready")[0] != 200:
+            stop.wait(0.01)
+
+        body = {"texts": ["hola"] * 3}
+        assert request(address, "POST", "/predict/batch", body)[0] == 413
+        inference_server.in_flight += 1
+        body = {"texts": ["hola"] * 2}
+        assert request(address, "POST", "/predict/batch", body)[0] == 503
+        inference_server.in_flight -= 1
+        assert request(address, "POST", "/predict/batch", body)[0] == 200
+
+        for threshold in ([0.2], "high", {"greet": None}, True):
+            body = {"text": "hola", "threshold": threshold}
+            assert request(address, "POST", "/predict", body)[0] == 400
+        body = {"texts": ["hola"], "threshold": [0.2]}
+        assert request(address, "POST", "/predict/batch", body)[0] == 400
+        body = {"texts": ["hola"], "threshold": {"greet": 0.5}}
+        assert request(address, "POST", "/predict/batch", body)[0] == 200
+
+        stats = request(address, "GET", "/stats")[1]
+        assert stats["rejected"] == 1
+        assert stats["in_flight"] == 0
+    finally:
+        stop.set()
+        thread.join()
+
+
+def test_inference_server_metrics():
+    """
+    Test the stage timings of the server with metrics.
+    """
+    model = ModelIntentClassifier("spanish", SGDIntentEngine("spanish"))
+    model.fit(DATASET_PATH)
+
+    inference_server = InferenceServer(lambda: model, metrics=True)
+    address = []
+    stop = threading.Event()
+    thread = threading.Thread(target=run_server, args=(inference_server, address, stop))
+    thread.start()
+
+    try:
+        while not address or request(address, "GET", "/ready")[0] != 200:
+            stop.wait(0.01)
+
+        assert request(address, "POST", "/predict", {"text": "hola"})[0] == 200
+
+        status, metrics = request(address, "GET", "/metrics")
+        assert status == 200
+        assert (
+            'peque_nlu_stage_seconds_count{stage="engine.predict_proba"} 1' in metrics
+        )
+        assert 'peque_nlu_stage_items_total{stage="classifier.engine"} 1' in metrics
+    finally:
+        stop.set()
+        thread.join()
+
+    assert inference_server.registry not in INSTRUMENTATION.sinks
+
+
+def test_inference_server_numpy_features():
+    """
+    Test the float32 similarities of the glove features are encoded, and
+    the errors of a prediction are answered with an internal server error.
+    """
+    glove_vectors = get_random_vectors()
+    feature_extractor = GloveFeatureExtractor(glove_vectors)
+    feature_extractor.stopwords = []
+    feature_extractor.entities = {"first": ["worda", "wordb"], "second": ["wordc"]}
+    model = ModelIntentClassifier(
+        "spanish",
+        WorldVectorIntentEngine("spanish", glove_vectors),
+        feature_extractor,
+    )
+    model.intent_engine.fit(["worda wordb", "wordc wordd"], ["ab", "cd"])
+
+    inference_server = InferenceServer(lambda: model)
+    address = []
+    stop = threading.Event()
+    thread = threading.Thread(target=run_server, args=(inference_server, address, stop))
+    thread.start()
+
+    try:
+        while not address or request(address, "GET", "/ready")[0] != 200:
+            stop.wait(0.01)
+
+        status, prediction = request(address, "POST", "/predict", {"text": "worda"})
+        assert status == 200
+        features = {f["entity"]: f["similarities"] for f in prediction["features"]}
+        assert features["first"] == 1
+        assert isinstance(features["second"], float)
+
+        def get_features(text, threshold):
+            raise RuntimeError(f"Can not get the features of {text} at {threshold}")
+
+        feature_extractor.get_features = get_features
+        status, response = request(address, "POST", "/predict", {"text": "wordb"})
+        assert status == 500
+        assert "error" in response
+        assert request(address, "GET", "/health")[0] == 200
+    finally:
+        stop.set()
+        thread.join()
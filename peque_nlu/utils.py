@@ -2,10 +2,310 @@
 Utils module.
 """
 
+import hashlib
+import importlib
 import json
-import pandas as pd
-import gensim.downloader as gd
-from gensim.models.keyedvectors import KeyedVectors
+import os
+import re
+import threading
+import time
+import unicodedata
+import weakref
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from peque_nlu.quantization import QuantizedVectors
+
+if TYPE_CHECKING:
+    from gensim.models.keyedvectors import KeyedVectors
+
+
+class LazyModule:
+    """
+    The LazyModule class.
+
+    This class is a module that is imported the first time one of its
+    attributes is used, so importing peque_nlu stays fast and the heavy
+    dependencies are only imported by the code paths that need them.
+    """
+
+    def __init__(self, name):
+        """
+        Initialize the LazyModule.
+
+        :param name: The name of the module.
+        :type name: str.
+        """
+
+        self.name = name
+        self.module = None
+
+    def __getattr__(self, attribute) -> object:
+        if self.module is None:
+            self.module = importlib.import_module(self.name)
+        return getattr(self.module, attribute)
+
+
+pd = LazyModule("pandas")
+gd = LazyModule("gensim.downloader")
+keyedvectors = LazyModule("gensim.models.keyedvectors")
+
+
+WHITESPACE_REGEX = re.compile(r"[ \t\n\r]*")
+NUMBER_CHARS = "0123456789.eE+-"
+JSONL_EXTENSIONS = (".jsonl", ".ndjson")
+
+
+class JsonStream:
+    """
+    The JsonStream class.
+
+    This class reads a json document from a file incrementally, so the big
+    containers can be iterated one member at a time in bounded memory.
+    """
+
+    def __init__(self, file, chunk_size=1 << 16):
+        """
+        Initialize the JsonStream.
+
+        :param file: The text file to read.
+        :type file: file.
+        :param chunk_size: The number of chars to read at a time.
+        :type chunk_size: int.
+        """
+
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        """
+        Read the next chunk, dropping the chars already consumed.
+
+        :return: False if the file has ended.
+        :rtype: bool.
+        """
+
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+
+        self.buffer = self.buffer[self.position :] + chunk
+        self.position = 0
+        return True
+
+    def peek(self) -> str:
+        """
+        Get the next char that is not whitespace, without consuming it.
+
+        :return: The char.
+        :rtype: str.
+        """
+
+        while True:
+            if self.position < len(self.buffer):
+                char = self.buffer[self.position]
+                if char not in " \t\n\r":
+                    return char
+                self.position = WHITESPACE_REGEX.match(self.buffer, self.position).end()
+                if self.position < len(self.buffer):
+                    return self.buffer[self.position]
+            if not self._fill():
+                raise ValueError("Unexpected end of the json document")
+
+    def expect(self, char):
+        """
+        Consume the next char, that must be the expected one.
+
+        :param char: The expected char.
+        :type char: str.
+        """
+
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} in the json document")
+        self.position += 1
+
+    def value(self) -> object:
+        """
+        Decode the next value.
+
+        :return: The value.
+        :rtype: object.
+        """
+
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+                # A number at the end of the buffer could continue in the file
+                if self.eof or (
+                    end < len(self.buffer) and self.buffer[end] not in NUMBER_CHARS
+                ):
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    def members(self):
+        """
+        Iterate the keys of the next object, the value of every key
+        must be consumed before getting the next key.
+
+        :return: A generator of the keys.
+        :rtype: generator.
+        """
+
+        self.expect("{")
+        if self.peek() == "}":
+            self.position += 1
+            return
+
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+
+            char = self.peek()
+            self.position += 1
+            if char == "}":
+                return
+            if char != ",":
+                raise ValueError("Expected ',' or '}' in the json document")
+
+    def elements(self):
+        """
+        Iterate the next array, every element must be consumed
+        before getting the next one.
+
+        :return: A generator of the element indices.
+        :rtype: generator.
+        """
+
+        self.expect("[")
+        if self.peek() == "]":
+            self.position += 1
+            return
+
+        index = 0
+        while True:
+            yield index
+            index += 1
+
+            char = self.peek()
+            self.position += 1
+            if char == "]":
+                return
+            if char != ",":
+                raise ValueError("Expected ',' or ']' in the json document")
+
+    def values(self):
+        """
+        Iterate the decoded elements of the next array.
+
+        :return: A generator of the elements.
+        :rtype: generator.
+        """
+
+        self.expect("[")
+        if self.peek() == "]":
+            self.position += 1
+            return
+
+        while True:
+            yield self.value()
+
+            char = self.peek()
+            self.position += 1
+            if char == "]":
+                return
+            if char != ",":
+                raise ValueError("Expected ',' or ']' in the json document")
+
+    def skip(self):
+        """
+        Consume the next value without decoding its containers.
+        """
+
+        char = self.peek()
+        if char == "{":
+            for _ in self.members():
+                self.skip()
+        elif char == "[":
+            for _ in self.elements():
+                self.skip()
+        else:
+            self.value()
+
+
+def iter_dataset(dataset_path):
+    """
+    Iterate the examples of a dataset in bounded memory.
+
+    The dataset can be a json file with the "intents" object, or a jsonl file
+    with a {"text": ..., "intent": ...} object per line.
+
+    :param dataset_path: The path of the dataset.
+    :type dataset_path: str.
+    :return: A generator of (text, intent) tuples.
+    :rtype: generator.
+    """
+
+    with open(dataset_path, encoding="utf-8") as file:
+        if dataset_path.endswith(JSONL_EXTENSIONS):
+            for line in file:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if "text" in record:
+                    yield record["text"], record["intent"]
+            return
+
+        stream = JsonStream(file)
+        for key in stream.members():
+            if key != "intents":
+                stream.skip()
+                continue
+
+            for intent in stream.members():
+                for text in stream.values():
+                    yield text, intent
+
+
+def load_entities(dataset_path) -> dict:
+    """
+    Load the entities of a dataset, without decoding the intents.
+
+    The jsonl files can have lines with an {"entities": ...} object.
+
+    :param dataset_path: The path of the dataset.
+    :type dataset_path: str.
+    :return: The entities.
+    :rtype: dict.
+    """
+
+    entities = {}
+    with open(dataset_path, encoding="utf-8") as file:
+        if dataset_path.endswith(JSONL_EXTENSIONS):
+            for line in file:
+                if line.strip():
+                    entities.update(json.loads(line).get("entities", {}))
+            return entities
+
+        stream = JsonStream(file)
+        for key in stream.members():
+            if key == "entities":
+                entities.update(stream.value())
+            else:
+                stream.skip()
+    return entities
 
 
 class IntentUtils:
@@ -13,9 +313,24 @@ class IntentUtils:
     The IntentUtils class.
 
     This class is to centralize the intent utils.
+    The json dataset is cached by path and modification time.
     """
 
     json_dataset = None
+    json_dataset_key = None
+
+    @staticmethod
+    def _get_dataset_key(dataset_path) -> tuple:
+        """
+        Get the cache key of a dataset.
+
+        :param dataset_path: The path of the dataset.
+        :type dataset_path: str.
+        :return: The absolute path and the modification time.
+        :rtype: tuple.
+        """
+
+        return os.path.abspath(dataset_path), os.stat(dataset_path).st_mtime_ns
 
     def _load_json_dataset(self, dataset_path) -> dict:
         """
@@ -27,12 +342,19 @@ class IntentUtils:
         :rtype: dict.
         """
 
-        # if property dataset exists load it
-        if hasattr(self, "json_dataset") and self.json_dataset is not None:
+        key = self._get_dataset_key(dataset_path)
+        if self.json_dataset is not None and self.json_dataset_key == key:
             return self.json_dataset
 
-        with open(dataset_path, encoding="utf-8") as file:
-            self.json_dataset = json.load(file)
+        intents = {}
+        for text, intent in iter_dataset(dataset_path):
+            intents.setdefault(intent, []).append(text)
+
+        self.json_dataset = {
+            "intents": intents,
+            "entities": load_entities(dataset_path),
+        }
+        self.json_dataset_key = key
         return self.json_dataset
 
     def _build_dataset(self, dataset) -> tuple:
@@ -70,6 +392,26 @@ class IntentUtils:
         dataframe, categories = self._build_dataset(dataset)
         return dataframe, categories
 
+    def iter_dataset(self, dataset_path):
+        """
+        Iterate the examples of the dataset in bounded memory,
+        from the cache if the dataset is already loaded.
+
+        :param dataset_path: The path of the dataset.
+        :type dataset_path: str.
+        :return: A generator of (text, intent) tuples.
+        :rtype: generator.
+        """
+
+        key = self._get_dataset_key(dataset_path)
+        if self.json_dataset is not None and self.json_dataset_key == key:
+            for intent, examples in self.json_dataset["intents"].items():
+                for example in examples:
+                    yield example, intent
+            return
+
+        yield from iter_dataset(dataset_path)
+
     def get_entities(self, dataset_path):
         """
         Get the entities from the dataset.
@@ -80,11 +422,177 @@ class IntentUtils:
         :rtype: list.
         """
 
-        json_dataset = self._load_json_dataset(dataset_path)
-        return json_dataset["entities"]
+        key = self._get_dataset_key(dataset_path)
+        if self.json_dataset is not None and self.json_dataset_key == key:
+            return self.json_dataset["entities"]
+        return load_entities(dataset_path)
+
+
+class LRUCache:
+    """
+    The LRUCache class.
+
+    This class is a bounded mapping that evicts the least recently used
+    item when it is full, and keeps the hit and miss statistics.
+    The items can expire after a time to live, and it is thread safe.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        """
+        Initialize the LRUCache.
+
+        :param maxsize: The maximum number of items.
+        :type maxsize: int.
+        :param ttl: The seconds an item lives, None to never expire.
+        :type ttl: float.
+        """
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state["lock"]
+        if self.ttl is not None:
+            # The expiration times are only valid in this process
+            state["data"] = OrderedDict()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None) -> object:
+        """
+        Get an item and mark it as recently used.
+
+        :param key: The key of the item.
+        :type key: object.
+        :param default: The value to return if the key is missing.
+        :type default: object.
+        :return: The value of the item.
+        :rtype: object.
+        """
+
+        with self.lock:
+            try:
+                value, expiration = self.data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            if expiration is not None and expiration < time.monotonic():
+                del self.data[key]
+                self.misses += 1
+                return default
+
+            self.data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        Put an item, evicting the least recently used one if the cache is full.
+
+        :param key: The key of the item.
+        :type key: object.
+        :param value: The value of the item.
+        :type value: object.
+        """
+
+        expiration = None
+        if self.ttl is not None:
+            expiration = time.monotonic() + self.ttl
+
+        with self.lock:
+            self.data[key] = (value, expiration)
+            self.data.move_to_end(key)
+            if len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        """
+        Remove all the items, the statistics are kept.
+        """
+
+        with self.lock:
+            self.data.clear()
+
+    def stats(self) -> dict:
+        """
+        Get the cache statistics.
+
+        :return: The size, maxsize, hits, misses and hit rate.
+        :rtype: dict.
+
+        example: stats() ->
+            {"size": 2, "maxsize": 1024, "hits": 3, "misses": 2, "hit_rate": 0.6}
+        """
+
+        with self.lock:
+            requests = self.hits + self.misses
+            return {
+                "size": len(self.data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / requests if requests else 0.0,
+            }
+
+
+class NormalizedText(str):
+    """
+    The NormalizedText class.
+
+    This class is the lowercased text, with the normalized representations
+    shared by the intent engine and the feature extractor,
+    so every text is normalized only once.
+
+    :ivar text: The original text.
+    :ivar folded: The lowercased text without accents.
+    :ivar words: The words of the feature extractor `preprocess_input`.
+    :ivar stems: The stems of the intent engine `tokenize`.
+    """
+
+    text = None
+    folded = None
+    words = None
+    stems = None
+
+    def lower(self) -> "NormalizedText":
+        """
+        The text is already lowercased, so the representations are kept.
+
+        :return: The same text.
+        :rtype: NormalizedText.
+        """
+        return self
+
+
+def strip_accents(text) -> str:
+    """
+    Strip accents from input String.
+
+    :param text: The input string.
+    :type text: str.
+    :return: The processed string.
+    :rtype: str.
+
+    example: strip_accents("àéêöhello") -> "aeeohello"
+    """
+
+    text = unicodedata.normalize("NFD", text).encode("ascii", "ignore").decode("utf-8")
+    return str(text)
 
 
-def glove_load(gensim_model) -> KeyedVectors:
+def glove_load(gensim_model) -> "KeyedVectors":
     """
     Load the glove vectors from the gensim model.
 
@@ -97,7 +605,192 @@ def glove_load(gensim_model) -> KeyedVectors:
     if isinstance(gensim_model, str):
         return gd.load(gensim_model)
 
-    if isinstance(gensim_model, KeyedVectors):
+    if isinstance(gensim_model, keyedvectors.KeyedVectors):
         return gensim_model
 
     raise ValueError("gensim_model must be a model_name (str) or a KeyedVectors object")
+
+
+class VectorRegistry:
+    """
+    The VectorRegistry class.
+
+    This class keeps a single copy of every word vectors model in the process,
+    shared by all the WordVectors handles with the same key. The models are
+    reference counted and dropped when the last handle is released.
+    """
+
+    def __init__(self):
+        """
+        Initialize the VectorRegistry.
+        """
+
+        self.entries = {}
+        self.fingerprints = weakref.WeakKeyDictionary()
+        self.lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key) -> bool:
+        return key in self.entries
+
+    def get_key(self, gensim_model) -> str:
+        """
+        Get the key that identifies a gensim model.
+
+        :param gensim_model: The gensim model.
+            It can be a model name (str) or a KeyedVectors object.
+        :type gensim_model: str or KeyedVectors.
+        :return: The key, the name of the model or a hash of the vectors.
+        :rtype: str.
+        """
+
+        if isinstance(gensim_model, str):
+            return f"gensim:{gensim_model}"
+
+        if not isinstance(gensim_model, keyedvectors.KeyedVectors):
+            raise ValueError(
+                "gensim_model must be a model_name (str) or a KeyedVectors object"
+            )
+
+        with self.lock:
+            if gensim_model not in self.fingerprints:
+                digest = hashlib.sha1()
+                digest.update("\n".join(map(str, gensim_model.index_to_key)).encode())
+                digest.update(np.ascontiguousarray(gensim_model.vectors).data)
+                self.fingerprints[gensim_model] = f"vectors:{digest.hexdigest()}"
+            return self.fingerprints[gensim_model]
+
+    def acquire(self, key, load) -> "KeyedVectors":
+        """
+        Get the vectors of a key, loading them if they are not registered.
+
+        :param key: The key of the vectors.
+        :type key: str.
+        :param load: The function to load the vectors.
+        :type load: callable.
+        :return: The shared vectors.
+        :rtype: KeyedVectors.
+        """
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = [load(), 0]
+                self.fingerprints[entry[0]] = key
+            entry[1] += 1
+            return entry[0]
+
+    def release(self, key):
+        """
+        Release a reference to the vectors of a key.
+
+        :param key: The key of the vectors.
+        :type key: str.
+        """
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return
+
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self.entries[key]
+
+
+VECTOR_REGISTRY = VectorRegistry()
+
+
+class WordVectors:
+    """
+    The WordVectors class.
+
+    This class is a handle to the word vectors in the VECTOR_REGISTRY,
+    the components that use the same model share a single copy.
+    When saved the handle stores its key and the vectors, so a saver stores
+    shared vectors once, and when loaded it links to the registered copy.
+    """
+
+    key = None
+    vectors = None
+
+    def __init__(self, gensim_model):
+        """
+        Initialize the WordVectors.
+
+        :param gensim_model: The gensim model to use.
+            It can be a model name (str) or a KeyedVectors object.
+        :type gensim_model: str or KeyedVectors.
+        """
+
+        self._link(
+            VECTOR_REGISTRY.get_key(gensim_model), lambda: glove_load(gensim_model)
+        )
+
+    def __getstate__(self) -> dict:
+        return {"key": self.key, "vectors": self.vectors}
+
+    def __setstate__(self, state):
+        self._link(state["key"], lambda: state["vectors"])
+
+    def _link(self, key, load):
+        """
+        Link the handle to the registered vectors of the key.
+
+        :param key: The key of the vectors.
+        :type key: str.
+        :param load: The function to load the vectors.
+        :type load: callable.
+        """
+
+        self.key = key
+        self.vectors = VECTOR_REGISTRY.acquire(key, load)
+        weakref.finalize(self, VECTOR_REGISTRY.release, key)
+
+    def quantize(self, dtype="int8") -> "WordVectors":
+        """
+        Get a handle to the quantized vectors, they are registered with
+        their own key, so the components that quantize the same vectors
+        share them too.
+
+        :param dtype: The reduced precision, "float16" or "int8".
+        :type dtype: str.
+        :return: The handle to the quantized vectors.
+        :rtype: WordVectors.
+        """
+
+        if self.key.endswith(f":{dtype}"):
+            return self
+
+        quantized = WordVectors.__new__(WordVectors)
+        quantized._link(  # pylint: disable=protected-access
+            f"{self.key}:{dtype}", lambda: QuantizedVectors(self.vectors, dtype)
+        )
+        return quantized
+
+
+def iter_batches(items, batch_size):
+    """
+    Group the items in lists of batch_size items, the last one can be shorter.
+
+    :param items: The items.
+    :type items: iterable.
+    :param batch_size: The number of items of every batch.
+    :type batch_size: int.
+    :return: A generator of the batches.
+    :rtype: generator.
+
+    example: iter_batches(range(5), 2) -> [0, 1], [2, 3], [4]
+    """
+
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch